@@ -3,11 +3,39 @@ import os
 import webbrowser
 import subprocess
 import platform
+import shutil
 import time
+import threading
+import json
+import tempfile
+import hashlib
+import bz2
+import io
+import re
+import random
+import math
+import functools
+import socket
+import errno
+import mmap
+import struct
+import datetime
+import select
+import collections
+import contextlib
+import bisect
+import heapq
+import gzip
+import itertools
+from array import array
+import urllib.parse
 import requests 
 import pyodbc
 import qtawesome as qta 
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
 from assets.apihub_ui import Ui_GerenciadorServicos
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.QtWidgets import (QDialog, QLineEdit, QDialogButtonBox, QLabel, QGridLayout, QMessageBox, QListWidget, QListWidgetItem, QPushButton) # ADICIONADO QListWidget, QPushButton
@@ -15,6 +43,11 @@ from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtCore import QTranslator, QLocale, QLibraryInfo
 
+try:
+    import zstandard  # opcional: compressão zstd dos logs rotacionados
+except ImportError:
+    zstandard = None
+
 
 
 
@@ -24,10 +57,111 @@ class Config:
     BASE_DIR_INFARMA = r"C:\INFARMA\APIHUB"
     LOG_PATH_API = os.path.join(BASE_DIR_INFARMA, "logs", "app.log")
     URL_DASHBOARD = "http://127.0.0.1:3334/dashboard/"
+
+    # Monitor de status em segundo plano (intervalos em milissegundos)
+    STATUS_POLL_INTERVAL_MS = 5000
+    STATUS_POLL_MAX_BACKOFF_MS = 60000
+
+    # Backend de serviços: "scm" (Windows/NSSM), "systemd" ou "fake". Vazio = detectar pela plataforma
+    SERVICE_BACKEND = os.getenv("GESTOR_SERVICE_BACKEND", "")
+
+    # Prazos (em segundos) para os serviços atingirem o estado pedido
+    SERVICE_START_TIMEOUT = 30
+    SERVICE_STOP_TIMEOUT = 30
     
 
     REPO_FULL_NAME = "WeldercrisRibeiro/infarma-apihub" 
     TARGET_FILE_NAME = "vmd-api-hub.exe"
+
+    # Camada HTTP: timeouts (conexão, leitura) em segundos, novas tentativas e backoff
+    HTTP_TIMEOUT = (5, 30)
+    HTTP_RETRIES = 3
+    HTTP_BACKOFF_BASE = 0.5
+    HTTP_BACKOFF_MAX = 8
+    HTTP_SLOW_REQUEST_SECONDS = 3
+
+    # Token opcional do GitHub (aumenta o limite de 60 para 5000 requisições/hora)
+    GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+    # Tempo (em segundos) em que a lista de releases em cache é usada sem consultar o GitHub
+    RELEASES_CACHE_TTL = 300
+    # Releases por página na listagem (as páginas seguintes são carregadas ao rolar a lista)
+    RELEASES_PER_PAGE = 20
+    # Tentativas de retomar (HTTP Range) um download interrompido
+    DOWNLOAD_MAX_RETRIES = 5
+    # Conexões paralelas no download segmentado (1 = uma única conexão)
+    DOWNLOAD_CONNECTIONS = 4
+    # Tamanho mínimo de cada segmento (bytes)
+    DOWNLOAD_SEGMENT_MIN_SIZE = 1024 * 1024
+    # A cada quantos bytes por segmento o progresso é gravado (após fsync) no .part.json
+    DOWNLOAD_CHECKPOINT_BYTES = 1024 * 1024
+    # Frequência máxima das atualizações de progresso na tela
+    PROGRESS_RATE_HZ = 10
+    # Memória máxima (bytes) para blocos fora de ordem aguardando o cálculo do checksum
+    HASH_BUFFER_LIMIT = 32 * 1024 * 1024
+
+    # Armazém local de versões baixadas (rollback sem rede)
+    ARTIFACTS_DIR = os.path.join(BASE_DIR_INFARMA, "artifacts")
+    ARTIFACTS_MAX_COUNT = 5
+    ARTIFACTS_MAX_BYTES = 500 * 1024 * 1024
+    # Prazo (em segundos) para a API responder depois de uma atualização
+    READINESS_TIMEOUT = 60
+
+    # Banco de dados: porta padrão do SQL Server, prazo da sondagem TCP antes do ODBC,
+    # validade (s) do cache de DNS e timeout de login do driver
+    DB_DEFAULT_PORT = 1433
+    DB_PROBE_TIMEOUT = 2
+    DB_DNS_CACHE_TTL = 300
+    DB_LOGIN_TIMEOUT = 5
+    # Validade (s) de uma validação bem-sucedida para os mesmos dados de conexão e códigos
+    DB_VALIDATION_CACHE_TTL = 120
+
+    # Índice de códigos para autocompletar no editor do .env: tabela -> (coluna do código, coluna da descrição)
+    CODE_INDEX_TABLES = {
+        "VENDE": ("COD_VENDED", "NOM_VENDED"),
+        "PRODU": ("COD_PRODUT", "DES_PRODUT"),
+        "FPGCB": ("COD_FORPAG", "DES_FORPAG"),
+    }
+    # Linhas por lote (fetchmany), validade (s) do índice salvo em disco e máximo de sugestões
+    CODE_INDEX_BATCH = 5000
+    CODE_INDEX_TTL = 24 * 3600
+    CODE_INDEX_MAX_SUGGESTIONS = 50
+
+    # Visualizador de logs: linhas do fim exibidas ao abrir (e a cada rolagem ao topo) e intervalo do modo seguir
+    LOG_VIEWER_TAIL_LINES = 5000
+    LOG_VIEWER_POLL_MS = 1000
+    # Índice persistente dos logs: tamanho de cada bloco (uma entrada por bloco) e limite de linhas por busca
+    LOG_INDEX_BLOCK_SIZE = 64 * 1024
+    LOG_SEARCH_MAX_RESULTS = 100000
+
+    # Retenção dos logs: rotação por tamanho/idade, compressão ("gzip" ou "zstd", se instalado)
+    # e intervalo entre as verificações. Os segmentos mais velhos que TIME_LOG (.env) são apagados.
+    LOG_ROTATE_MAX_BYTES = 50 * 1024 * 1024
+    LOG_ROTATE_MAX_AGE_HOURS = 24
+    LOG_COMPRESSION = "gzip"
+    LOG_RETENTION_INTERVAL_MS = 15 * 60 * 1000
+    # Quanto a rotação espera os visualizadores abertos soltarem o arquivo (no Windows o mmap
+    # impede o truncate) e quantas vezes recopia o que chegou durante a cópia antes de truncar
+    LOG_ROTATE_RELEASE_TIMEOUT_MS = 3000
+    LOG_ROTATE_COPY_ATTEMPTS = 5
+    LOG_TIME_LOG_DEFAULT_HOURS = 168
+
+    # Análise de latência do app.log: horas lidas na primeira passada, máximo de endpoints
+    # distintos, minutos mantidos na série de throughput e intervalo de atualização
+    LATENCY_INITIAL_HOURS = 24
+    LATENCY_MAX_ENDPOINTS = 200
+    LATENCY_MINUTES = 60
+    LATENCY_REFRESH_MS = 5000
+
+    # Vazão de pedidos do Painel (all.log): canais reconhecidos, minutos da janela móvel,
+    # horas lidas na primeira passada, pedidos aguardando processamento (máximo por canal e
+    # horas até expirar), minutos de espera que destacam a fila e intervalo de atualização
+    ORDER_CHANNELS = ("FastApp", "iFood", "NAPP")
+    ORDER_WINDOW_MINUTES = 60
+    ORDER_INITIAL_HOURS = 2
+    ORDER_PENDING_MAX = 10000
+    ORDER_PENDING_EXPIRE_HOURS = 24
+    ORDER_BACKLOG_ALERT_MINUTES = 10
+    ORDER_REFRESH_MS = 5000
    
     @staticmethod
     def get_painel_base_path():
@@ -46,114 +180,1768 @@ class Config:
         base = Config.get_painel_base_path()
         return os.path.join(base, "logs", "all.log") if base else None
 
+    @staticmethod
+    def get_cache_dir():
+        base = os.getenv("LOCALAPPDATA") or tempfile.gettempdir()
+        return os.path.join(base, "gestor-apihub", "cache")
+
+
+
+class HttpClient:
+    """Camada HTTP única do gerenciador (GitHub, downloads e health checks).
+
+    Usa uma requests.Session com pool de conexões keep-alive, timeouts de
+    conexão/leitura padrão, novas tentativas com backoff e jitter apenas em
+    métodos idempotentes e registra a latência de cada requisição.
+    """
+
+    _IDEMPOTENTES = ("GET", "HEAD", "OPTIONS")
+    _STATUS_RETENTAVEIS = (502, 503, 504)
+
+    def __init__(self, pool_size=None, historico=500):
+        self.session = requests.Session()
+        pool_size = pool_size or max(10, Config.DOWNLOAD_CONNECTIONS * 2)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "gestor-apihub"
+        self._lock = threading.Lock()
+        self._latencias = collections.deque(maxlen=historico)
+
+    def request(self, method: str, url: str, retries=None, timeout=None, **kwargs):
+        """Executa a requisição. Falhas de conexão, timeouts e 502/503/504 são repetidos
+        (com backoff exponencial e jitter) somente em GET/HEAD/OPTIONS."""
+        method = method.upper()
+        tentativas = (Config.HTTP_RETRIES if retries is None else retries) if method in self._IDEMPOTENTES else 0
+        timeout = timeout or Config.HTTP_TIMEOUT
+
+        for tentativa in range(tentativas + 1):
+            inicio = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._registrar(method, url, None, inicio)
+                if tentativa >= tentativas:
+                    raise
+            else:
+                self._registrar(method, url, response.status_code, inicio)
+                if response.status_code not in self._STATUS_RETENTAVEIS or tentativa >= tentativas:
+                    return response
+                response.close()
+
+            # "Full jitter": espera aleatória até o teto exponencial
+            time.sleep(random.uniform(0, min(Config.HTTP_BACKOFF_MAX, Config.HTTP_BACKOFF_BASE * 2 ** tentativa)))
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def _registrar(self, method, url, status, inicio):
+        # Para downloads com stream=True, mede o tempo até os cabeçalhos
+        latencia = time.monotonic() - inicio
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            self._latencias.append((host, method, status, latencia))
+        if latencia >= Config.HTTP_SLOW_REQUEST_SECONDS:
+            print(f"Requisição lenta: {method} {host} -> {status or 'falha'} em {latencia:.2f}s")
+
+    def stats(self) -> dict:
+        """Resumo das últimas requisições por host: quantidade, falhas, média e p95 (ms)."""
+        with self._lock:
+            amostras = list(self._latencias)
+        por_host = {}
+        for host, _method, status, latencia in amostras:
+            por_host.setdefault(host, []).append((status, latencia))
+        resumo = {}
+        for host, itens in por_host.items():
+            tempos = sorted(l for _, l in itens)
+            resumo[host] = {
+                "count": len(itens),
+                "errors": sum(1 for s, _ in itens if s is None or s >= 500),
+                "avg_ms": 1000 * sum(tempos) / len(tempos),
+                "p95_ms": 1000 * tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))],
+            }
+        return resumo
+
+    def resumo_texto(self) -> str:
+        """stats() formatado, uma linha por host (vazio se não houve requisições)."""
+        return "\n".join(
+            f"{host}: {s['count']} req, {s['errors']} falha(s), média {s['avg_ms']:.0f} ms, p95 {s['p95_ms']:.0f} ms"
+            for host, s in sorted(self.stats().items())
+        )
 
 
-def get_available_versions(repo_name: str) -> list:
-    """Consulta a API do GitHub para obter as releases e extrair a versão e o link do executável."""
-    API_URL = f"https://api.github.com/repos/{repo_name}/releases"
-    
+# Cliente HTTP compartilhado por todas as chamadas de rede do gerenciador
+http_client = HttpClient()
+
+
+class ReleaseCache:
+    """Cache em disco dos metadados de releases do GitHub (um arquivo por repositório).
+
+    Cada URL consultada guarda o ETag/Last-Modified da última resposta, de modo
+    que as próximas consultas são revalidadas com If-None-Match/If-Modified-Since
+    (um 304 não consome a cota da API). Também registra o bloqueio por limite
+    de requisições, para não insistir enquanto o GitHub pede para esperar.
+    """
+
+    def __init__(self, repo_name: str, cache_dir=None):
+        self.repo_name = repo_name
+        cache_dir = cache_dir or Config.get_cache_dir()
+        self.path = os.path.join(cache_dir, "releases-" + repo_name.replace("/", "__") + ".json")
+        self._dados = self._carregar()
+
+    def _carregar(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if isinstance(dados, dict) and isinstance(dados.get("entries"), dict):
+                return dados
+        except (OSError, ValueError):
+            pass
+        return {"entries": {}, "blocked_until": 0, "failures": 0}
+
+    def salvar(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._dados, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Não foi possível gravar o cache de releases: {e}")
+
+    def get(self, url):
+        return self._dados["entries"].get(url)
+
+    def fetch(self, url: str, force=False, timeout=(5, 15)):
+        """Busca o JSON da URL usando o cache. Retorna (dados, origem) ou (None, origem).
+
+        origem: "cache" (dentro do TTL ou bloqueado), "304", "rede" ou "offline".
+        """
+        entrada = self.get(url)
+        agora = time.time()
+
+        # Dentro do TTL, o cache é usado sem nenhuma requisição
+        if entrada and not force and agora - entrada.get("fetched_at", 0) < Config.RELEASES_CACHE_TTL:
+            return entrada["data"], "cache"
+
+        # O GitHub pediu para esperar (Retry-After / X-RateLimit-Reset)
+        if agora < self._dados.get("blocked_until", 0):
+            return (entrada["data"] if entrada else None), "cache"
+
+        headers = {"Accept": "application/vnd.github+json"}
+        if Config.GITHUB_TOKEN:
+            headers["Authorization"] = f"Bearer {Config.GITHUB_TOKEN}"
+        if entrada:
+            if entrada.get("etag"):
+                headers["If-None-Match"] = entrada["etag"]
+            if entrada.get("last_modified"):
+                headers["If-Modified-Since"] = entrada["last_modified"]
+
+        try:
+            response = http_client.get(url, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Erro ao conectar com o GitHub, usando o cache local: {e}")
+            return (entrada["data"] if entrada else None), "offline"
+
+        if response.status_code == 304 and entrada:
+            entrada["fetched_at"] = agora
+            self._registrar_sucesso()
+            return entrada["data"], "304"
+
+        if response.status_code in (403, 429):
+            self._registrar_limite(response)
+            return (entrada["data"] if entrada else None), "cache"
+
+        response.raise_for_status()
+        dados = response.json()
+        self._dados["entries"][url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "link": response.headers.get("Link"),
+            "fetched_at": agora,
+            "data": dados,
+        }
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            self._registrar_limite(response)
+        self._registrar_sucesso()
+        return dados, "rede"
+
+    def _registrar_sucesso(self):
+        self._dados["failures"] = 0
+        self.salvar()
+
+    def _registrar_limite(self, response):
+        """Calcula até quando não consultar o GitHub, com backoff exponencial sem cabeçalhos."""
+        agora = time.time()
+        falhas = self._dados.get("failures", 0) + 1
+        ate = 0
+        retry_after = response.headers.get("Retry-After")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if retry_after and retry_after.isdigit():
+            ate = agora + int(retry_after)
+        elif response.headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+            ate = int(reset)
+        else:
+            ate = agora + min(60 * 2 ** (falhas - 1), 3600)
+        self._dados["failures"] = falhas
+        self._dados["blocked_until"] = ate
+        print(f"Limite de requisições do GitHub atingido; nova consulta após {time.strftime('%H:%M:%S', time.localtime(ate))}.")
+        self.salvar()
+
+
+_PATCH_ASSET_RE = re.compile(re.escape(Config.TARGET_FILE_NAME) + r"\.from-(.+)\.bsdiff$")
+
+
+def _extrair_versoes(releases_data) -> list:
+    """Extrai a versão e o link do executável de cada release (ignorando drafts)."""
+    versions = []
+
+    # Itera sobre cada release e busca o executável
+    for release in releases_data:
+        version_tag = release.get("tag_name")
+        download_url = None
+        digest = None
+        digest_url = None
+        patches = []
+
+        # As 'assets' são os arquivos anexados à release (seu EXE)
+        for asset in release.get("assets", []):
+            # Assumimos que o nome do asset é o nome do executável
+            if asset.get("name") == Config.TARGET_FILE_NAME:
+                # Usamos 'browser_download_url' para o download direto
+                download_url = asset.get("browser_download_url")
+                # O GitHub publica o digest do asset (ex.: "sha256:...")
+                digest = asset.get("digest")
+            elif asset.get("name") == Config.TARGET_FILE_NAME + ".sha256":
+                # Checksum publicado como arquivo separado (vmd-api-hub.exe.sha256)
+                digest_url = asset.get("browser_download_url")
+            else:
+                # Patches binários: vmd-api-hub.exe.from-<versão ou sha256 da base>.bsdiff
+                m = _PATCH_ASSET_RE.match(asset.get("name") or "")
+                if m:
+                    patches.append({
+                        "base": m.group(1),
+                        "url": asset.get("browser_download_url"),
+                        "size": asset.get("size", 0),
+                    })
+
+        # Ignora drafts e releases sem o executável correto
+        if version_tag and download_url and not release.get("draft"):
+            versions.append({
+                "version": version_tag,
+                "download_url": download_url,
+                "digest": digest,
+                "digest_url": digest_url,
+                "patches": patches,
+            })
+
+    return versions
+
+
+def releases_first_page_url(repo_name: str) -> str:
+    return f"https://api.github.com/repos/{repo_name}/releases?per_page={Config.RELEASES_PER_PAGE}"
+
+
+def fetch_release_page(repo_name: str, url: str, force=False, cache=None):
+    """Busca uma página de releases. Retorna (versões, URL da próxima página ou None, origem)."""
+    cache = cache or ReleaseCache(repo_name)
+    releases_data, origem = cache.fetch(url, force=force)
+    if releases_data is None:
+        return None, None, origem
+
+    # A próxima página vem no cabeçalho Link (rel="next")
+    next_url = None
+    entrada = cache.get(url)
+    if entrada and entrada.get("link"):
+        for link in requests.utils.parse_header_links(entrada["link"]):
+            if link.get("rel") == "next":
+                next_url = link.get("url")
+                break
+    return _extrair_versoes(releases_data), next_url, origem
+
+
+class ServiceBackendError(Exception):
+    """Falha ao executar uma operação no gerenciador de serviços do sistema."""
+
+
+@dataclass
+class ServiceState:
+    """Estado de um serviço gerenciado, retornado pela consulta em lote do backend."""
+    name: str
+    state: str = "NOT_INSTALLED"  # RUNNING, STOPPED, START_PENDING, STOP_PENDING, NOT_INSTALLED, ERROR
+    pid: int = 0
+    exit_code: int = 0
+    start_pending: bool = False
+    stop_pending: bool = False
+
+    @property
+    def status(self) -> str:
+        """Texto exibido na tela para este estado."""
+        return {
+            "RUNNING": "Iniciado",
+            "STOPPED": "Parado",
+            "START_PENDING": "Iniciando...",
+            "STOP_PENDING": "Parando...",
+            "NOT_INSTALLED": "Não instalado",
+        }.get(self.state, "Erro")
+
+
+class ServiceBackend:
+    """Interface comum dos backends de serviço (SCM/NSSM, systemd e memória).
+
+    Todas as operações recebem a lista de serviços e resolvem o lote com o
+    menor número possível de processos.
+    """
+
+    def query(self, names) -> dict:
+        """Retorna {nome: ServiceState} para todos os serviços em uma única consulta."""
+        raise NotImplementedError
+
+    def start(self, names):
+        """Dispara a partida dos serviços, sem esperar que fiquem em execução."""
+        raise NotImplementedError
+
+    def stop(self, names):
+        """Dispara a parada dos serviços, ignorando os que já estão parados."""
+        raise NotImplementedError
+
+    def install(self, services: dict):
+        """Instala os serviços ({nome: caminho do executável}) com início automático."""
+        raise NotImplementedError
+
+    def remove(self, names):
+        """Para e remove os serviços."""
+        raise NotImplementedError
+
+    def wait_for_state(self, names, target, timeout, inicio=None, poll_interval=0.1, max_poll_interval=1.0) -> dict:
+        """Consulta em lote até cada serviço atingir o estado 'target' ou o prazo expirar.
+
+        Retorna {nome: segundos até atingir o estado}, com None para os serviços
+        que não chegaram lá (prazo expirado ou falha na partida).
+        """
+        names = list(names)
+        inicio = time.monotonic() if inicio is None else inicio
+        prazo = inicio + timeout
+        pendentes = list(names)
+        tempos = {}
+        intervalo = poll_interval
+
+        while pendentes:
+            estados = self.query(pendentes)
+            agora = time.monotonic()
+            for nome in list(pendentes):
+                estado = estados[nome]
+                if estado.state == target or (target == "STOPPED" and estado.state == "NOT_INSTALLED"):
+                    tempos[nome] = agora - inicio
+                    pendentes.remove(nome)
+                elif target == "RUNNING" and estado.state in ("STOPPED", "NOT_INSTALLED") \
+                        and (estado.state == "NOT_INSTALLED" or estado.exit_code not in (0, 1077)):
+                    # O serviço voltou a parar com erro: não adianta esperar o prazo
+                    tempos[nome] = None
+                    pendentes.remove(nome)
+            if not pendentes or agora >= prazo:
+                break
+            time.sleep(min(intervalo, prazo - agora))
+            intervalo = min(intervalo * 2, max_poll_interval)
+
+        for nome in pendentes:
+            tempos[nome] = None
+        return {nome: tempos[nome] for nome in names}
+
+    def start_and_wait(self, names, timeout=Config.SERVICE_START_TIMEOUT) -> dict:
+        """Inicia todos os serviços ao mesmo tempo e espera que fiquem em execução.
+
+        Retorna o tempo de partida de cada serviço; levanta ServiceBackendError
+        se algum não iniciar dentro do prazo.
+        """
+        inicio = time.monotonic()
+        self.start(names)
+        tempos = self.wait_for_state(names, "RUNNING", timeout, inicio)
+        falhas = [nome for nome, t in tempos.items() if t is None]
+        if falhas:
+            raise ServiceBackendError(f"Serviço(s) não iniciado(s) em {timeout}s: {', '.join(falhas)}")
+        return tempos
+
+    def stop_and_wait(self, names, timeout=Config.SERVICE_STOP_TIMEOUT) -> dict:
+        """Para todos os serviços ao mesmo tempo e espera que fiquem parados.
+
+        Retorna o tempo de parada de cada serviço (None se o prazo expirou).
+        """
+        inicio = time.monotonic()
+        self.stop(names)
+        return self.wait_for_state(names, "STOPPED", timeout, inicio)
+
+
+def formatar_tempos(tempos: dict) -> str:
+    """Formata os tempos de transição dos serviços para exibição (ex.: 'vmd-api-hub: 1.2s')."""
+    return ", ".join(
+        f"{nome}: {t:.1f}s" if t is not None else f"{nome}: não concluído"
+        for nome, t in tempos.items()
+    )
+
+
+class ScmNssmBackend(ServiceBackend):
+    """Backend Windows: consulta o SCM com um único 'sc queryex' e executa os comandos em lote via cmd."""
+
+    _ESTADOS_SC = {
+        "1": "STOPPED", "2": "START_PENDING", "3": "STOP_PENDING", "4": "RUNNING",
+        "5": "START_PENDING", "6": "STOP_PENDING", "7": "STOPPED",
+    }
+
+    def __init__(self, nssm_path=None):
+        self.nssm_path = nssm_path
+
+    def _run(self, args, **kwargs):
+        return subprocess.run(
+            args, capture_output=True, text=True,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0), **kwargs
+        )
+
+    def _executar_lote(self, opcionais=(), obrigatorios=()):
+        """Executa vários comandos em um único cmd.exe.
+
+        Os comandos opcionais são encadeados com '&' (falhas ignoradas) e os
+        obrigatórios com '&&', de modo que o código de saída reflete o primeiro
+        obrigatório que falhar.
+        """
+        partes = []
+        if opcionais:
+            partes.append(" & ".join(subprocess.list2cmdline(c) for c in opcionais))
+        if obrigatorios:
+            partes.append(" && ".join(subprocess.list2cmdline(c) for c in obrigatorios))
+        if not partes:
+            return
+        script = " & ".join(partes)
+        result = self._run(f'cmd /d /s /c "{script}"')
+        if obrigatorios and result.returncode != 0:
+            detalhes = (result.stdout or "") + (result.stderr or "")
+            raise ServiceBackendError(f"Comando retornou {result.returncode}:\n{detalhes.strip()}")
+
+    def _exigir_nssm(self):
+        if not self.nssm_path or not os.path.exists(self.nssm_path):
+            raise ServiceBackendError(f"nssm.exe não encontrado em {self.nssm_path}")
+
+    def query(self, names) -> dict:
+        estados = {nome: ServiceState(nome) for nome in names}
+        try:
+            result = self._run(["sc", "queryex", "type=", "service", "state=", "all"])
+        except Exception:
+            for estado in estados.values():
+                estado.state = "ERROR"
+            return estados
+
+        atual = None
+        for raw in result.stdout.splitlines():
+            if ":" not in raw:
+                continue
+            chave, valor = raw.split(":", 1)
+            chave, valor = chave.strip().upper(), valor.strip()
+            if chave == "SERVICE_NAME":
+                atual = estados.get(valor)
+                # O nome do serviço no SCM não diferencia maiúsculas
+                if atual is None:
+                    atual = next((e for n, e in estados.items() if n.lower() == valor.lower()), None)
+            elif atual is None:
+                continue
+            elif chave == "STATE":
+                codigo = valor.split()[0] if valor else ""
+                atual.state = self._ESTADOS_SC.get(codigo, "ERROR")
+                atual.start_pending = atual.state == "START_PENDING"
+                atual.stop_pending = atual.state == "STOP_PENDING"
+            elif chave == "WIN32_EXIT_CODE":
+                try:
+                    atual.exit_code = int(valor.split()[0])
+                except (ValueError, IndexError):
+                    pass
+            elif chave == "PID":
+                try:
+                    atual.pid = int(valor.split()[0])
+                except (ValueError, IndexError):
+                    pass
+        return estados
+
+    def start(self, names):
+        # 'sc start' retorna assim que o SCM aceita o pedido, então os serviços
+        # partem em paralelo; falhas (ex.: já iniciado) são tratadas por wait_for_state
+        self._executar_lote(opcionais=[["sc", "start", nome] for nome in names])
+
+    def stop(self, names):
+        # 'sc stop' também é assíncrono e falha se o serviço já estiver parado
+        self._executar_lote(opcionais=[["sc", "stop", nome] for nome in names])
+
+    def install(self, services: dict):
+        self._exigir_nssm()
+        comandos = []
+        for nome, exe_path in services.items():
+            comandos.append([self.nssm_path, "install", nome, exe_path])
+            comandos.append([self.nssm_path, "set", nome, "Start", "SERVICE_AUTO_START"])
+        self._executar_lote(obrigatorios=comandos)
+
+    def remove(self, names):
+        self._exigir_nssm()
+        self._executar_lote(
+            opcionais=[["net", "stop", nome] for nome in names],
+            obrigatorios=[[self.nssm_path, "remove", nome, "confirm"] for nome in names],
+        )
+
+
+class SystemdBackend(ServiceBackend):
+    """Backend Linux: um único 'systemctl show' para todas as unidades."""
+
+    UNIT_DIR = "/etc/systemd/system"
+
+    _ESTADOS_SYSTEMD = {
+        "active": "RUNNING", "reloading": "RUNNING", "inactive": "STOPPED",
+        "failed": "STOPPED", "activating": "START_PENDING", "deactivating": "STOP_PENDING",
+    }
+
+    @staticmethod
+    def _unit(nome):
+        return nome if nome.endswith(".service") else f"{nome}.service"
+
+    def _systemctl(self, *args, check=True):
+        result = subprocess.run(["systemctl", *args], capture_output=True, text=True)
+        if check and result.returncode != 0:
+            raise ServiceBackendError(f"systemctl {' '.join(args)} retornou {result.returncode}:\n{result.stderr.strip()}")
+        return result
+
+    def query(self, names) -> dict:
+        names = list(names)
+        estados = {nome: ServiceState(nome) for nome in names}
+        if not names:
+            return estados
+        try:
+            result = self._systemctl(
+                "show", "--no-pager",
+                "--property=Id,LoadState,ActiveState,MainPID,ExecMainStatus",
+                *[self._unit(n) for n in names], check=False
+            )
+        except Exception:
+            for estado in estados.values():
+                estado.state = "ERROR"
+            return estados
+
+        # A saída traz um bloco por unidade, separados por linha em branco, na ordem pedida
+        blocos = [b for b in result.stdout.strip().split("\n\n") if b.strip()]
+        for nome, bloco in zip(names, blocos):
+            props = dict(l.split("=", 1) for l in bloco.splitlines() if "=" in l)
+            estado = estados[nome]
+            if props.get("LoadState") == "not-found":
+                continue
+            estado.state = self._ESTADOS_SYSTEMD.get(props.get("ActiveState", ""), "ERROR")
+            estado.start_pending = estado.state == "START_PENDING"
+            estado.stop_pending = estado.state == "STOP_PENDING"
+            try:
+                estado.pid = int(props.get("MainPID") or 0)
+                estado.exit_code = int(props.get("ExecMainStatus") or 0)
+            except ValueError:
+                pass
+        return estados
+
+    def start(self, names):
+        self._systemctl("start", "--no-block", *[self._unit(n) for n in names])
+
+    def stop(self, names):
+        self._systemctl("stop", "--no-block", *[self._unit(n) for n in names], check=False)
+
+    def install(self, services: dict):
+        try:
+            for nome, exe_path in services.items():
+                with open(os.path.join(self.UNIT_DIR, self._unit(nome)), "w", encoding="utf-8") as f:
+                    f.write(
+                        "[Unit]\n"
+                        f"Description={nome}\n\n"
+                        "[Service]\n"
+                        f"ExecStart={exe_path}\n"
+                        f"WorkingDirectory={os.path.dirname(exe_path)}\n"
+                        "Restart=on-failure\n\n"
+                        "[Install]\n"
+                        "WantedBy=multi-user.target\n"
+                    )
+        except OSError as e:
+            raise ServiceBackendError(f"Falha ao gravar a unidade systemd:\n{e}")
+        self._systemctl("daemon-reload")
+        self._systemctl("enable", *[self._unit(n) for n in services])
+
+    def remove(self, names):
+        self._systemctl("disable", "--now", *[self._unit(n) for n in names], check=False)
+        for nome in names:
+            try:
+                os.remove(os.path.join(self.UNIT_DIR, self._unit(nome)))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                raise ServiceBackendError(f"Falha ao remover a unidade systemd:\n{e}")
+        self._systemctl("daemon-reload")
+
+
+class FakeServiceBackend(ServiceBackend):
+    """Backend em memória para testes e benchmarks fora do Windows.
+
+    Os tempos de partida e parada simulam os estados *_PENDING do SCM.
+    """
+
+    def __init__(self, installed=(), start_delay=0.0, stop_delay=0.0):
+        self.start_delay = start_delay
+        self.stop_delay = stop_delay
+        self.calls = []  # Registro das operações, usado nos benchmarks
+        self._lock = threading.Lock()
+        self._estados = {}
+        self._transicoes = {}  # nome -> (estado final, instante em que conclui)
+        for nome in installed:
+            self._estados[nome] = ServiceState(nome, "STOPPED")
+
+    def _resolver(self, nome, agora):
+        transicao = self._transicoes.get(nome)
+        if transicao and agora >= transicao[1]:
+            estado = self._estados[nome]
+            estado.state = transicao[0]
+            estado.start_pending = estado.stop_pending = False
+            estado.pid = 4000 + len(self.calls) if estado.state == "RUNNING" else 0
+            del self._transicoes[nome]
+
+    def _transicionar(self, nome, destino, pendente, atraso):
+        estado = self._estados[nome]
+        if atraso > 0:
+            estado.state = pendente
+            estado.start_pending = pendente == "START_PENDING"
+            estado.stop_pending = pendente == "STOP_PENDING"
+        self._transicoes[nome] = (destino, time.monotonic() + atraso)
+        self._resolver(nome, time.monotonic())
+
+    def query(self, names) -> dict:
+        with self._lock:
+            self.calls.append(("query", tuple(names)))
+            agora = time.monotonic()
+            estados = {}
+            for nome in names:
+                if nome in self._estados:
+                    self._resolver(nome, agora)
+                    atual = self._estados[nome]
+                    estados[nome] = ServiceState(**vars(atual))
+                else:
+                    estados[nome] = ServiceState(nome)
+            return estados
+
+    def start(self, names):
+        with self._lock:
+            self.calls.append(("start", tuple(names)))
+            for nome in names:
+                if nome not in self._estados:
+                    raise ServiceBackendError(f"O serviço {nome} não está instalado.")
+                self._transicionar(nome, "RUNNING", "START_PENDING", self.start_delay)
+
+    def stop(self, names):
+        with self._lock:
+            self.calls.append(("stop", tuple(names)))
+            for nome in names:
+                if nome in self._estados:
+                    self._transicionar(nome, "STOPPED", "STOP_PENDING", self.stop_delay)
+
+    def install(self, services: dict):
+        with self._lock:
+            self.calls.append(("install", tuple(services)))
+            for nome in services:
+                self._estados.setdefault(nome, ServiceState(nome, "STOPPED"))
+
+    def remove(self, names):
+        with self._lock:
+            self.calls.append(("remove", tuple(names)))
+            for nome in names:
+                self._estados.pop(nome, None)
+                self._transicoes.pop(nome, None)
+
+
+def create_service_backend(nssm_path=None) -> ServiceBackend:
+    """Escolhe o backend pela variável GESTOR_SERVICE_BACKEND ou pela plataforma."""
+    escolha = (Config.SERVICE_BACKEND or "").lower()
+    if not escolha:
+        if platform.system() == "Windows":
+            escolha = "scm"
+        elif shutil.which("systemctl"):
+            escolha = "systemd"
+        else:
+            escolha = "fake"
+
+    if escolha == "systemd":
+        return SystemdBackend()
+    if escolha == "fake":
+        return FakeServiceBackend(installed=[Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS])
+    return ScmNssmBackend(nssm_path)
+
+
+class StatusMonitorWorker(QThread):
+    """Worker que consulta periodicamente o status dos serviços fora da thread da interface."""
+    # Sinal emitido quando o status muda (serviço, status anterior, status novo)
+    status_changed = pyqtSignal(str, str, str)
+
+    def __init__(self, backend: ServiceBackend, servicos, intervalo_ms=Config.STATUS_POLL_INTERVAL_MS,
+                 max_backoff_ms=Config.STATUS_POLL_MAX_BACKOFF_MS, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.servicos = list(servicos)
+        self.intervalo_ms = intervalo_ms
+        self.max_backoff_ms = max_backoff_ms
+        self._ultimos = {}
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._forcar = False
+
+    def solicitar_atualizacao(self, forcar=False):
+        """Pede uma consulta imediata. Com forcar=True, reemite o status mesmo sem mudança."""
+        if forcar:
+            self._forcar = True
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def run(self):
+        espera_ms = self.intervalo_ms
+        while not self._parar.is_set():
+            forcar, self._forcar = self._forcar, False
+            houve_erro = False
+
+            # Uma única consulta em lote para todos os serviços monitorados
+            try:
+                estados = self.backend.query(self.servicos)
+            except Exception:
+                estados = {nome: ServiceState(nome, "ERROR") for nome in self.servicos}
+
+            for nome in self.servicos:
+                if self._parar.is_set():
+                    return
+                status = estados[nome].status
+                anterior = self._ultimos.get(nome, "")
+                houve_erro = houve_erro or status == "Erro"
+                if status != anterior or forcar:
+                    self._ultimos[nome] = status
+                    self.status_changed.emit(nome, anterior, status)
+
+            # Backoff exponencial enquanto a consulta ao SCM estiver falhando
+            if houve_erro:
+                espera_ms = min(espera_ms * 2, self.max_backoff_ms)
+            else:
+                espera_ms = self.intervalo_ms
+
+            self._acordar.wait(espera_ms / 1000.0)
+            self._acordar.clear()
+
+
+class ServiceTransitionWorker(QThread):
+    """Worker que executa as operações de serviço (SCM/nssm) fora da thread da interface."""
+    # Sinal emitido ao fim (True=Sucesso/False=Falha, resultado por serviço, mensagem de erro).
+    # O resultado são os tempos de transição em "start"/"stop" e o texto do status em "query".
+    finished_signal = pyqtSignal(bool, object, str)
+
+    def __init__(self, backend: ServiceBackend, acao: str, nomes, parent=None, caminhos=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.acao = acao  # "start", "stop", "install", "remove" ou "query"
+        self.nomes = list(nomes)
+        self.caminhos = caminhos or {}  # {nome: executável}, usado por "install"
+
+    def run(self):
+        try:
+            if self.acao == "start":
+                resultado = self.backend.start_and_wait(self.nomes)
+            elif self.acao == "stop":
+                resultado = self.backend.stop_and_wait(self.nomes)
+            elif self.acao == "install":
+                self.backend.install({nome: self.caminhos[nome] for nome in self.nomes})
+                resultado = {}
+            elif self.acao == "remove":
+                self.backend.remove(self.nomes)
+                resultado = {}
+            else:
+                resultado = {nome: estado.status for nome, estado in self.backend.query(self.nomes).items()}
+            ok = all(t is not None for t in resultado.values())
+            self.finished_signal.emit(ok, resultado, "")
+        except Exception as e:
+            self.finished_signal.emit(False, {}, str(e))
+
+
+class DownloadIncompleteError(IOError):
+    """A conexão terminou antes de todos os bytes do arquivo chegarem."""
+
+
+def _ler_meta_download(meta_path) -> dict:
     try:
-        # 1. Faz a requisição para a API de Releases do GitHub
-        response = requests.get(API_URL)
-        response.raise_for_status() # Lança exceção para códigos de erro HTTP
-        releases_data = response.json()
-        
-        versions = []
-        
-        # 2. Itera sobre cada release e busca o executável
-        for release in releases_data:
-            version_tag = release.get("tag_name")
-            download_url = None
-            
-            # As 'assets' são os arquivos anexados à release (seu EXE)
-            for asset in release.get("assets", []):
-                # Assumimos que o nome do asset é o nome do executável
-                if asset.get("name") == Config.TARGET_FILE_NAME:
-                    # Usamos 'browser_download_url' para o download direto
-                    download_url = asset.get("browser_download_url")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _gravar_meta_download(meta_path, meta: dict):
+    # Temporário + os.replace: uma queda no meio da gravação não deixa um .json corrompido
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+class ChecksumMismatchError(Exception):
+    """O digest do arquivo baixado não confere com o publicado na release."""
+
+
+class StreamingDigest:
+    """Digest (SHA-256 por padrão) calculado no mesmo laço que grava os blocos no disco.
+
+    Os blocos podem chegar fora de ordem (download segmentado): os que estão à
+    frente ficam em um buffer limitado e entram no hash assim que o trecho
+    anterior chega. Só o que não coube no buffer, ou que já estava no disco
+    antes (retomada), é lido do arquivo ao final.
+    """
+
+    def __init__(self, algoritmo="sha256", limite_buffer=None):
+        self.algoritmo = algoritmo
+        self.limite_buffer = Config.HASH_BUFFER_LIMIT if limite_buffer is None else limite_buffer
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._hash = hashlib.new(self.algoritmo)
+        self.offset = 0
+        self._pendentes = {}
+        self._bufferizado = 0
+
+    def update_at(self, offset: int, data: bytes):
+        with self._lock:
+            if offset == self.offset:
+                self._hash.update(data)
+                self.offset += len(data)
+                self._drenar()
+            elif offset > self.offset and self._bufferizado + len(data) <= self.limite_buffer:
+                self._pendentes[offset] = bytes(data)
+                self._bufferizado += len(data)
+            # Caso contrário o trecho é lido do disco em catch_up()
+
+    def _drenar(self):
+        while self.offset in self._pendentes:
+            data = self._pendentes.pop(self.offset)
+            self._bufferizado -= len(data)
+            self._hash.update(data)
+            self.offset += len(data)
+
+    def catch_up(self, path: str, ate: int):
+        """Lê do disco o trecho [offset, ate) que ainda não entrou no hash."""
+        with self._lock:
+            if self.offset >= ate:
+                return
+            with open(path, "rb") as f:
+                while self.offset < ate:
+                    self._drenar()
+                    if self.offset >= ate:
+                        break
+                    proximo = min((o for o in self._pendentes if o > self.offset), default=ate)
+                    f.seek(self.offset)
+                    data = f.read(min(1024 * 1024, proximo - self.offset, ate - self.offset))
+                    if not data:
+                        break
+                    self._hash.update(data)
+                    self.offset += len(data)
+
+    def hexdigest(self, path: str, total: int) -> str:
+        self.catch_up(path, total)
+        return self._hash.hexdigest()
+
+
+def parse_expected_digest(value: str):
+    """Converte 'sha256:<hex>' (campo digest do GitHub) ou '<hex>  arquivo' (.sha256) em (algoritmo, hex)."""
+    if not value:
+        return None
+    value = value.strip().split()[0] if value.strip() else ""
+    if ":" in value:
+        algoritmo, hex_digest = value.split(":", 1)
+    else:
+        algoritmo, hex_digest = "sha256", value
+    algoritmo = algoritmo.lower().replace("-", "")
+    if algoritmo not in hashlib.algorithms_available or not hex_digest:
+        return None
+    return algoritmo, hex_digest.lower()
+
+
+def resolve_expected_digest(version_info: dict):
+    """Obtém o digest publicado para a versão: o campo 'digest' do asset ou o asset '.sha256'."""
+    esperado = parse_expected_digest(version_info.get("digest"))
+    if esperado is None and version_info.get("digest_url"):
+        r = http_client.get(version_info["digest_url"])
+        r.raise_for_status()
+        esperado = parse_expected_digest(r.text)
+        if esperado is None:
+            raise ChecksumMismatchError(f"Arquivo de checksum inválido: {version_info['digest_url']}")
+    return esperado
+
+
+def _concluir_download(part_path, meta_path, target_path, digest, total, expected_digest):
+    """Confere o digest (sem reler o que já passou pelo hash) e só então troca o arquivo."""
+    hex_digest = digest.hexdigest(part_path, total or os.path.getsize(part_path))
+    if expected_digest and hex_digest != expected_digest[1]:
+        # O arquivo está corrompido: não serve nem para retomar
+        for caminho in (part_path, meta_path):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        raise ChecksumMismatchError(
+            f"O {expected_digest[0]} do arquivo baixado não confere com o publicado na release.\n"
+            f"Esperado: {expected_digest[1]}\nObtido:   {hex_digest}"
+        )
+
+    # Só agora o arquivo completo e verificado substitui o destino
+    os.replace(part_path, target_path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    return hex_digest
+
+
+def download_resumable(url: str, target_path: str, progress_callback=None, max_retries=None, chunk_size=8192,
+                       expected_digest=None):
+    """Baixa 'url' para 'target_path' através de um arquivo '.part'.
+
+    Após uma queda de conexão o download é retomado com Range a partir do que
+    já está no '.part' (validado por If-Range com o ETag da primeira resposta).
+    O destino só é substituído, com os.replace (atômico), depois que o arquivo
+    chegou completo e o digest (calculado durante a gravação) confere com
+    'expected_digest' (algoritmo, hex). progress_callback(baixado, total) é
+    chamado a cada bloco. Retorna o digest hexadecimal do arquivo.
+    """
+    max_retries = Config.DOWNLOAD_MAX_RETRIES if max_retries is None else max_retries
+    digest = StreamingDigest(expected_digest[0] if expected_digest else "sha256")
+    part_path = target_path + ".part"
+    meta_path = part_path + ".json"
+
+    # Um .part de outro download (outra versão) ou de um download segmentado
+    # (com lacunas no meio do arquivo) não pode ser retomado sequencialmente
+    meta = _ler_meta_download(meta_path)
+    if meta.get("url") != url or "segmentos" in meta:
+        for caminho in (part_path, meta_path):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        meta = {"url": url}
+        _gravar_meta_download(meta_path, meta)
+
+    tentativa = 0
+    while True:
+        baixado = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        total = meta.get("total", 0)
+        headers = {}
+        if baixado:
+            headers["Range"] = f"bytes={baixado}-"
+            etag = meta.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["If-Range"] = etag
+
+        try:
+            with http_client.get(url, stream=True, headers=headers, timeout=(10, 60), retries=0) as r:
+                # O .part já está completo (a queda aconteceu depois do último byte)
+                if r.status_code == 416 and total and baixado == total:
                     break
-            
-            # Ignora drafts e releases sem o executável correto
-            if version_tag and download_url and not release.get("draft"):
-                versions.append({
-                    "version": version_tag,
-                    "download_url": download_url
-                })
-        
-        return versions
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Erro ao conectar com o GitHub: {e}")
-        return []
-    except Exception as e:
-        print(f"Erro inesperado na listagem de releases: {e}")
-        return []
+                r.raise_for_status()
+
+                if r.status_code == 206:
+                    modo = "ab"
+                    content_range = r.headers.get("Content-Range", "")
+                    if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                        total = int(content_range.rsplit("/", 1)[1])
+                else:
+                    # O servidor ignorou o Range (ou o arquivo mudou): recomeça do zero
+                    modo = "wb"
+                    baixado = 0
+                    total = int(r.headers.get("content-length", 0))
+                    meta["etag"] = r.headers.get("ETag")
+                    digest.reset()
+
+                # Numa retomada, o que já estava no .part entra no hash uma única vez
+                if baixado:
+                    digest.catch_up(part_path, baixado)
+
+                meta["total"] = total
+                _gravar_meta_download(meta_path, meta)
+
+                with open(part_path, modo) as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update_at(baixado, chunk)
+                            baixado += len(chunk)
+                            if progress_callback:
+                                progress_callback(baixado, total)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if total and baixado < total:
+                raise DownloadIncompleteError(f"Download interrompido em {baixado} de {total} bytes.")
+            break
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError, DownloadIncompleteError) as e:
+            tentativa += 1
+            if tentativa > max_retries:
+                raise
+            espera = min(2 ** tentativa, 30)
+            print(f"Download interrompido ({e}); retomando em {espera}s (tentativa {tentativa}/{max_retries})...")
+            time.sleep(espera)
+
+    return _concluir_download(part_path, meta_path, target_path, digest, total, expected_digest)
+
+
+class SegmentedDownloadUnsupported(Exception):
+    """O servidor não atendeu a um pedido de intervalo (Range) com 206."""
+
+
+def download_segmented(url: str, target_path: str, progress_callback=None, connections=None,
+                       max_retries=None, chunk_size=65536, expected_digest=None):
+    """Baixa 'url' em vários intervalos de bytes em paralelo, cada um gravado na sua posição do '.part'.
+
+    O '.part' é pré-alocado com o tamanho total e o progresso de cada segmento
+    fica no '.part.json', permitindo retomar só o que falta. Quando o servidor
+    não anuncia 'Accept-Ranges: bytes' (ou o arquivo é pequeno), cai para o
+    download_resumable com uma única conexão. O digest é calculado durante a
+    gravação (ver StreamingDigest) e conferido antes da troca.
+    """
+    connections = Config.DOWNLOAD_CONNECTIONS if connections is None else connections
+    max_retries = Config.DOWNLOAD_MAX_RETRIES if max_retries is None else max_retries
+    part_path = target_path + ".part"
+    meta_path = part_path + ".json"
+    meta = _ler_meta_download(meta_path)
+
+    # Um download sequencial já iniciado continua sequencial
+    if meta.get("url") == url and "segmentos" not in meta and os.path.exists(part_path):
+        return download_resumable(url, target_path, progress_callback, max_retries, expected_digest=expected_digest)
+
+    if connections <= 1:
+        return download_resumable(url, target_path, progress_callback, max_retries, expected_digest=expected_digest)
+
+    # Resolve o redirecionamento do GitHub uma vez e descobre o tamanho e o suporte a Range
+    with http_client.head(url, allow_redirects=True) as r:
+        r.raise_for_status()
+        total = int(r.headers.get("content-length", 0))
+        aceita_range = r.headers.get("Accept-Ranges", "").lower() == "bytes"
+        final_url = r.url
+
+    if not aceita_range or total < 2 * Config.DOWNLOAD_SEGMENT_MIN_SIZE:
+        return download_resumable(url, target_path, progress_callback, max_retries, expected_digest=expected_digest)
+
+    segmentos = meta.get("segmentos") if meta.get("url") == url and meta.get("total") == total else None
+    if not segmentos or not os.path.exists(part_path) or os.path.getsize(part_path) != total:
+        # Divide o arquivo em segmentos [início, fim, bytes já baixados]
+        tamanho = max(-(-total // connections), Config.DOWNLOAD_SEGMENT_MIN_SIZE)
+        segmentos = [[inicio, min(inicio + tamanho, total) - 1, 0] for inicio in range(0, total, tamanho)]
+        with open(part_path, "wb") as f:
+            f.truncate(total)
+
+    meta = {"url": url, "total": total, "segmentos": segmentos}
+    digest = StreamingDigest(expected_digest[0] if expected_digest else "sha256")
+    lock = threading.Lock()
+    erro = threading.Event()
+    baixado = [sum(seg[2] for seg in segmentos)]
+    # Bytes de cada segmento que já estão no disco (fsync): só isso vai para os checkpoints
+    persistidos = [seg[2] for seg in segmentos]
+    _gravar_meta_download(meta_path, meta)
+
+    def checkpoint(i, f):
+        """Grava o progresso do segmento i depois de garantir que os dados estão no disco."""
+        f.flush()
+        os.fsync(f.fileno())
+        with lock:
+            persistidos[i] = segmentos[i][2]
+            _gravar_meta_download(meta_path, {
+                "url": url, "total": total,
+                "segmentos": [[s[0], s[1], persistidos[j]] for j, s in enumerate(segmentos)],
+            })
+
+    def baixar_segmento(i):
+        seg = segmentos[i]
+        tentativa = 0
+        with open(part_path, "r+b") as f:
+            while seg[2] < seg[1] - seg[0] + 1 and not erro.is_set():
+                inicio = seg[0] + seg[2]
+                try:
+                    headers = {"Range": f"bytes={inicio}-{seg[1]}"}
+                    with http_client.get(final_url, headers=headers, stream=True, timeout=(10, 60), retries=0) as r:
+                        if r.status_code != 206:
+                            raise SegmentedDownloadUnsupported(f"Resposta {r.status_code} para {headers['Range']}")
+                        f.seek(inicio)
+                        for chunk in r.iter_content(chunk_size=chunk_size):
+                            if erro.is_set():
+                                return
+                            if not chunk:
+                                continue
+                            chunk = chunk[:seg[1] - seg[0] + 1 - seg[2]]
+                            f.write(chunk)
+                            digest.update_at(seg[0] + seg[2], chunk)
+                            with lock:
+                                seg[2] += len(chunk)
+                                baixado[0] += len(chunk)
+                                atual = baixado[0]
+                            if progress_callback:
+                                progress_callback(atual, total)
+                            if seg[2] - persistidos[i] >= Config.DOWNLOAD_CHECKPOINT_BYTES:
+                                checkpoint(i, f)
+                        # Resposta encerrada antes do fim do intervalo conta como tentativa falha
+                        if seg[2] < seg[1] - seg[0] + 1 and not erro.is_set():
+                            raise DownloadIncompleteError(
+                                f"Segmento interrompido em {seg[0] + seg[2]} de {seg[1] + 1} bytes."
+                            )
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError, DownloadIncompleteError) as e:
+                    tentativa += 1
+                    checkpoint(i, f)
+                    if tentativa > max_retries:
+                        raise
+                    espera = min(2 ** tentativa, 30)
+                    print(f"Segmento {seg[0]}-{seg[1]} interrompido ({e}); retomando em {espera}s...")
+                    time.sleep(espera)
+            f.flush()
+            os.fsync(f.fileno())
+
+    pendentes = [i for i, seg in enumerate(segmentos) if seg[2] < seg[1] - seg[0] + 1]
+    sem_suporte = None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(pendentes))) as executor:
+            futures = [executor.submit(baixar_segmento, i) for i in pendentes]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                erro.set()
+                raise
+    except SegmentedDownloadUnsupported as e:
+        sem_suporte = e
+    finally:
+        # Guarda o progresso de cada segmento para uma próxima tentativa (exceto ao cair para uma
+        # conexão: aí o .part.json passa a ser do download sequencial e não pode ser sobrescrito)
+        if sem_suporte is None and os.path.exists(part_path):
+            with lock:
+                _gravar_meta_download(meta_path, meta)
+
+    if sem_suporte is not None:
+        print(f"Download segmentado não suportado ({sem_suporte}); usando uma única conexão.")
+        for caminho in (part_path, meta_path):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        return download_resumable(url, target_path, progress_callback, max_retries, expected_digest=expected_digest)
+
+    if baixado[0] < total:
+        raise DownloadIncompleteError(f"Download interrompido em {baixado[0]} de {total} bytes.")
+
+    return _concluir_download(part_path, meta_path, target_path, digest, total, expected_digest)
+
+
+def download_file(url: str, target_path: str, progress_callback=None, expected_digest=None):
+    """Ponto único de download: segmentado quando configurado, com retomada, verificação e troca atômica.
+
+    Retorna o digest hexadecimal do arquivo baixado.
+    """
+    if Config.DOWNLOAD_CONNECTIONS > 1:
+        return download_segmented(url, target_path, progress_callback, expected_digest=expected_digest)
+    return download_resumable(url, target_path, progress_callback, expected_digest=expected_digest)
+
+
+def verificar_executavel(path: str):
+    """Confere se o arquivo baixado é um executável Windows (assinatura 'MZ') não vazio."""
+    with open(path, "rb") as f:
+        assinatura = f.read(2)
+    if assinatura != b"MZ":
+        raise ValueError(f"O arquivo baixado não é um executável válido: {path}")
+
+
+def aguardar_api_pronta(url: str, timeout: float):
+    """Consulta a URL até a API responder (status < 500) ou o prazo expirar.
+
+    Retorna os segundos até a primeira resposta, ou None se o prazo expirou.
+    """
+    inicio = time.monotonic()
+    intervalo = 0.25
+    while True:
+        try:
+            r = http_client.get(url, timeout=2, retries=0)
+            if r.status_code < 500:
+                return time.monotonic() - inicio
+        except requests.exceptions.RequestException:
+            pass
+        restante = timeout - (time.monotonic() - inicio)
+        if restante <= 0:
+            return None
+        time.sleep(min(intervalo, restante))
+        intervalo = min(intervalo * 2, 2.0)
+
+
+class ArtifactStore:
+    """Armazém local dos executáveis baixados, endereçado por conteúdo (digest).
+
+    Guarda as últimas versões em Config.ARTIFACTS_DIR (no mesmo volume da API,
+    para que a troca seja um simples rename) e descarta as menos usadas
+    recentemente quando passa de ARTIFACTS_MAX_COUNT arquivos ou
+    ARTIFACTS_MAX_BYTES. O índice também registra qual versão está instalada.
+    """
+
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or Config.ARTIFACTS_DIR
+        self.index_path = os.path.join(self.base_dir, "index.json")
+        self._lock = threading.Lock()
+        self._dados = self._carregar()
+
+    def _carregar(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if isinstance(dados, dict) and isinstance(dados.get("artifacts"), list):
+                # Descarta entradas cujo arquivo sumiu do disco
+                dados["artifacts"] = [a for a in dados["artifacts"] if os.path.exists(self.path(a))]
+                return dados
+        except (OSError, ValueError):
+            pass
+        return {"artifacts": [], "installed": None}
+
+    def _salvar(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._dados, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def path(self, artefato):
+        return os.path.join(self.base_dir, artefato["file"])
+
+    @property
+    def installed(self):
+        """{'version', 'digest'} da versão instalada, se conhecida."""
+        return self._dados.get("installed")
+
+    def list(self):
+        """Artefatos do mais recente para o mais antigo (por último uso)."""
+        return sorted(self._dados["artifacts"], key=lambda a: a.get("last_used", 0), reverse=True)
+
+    def find(self, version=None, digest=None):
+        """Procura por digest (exato) ou, sem digest, pela versão."""
+        for artefato in self.list():
+            if digest and artefato["digest"] == digest:
+                return artefato
+            if not digest and version and artefato["version"] == version:
+                return artefato
+        return None
+
+    def add(self, path, version, digest, algoritmo="sha256"):
+        """Guarda uma cópia (hardlink quando possível) do executável e aplica a política de descarte."""
+        with self._lock:
+            existente = self.find(digest=digest)
+            if existente is None:
+                os.makedirs(self.base_dir, exist_ok=True)
+                nome = f"{algoritmo}-{digest}.exe"
+                destino = os.path.join(self.base_dir, nome)
+                if not os.path.exists(destino):
+                    tmp_path = destino + ".tmp"
+                    _vincular_ou_copiar(path, tmp_path)
+                    os.replace(tmp_path, destino)
+                existente = {"file": nome, "digest": digest, "algorithm": algoritmo,
+                             "size": os.path.getsize(destino)}
+                self._dados["artifacts"].append(existente)
+            existente["version"] = version
+            existente["last_used"] = time.time()
+            self._descartar()
+            self._salvar()
+            return existente
+
+    def materialize(self, artefato, destino):
+        """Coloca uma cópia do artefato em 'destino' (hardlink: instantâneo e sem rede)."""
+        with self._lock:
+            if os.path.exists(destino):
+                os.remove(destino)
+            _vincular_ou_copiar(self.path(artefato), destino)
+            artefato["last_used"] = time.time()
+            self._salvar()
+
+    def mark_installed(self, version, digest):
+        with self._lock:
+            self._dados["installed"] = {"version": version, "digest": digest}
+            self._salvar()
+
+    def _descartar(self):
+        """Remove os artefatos menos usados além dos limites (nunca o instalado)."""
+        instalado = (self.installed or {}).get("digest")
+        artefatos = self.list()
+        total = sum(a.get("size", 0) for a in artefatos)
+        while artefatos and (len(artefatos) > Config.ARTIFACTS_MAX_COUNT or total > Config.ARTIFACTS_MAX_BYTES):
+            candidato = next((a for a in reversed(artefatos) if a["digest"] != instalado), None)
+            if candidato is None:
+                break
+            artefatos.remove(candidato)
+            total -= candidato.get("size", 0)
+            try:
+                os.remove(self.path(candidato))
+            except OSError as e:
+                print(f"Não foi possível remover o artefato {candidato['file']}: {e}")
+        self._dados["artifacts"] = artefatos
+
+
+def _vincular_ou_copiar(origem, destino):
+    """Cria um hardlink (mesmo volume) ou, se não for possível, copia o arquivo."""
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+
+class PatchError(Exception):
+    """Patch binário inválido ou incompatível com a versão base."""
+
+
+def _offtin(buf: bytes) -> int:
+    """Inteiro de 64 bits em sinal-magnitude (little-endian), como no formato BSDIFF40."""
+    valor = int.from_bytes(buf[:8], "little") & 0x7FFFFFFFFFFFFFFF
+    return -valor if buf[7] & 0x80 else valor
+
+
+def _somar_bytes(diff: bytes, old: bytes, old_inicio: int, destino: bytearray, pos: int):
+    """destino[pos:pos+len(diff)] = diff + old[old_inicio:...] (mod 256).
+
+    Nas diferenças entre builds quase todos os bytes do bloco 'diff' são zero:
+    o trecho é copiado da versão antiga e só as sequências não nulas são somadas.
+    """
+    n = len(diff)
+    # Parte do bloco que cai dentro do arquivo antigo (fora dele, o bsdiff usa só o diff)
+    ini = max(0, -old_inicio)
+    fim = max(ini, min(n, len(old) - old_inicio))
+    destino[pos:pos + n] = diff
+    if fim <= ini:
+        return
+    destino[pos + ini:pos + fim] = old[old_inicio + ini:old_inicio + fim]
+    for m in re.finditer(rb"[^\x00]+", diff[ini:fim]):
+        a, b = m.start() + ini, m.end() + ini
+        destino[pos + a:pos + b] = bytes(
+            (d + o) & 0xFF for d, o in zip(diff[a:b], old[old_inicio + a:old_inicio + b])
+        )
+
+
+def apply_bsdiff(old_path: str, patch_path: str, new_path: str, expected_digest=None) -> str:
+    """Reconstrói o executável novo a partir da versão base e de um patch BSDIFF40.
+
+    O resultado é gravado em '.part', conferido contra 'expected_digest'
+    (algoritmo, hex) e só então movido para 'new_path'. Retorna o digest.
+    """
+    with open(patch_path, "rb") as f:
+        patch = f.read()
+    if len(patch) < 32 or patch[:8] != b"BSDIFF40":
+        raise PatchError("Arquivo de patch inválido (cabeçalho BSDIFF40 ausente).")
+
+    ctrl_len, diff_len, new_size = _offtin(patch[8:16]), _offtin(patch[16:24]), _offtin(patch[24:32])
+    if ctrl_len < 0 or diff_len < 0 or new_size < 0 or 32 + ctrl_len + diff_len > len(patch):
+        raise PatchError("Cabeçalho do patch corrompido.")
+
+    try:
+        ctrl = bz2.decompress(patch[32:32 + ctrl_len])
+        diff = bz2.BZ2File(io.BytesIO(patch[32 + ctrl_len:32 + ctrl_len + diff_len]))
+        extra = bz2.BZ2File(io.BytesIO(patch[32 + ctrl_len + diff_len:]))
+
+        with open(old_path, "rb") as f:
+            old = f.read()
+
+        novo = bytearray(new_size)
+        old_pos = new_pos = 0
+        for i in range(0, len(ctrl) - 23, 24):
+            x, y, z = _offtin(ctrl[i:i + 8]), _offtin(ctrl[i + 8:i + 16]), _offtin(ctrl[i + 16:i + 24])
+            if x < 0 or y < 0 or new_pos + x + y > new_size:
+                raise PatchError("Bloco de controle do patch corrompido.")
+
+            bloco = diff.read(x)
+            if len(bloco) != x:
+                raise PatchError("Bloco de diferenças do patch truncado.")
+            _somar_bytes(bloco, old, old_pos, novo, new_pos)
+            new_pos += x
+            old_pos += x
+
+            bloco = extra.read(y)
+            if len(bloco) != y:
+                raise PatchError("Bloco extra do patch truncado.")
+            novo[new_pos:new_pos + y] = bloco
+            new_pos += y
+            old_pos += z
+    except (OSError, EOFError, ValueError) as e:
+        raise PatchError(f"Falha ao descompactar o patch: {e}")
+
+    if new_pos != new_size:
+        raise PatchError("O patch não reconstruiu o arquivo completo.")
+
+    algoritmo = expected_digest[0] if expected_digest else "sha256"
+    hex_digest = hashlib.new(algoritmo, novo).hexdigest()
+    if expected_digest and hex_digest != expected_digest[1]:
+        raise ChecksumMismatchError(
+            f"O executável reconstruído pelo patch não confere com o {algoritmo} publicado na release."
+        )
+
+    part_path = new_path + ".part"
+    with open(part_path, "wb") as f:
+        f.write(novo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(part_path, new_path)
+    return hex_digest
+
+
+def escolher_patch(patches, store, installed_path):
+    """Escolhe um patch cuja base seja a versão instalada ou uma do armazém local.
+
+    Os patches são publicados como 'vmd-api-hub.exe.from-<base>.bsdiff', onde
+    <base> é a tag da versão base ou o início (12+ caracteres) do seu SHA-256.
+    Retorna (patch, caminho da base) ou None.
+    """
+    if not patches:
+        return None
+
+    bases = []  # (versão, digest sha256, caminho)
+    instalado = store.installed
+    if os.path.exists(installed_path):
+        if instalado:
+            bases.append((instalado.get("version"), instalado.get("digest"), installed_path))
+        else:
+            bases.append((None, calcular_digest(installed_path), installed_path))
+    for artefato in store.list():
+        if artefato.get("algorithm", "sha256") == "sha256":
+            bases.append((artefato.get("version"), artefato["digest"], store.path(artefato)))
+
+    for patch in patches:
+        chave = patch["base"]
+        for base_version, base_digest, caminho in bases:
+            if chave == base_version or (len(chave) >= 12 and base_digest and base_digest.startswith(chave.lower())):
+                return patch, caminho
+    return None
+
+
+def calcular_digest(path, algoritmo="sha256") -> str:
+    h = hashlib.new(algoritmo)
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class ProgressThrottle:
+    """Agrupa as notificações de progresso do download em uma taxa fixa.
+
+    Recebe cada bloco gravado (de qualquer thread) e só chama 'emit' no máximo
+    Config.PROGRESS_RATE_HZ vezes por segundo, e sempre ao concluir, com a
+    porcentagem, a velocidade suavizada (bytes/s), o ETA e o tempo decorrido.
+    """
+
+    def __init__(self, emit, rate_hz=None, smoothing=0.3):
+        self.emit = emit
+        self.intervalo = 1.0 / (rate_hz or Config.PROGRESS_RATE_HZ)
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._inicio = time.monotonic()
+        self._ultimo_instante = None
+        self._ultimo_baixado = 0
+        self._velocidade = 0.0
+
+    def __call__(self, baixado, total):
+        agora = time.monotonic()
+        with self._lock:
+            if self._ultimo_instante is None:
+                # Primeira notificação: referência (em uma retomada o arquivo já tem bytes)
+                self._ultimo_instante, self._ultimo_baixado = agora, baixado
+                return
+            concluido = total > 0 and baixado >= total
+            dt = agora - self._ultimo_instante
+            if dt < self.intervalo and not concluido:
+                return
+
+            if dt > 0:
+                instantanea = (baixado - self._ultimo_baixado) / dt
+                if self._velocidade:
+                    self._velocidade += self.smoothing * (instantanea - self._velocidade)
+                else:
+                    self._velocidade = instantanea
+            self._ultimo_instante, self._ultimo_baixado = agora, baixado
+
+            porcentagem = int(baixado * 100 / total) if total > 0 else 0
+            eta = (total - baixado) / self._velocidade if total > 0 and self._velocidade > 0 else -1.0
+            decorrido = agora - self._inicio
+            velocidade = self._velocidade
+
+        self.emit(porcentagem, velocidade, eta, decorrido)
+
 
+def formatar_duracao(segundos: float) -> str:
+    """Formata segundos como mm:ss (ou h:mm:ss)."""
+    segundos = int(max(segundos, 0))
+    h, resto = divmod(segundos, 3600)
+    m, s = divmod(resto, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
 
 
 class DownloadWorker(QThread):
     """Worker que executa o download em uma thread separada."""
-    # Sinal emitido ao progresso
-    progress_signal = pyqtSignal(int) 
+    # Sinal emitido ao progresso, em taxa limitada (porcentagem, bytes/s, ETA em s ou -1, decorrido em s)
+    progress_signal = pyqtSignal(int, float, float, float) 
+    # Sinal emitido a cada etapa da atualização (texto para o status)
+    stage_signal = pyqtSignal(str)
     # Sinal emitido ao fim (True=Sucesso/False=Falha, Message=String)
     finished_signal = pyqtSignal(bool, str)
 
-    def __init__(self, download_url: str, target_filename: str, parent=None):
+    def __init__(self, download_url: str, target_filename: str, backend: ServiceBackend = None, parent=None,
+                 version_info: dict = None):
         super().__init__(parent)
         self.download_url = download_url
         self.target_filename = target_filename
+        self.backend = backend or create_service_backend()
+        self.version_info = version_info or {}
 
     def run(self):
         full_target_path = os.path.join(Config.BASE_DIR_INFARMA, self.target_filename)
+        staged_path = full_target_path + ".new"
+        servicos = [Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS]
         
         if not os.path.isdir(Config.BASE_DIR_INFARMA):
             self.finished_signal.emit(False, f"Diretório de destino não existe: {Config.BASE_DIR_INFARMA}")
             return
-        
-        # ⚠️ TENTA PARAR O SERVIÇO ANTES DE SUBSTITUIR O EXECUTÁVEL
+
+        version = self.version_info.get("version") or "desconhecida"
+        store = ArtifactStore()
+
+        # 1. Obtém e valida a nova versão enquanto a versão atual continua atendendo:
+        #    do armazém local, se já foi baixada antes, ou do GitHub
         try:
-             subprocess.run(["net", "stop", Config.SERVICE_NAME_API], creationflags=subprocess.CREATE_NO_WINDOW)
-             time.sleep(2) # Pequena pausa para garantir que o serviço pare.
-             # Para o REDIS também, caso ele esteja relacionado:
-             subprocess.run(["net", "stop", Config.SERVICE_NAME_REDIS], creationflags=subprocess.CREATE_NO_WINDOW)
-             time.sleep(1)
-        except Exception:
-             pass 
+            expected_digest = None
+            artefato = None
+            if self.download_url:
+                expected_digest = resolve_expected_digest(self.version_info)
+                if expected_digest is None:
+                    print("A release não publica checksum; o executável não será verificado.")
+                    artefato = store.find(version=version)
+                elif expected_digest[0] == "sha256":
+                    artefato = store.find(digest=expected_digest[1])
+            else:
+                artefato = store.find(digest=self.version_info.get("artifact_digest"), version=version)
+                if artefato is None:
+                    self.finished_signal.emit(False, f"A versão {version} não está no armazém local.")
+                    return
+
+            digest = None
+            if artefato is not None:
+                self.stage_signal.emit(f"Usando a versão {version} do armazém local (sem download)...")
+                store.materialize(artefato, staged_path)
+                digest = artefato["digest"]
+            elif expected_digest and expected_digest[0] == "sha256":
+                # Atualização incremental: só é usada quando o resultado pode ser verificado
+                digest = self._aplicar_patch(store, full_target_path, staged_path, expected_digest)
+            if digest is None:
+                self.stage_signal.emit("Baixando a nova versão (a API continua no ar)...")
+                # O progresso é agrupado (ex.: 10 Hz) para não inundar a interface com sinais
+                on_progress = ProgressThrottle(self.progress_signal.emit)
+                digest = download_file(self.download_url, staged_path, on_progress, expected_digest)
+            verificar_executavel(staged_path)
+            self._guardar_no_armazem(store, artefato, staged_path, full_target_path, version, digest, expected_digest)
+        except ChecksumMismatchError as e:
+            self.finished_signal.emit(False, f"O arquivo baixado está corrompido e a troca foi recusada:\n\n{e}")
+            return
+        except (requests.exceptions.RequestException, DownloadIncompleteError) as e:
+            self.finished_signal.emit(False, f"Erro durante o download do arquivo:\n{e}\n\nO que já foi baixado foi mantido e será retomado na próxima tentativa.")
+            return
+        except Exception as e:
+            self.finished_signal.emit(False, f"Ocorreu um erro inesperado no download: {e}")
+            return
 
+        # Só reinicia depois da troca os serviços que estavam rodando antes
         try:
-            with requests.get(self.download_url, stream=True) as r:
-                r.raise_for_status()
-                total_size = int(r.headers.get('content-length', 0))
-                
-                with open(full_target_path, 'wb') as f:
-                    downloaded_size = 0
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            if total_size > 0:
-                                progress = int((downloaded_size / total_size) * 100)
-                                self.progress_signal.emit(progress)
+            estados = self.backend.query(servicos)
+            reiniciar = [nome for nome in servicos if estados[nome].state in ("RUNNING", "START_PENDING")]
+        except Exception:
+            reiniciar = []
 
-            self.finished_signal.emit(True, f"Apihub atualizado com sucesso!")
+        # 2. Janela de indisponibilidade: parar, trocar o executável, iniciar e aguardar a API responder
+        inicio_indisponivel = time.monotonic()
+        try:
+            tempos_parada = {}
+            if reiniciar:
+                self.stage_signal.emit("Parando os serviços...")
+                tempos_parada = self.backend.stop_and_wait(reiniciar)
+
+            nao_parados = [nome for nome, t in tempos_parada.items() if t is None]
+            if nao_parados:
+                # Trocar o executável com o serviço ainda rodando falharia ou deixaria a instalação pela metade
+                self._descartar_preparado(staged_path)
+                self._reiniciar_servicos(reiniciar)
+                self.finished_signal.emit(False, (
+                    f"O(s) serviço(s) {', '.join(nao_parados)} não parou(aram) em {Config.SERVICE_STOP_TIMEOUT}s. "
+                    "A atualização foi cancelada, o executável não foi alterado e os serviços foram reiniciados."
+                ))
+                return
 
-            
+            self.stage_signal.emit("Substituindo o executável...")
+            backup_path = full_target_path + ".old"
+            try:
+                if os.path.exists(full_target_path):
+                    os.replace(full_target_path, backup_path)
+                os.replace(staged_path, full_target_path)
+            except OSError as e:
+                if os.path.exists(backup_path) and not os.path.exists(full_target_path):
+                    os.replace(backup_path, full_target_path)
+                self._descartar_preparado(staged_path)
+                self._reiniciar_servicos(reiniciar)
+                self.finished_signal.emit(False, (
+                    "Não foi possível substituir o executável; a versão atual foi mantida"
+                    + (" e os serviços foram reiniciados" if reiniciar else "") + f".\n\n{e}"
+                ))
+                return
 
-        except requests.exceptions.RequestException as e:
-            self.finished_signal.emit(False, f"Erro durante o download do arquivo:\n{e}")
-        except IOError as e:
-            # ERRO MAIS COMUM: O EXE ESTÁ EM USO
-            self.finished_signal.emit(False, f"Erro ao salvar o arquivo no disco (IOError). O '{Config.SERVICE_NAME_API}' provavelmente está em uso. Por favor, **pare o serviço manualmente** antes de tentar a atualização.")
+            tempos_partida = {}
+            pronta_em = None
+            if reiniciar:
+                self.stage_signal.emit("Iniciando os serviços...")
+                try:
+                    tempos_partida = self.backend.start_and_wait(reiniciar)
+                except ServiceBackendError as e:
+                    self._restaurar_versao_anterior(full_target_path, backup_path, reiniciar)
+                    self.finished_signal.emit(False, f"A nova versão não iniciou e a versão anterior foi restaurada.\n\n{e}")
+                    return
+
+                if Config.SERVICE_NAME_API in reiniciar:
+                    self.stage_signal.emit("Aguardando a API responder...")
+                    pronta_em = aguardar_api_pronta(Config.URL_DASHBOARD, Config.READINESS_TIMEOUT)
+                    if pronta_em is None:
+                        # Uma versão que sobe mas não atende é tratada como falha na partida
+                        self._restaurar_versao_anterior(full_target_path, backup_path, reiniciar)
+                        self.finished_signal.emit(False, (
+                            f"A nova versão iniciou, mas a API não respondeu em {Config.READINESS_TIMEOUT}s. "
+                            "A versão anterior foi restaurada."
+                        ))
+                        return
+
+            indisponivel = time.monotonic() - inicio_indisponivel
+            if os.path.exists(backup_path):
+                os.remove(backup_path)
+            store.mark_installed(version, digest)
+
+            mensagem = "Apihub atualizado com sucesso!"
+            if reiniciar:
+                mensagem += f"\n\nJanela de indisponibilidade: {indisponivel:.1f}s"
+                mensagem += f"\nParada: {formatar_tempos(tempos_parada)}"
+                mensagem += f"\nPartida: {formatar_tempos(tempos_partida)}"
+            self.finished_signal.emit(True, mensagem)
+
+        except OSError as e:
+            self.finished_signal.emit(False, f"Erro de disco durante a atualização:\n{e}")
         except Exception as e:
             self.finished_signal.emit(False, f"Ocorreu um erro inesperado: {e}")
 
+    def _aplicar_patch(self, store, full_target_path, staged_path, expected_digest):
+        """Tenta montar a nova versão com um patch binário. Retorna o digest ou None (usar o download completo)."""
+        escolhido = escolher_patch(self.version_info.get("patches"), store, full_target_path)
+        if escolhido is None:
+            return None
+        patch, base_path = escolhido
+        patch_path = staged_path + ".bsdiff"
+        try:
+            self.stage_signal.emit(f"Baixando atualização incremental ({patch.get('size', 0) / 1024:.0f} KB)...")
+            # Throttle próprio: o download completo, se vier depois, começa com tempo e ETA zerados
+            download_file(patch["url"], patch_path, ProgressThrottle(self.progress_signal.emit))
+            self.stage_signal.emit("Aplicando a atualização incremental...")
+            return apply_bsdiff(base_path, patch_path, staged_path, expected_digest)
+        except (PatchError, ChecksumMismatchError, DownloadIncompleteError, requests.exceptions.RequestException, OSError) as e:
+            print(f"Atualização incremental indisponível ({e}); baixando o executável completo.")
+            return None
+        finally:
+            # Inclui o .part e o .part.json de um download do patch que não terminou
+            for caminho in (patch_path, patch_path + ".part", patch_path + ".part.json"):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+
+    def _guardar_no_armazem(self, store, artefato, staged_path, full_target_path, version, digest, expected_digest):
+        """Guarda a versão baixada (e, na primeira vez, a instalada) no armazém local. Falhas não impedem a atualização."""
+        try:
+            if artefato is None:
+                store.add(staged_path, version, digest, expected_digest[0] if expected_digest else "sha256")
+
+            # Guarda também a versão instalada hoje, para poder voltar a ela sem rede
+            if os.path.exists(full_target_path) and store.installed is None:
+                anterior = calcular_digest(full_target_path)
+                if store.find(digest=anterior) is None:
+                    store.add(full_target_path, "anterior", anterior)
+        except OSError as e:
+            print(f"Não foi possível gravar no armazém local de versões: {e}")
+
+    @staticmethod
+    def _descartar_preparado(staged_path):
+        """Remove a cópia preparada (.new) de uma troca cancelada; a versão continua no armazém local."""
+        try:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+        except OSError as e:
+            print(f"Não foi possível remover {staged_path}: {e}")
+
+    def _reiniciar_servicos(self, servicos):
+        """Volta a iniciar os serviços parados para a troca quando ela é cancelada."""
+        if not servicos:
+            return
+        try:
+            self.stage_signal.emit("Reiniciando os serviços...")
+            self.backend.start_and_wait(servicos)
+        except Exception as e:
+            print(f"Falha ao reiniciar os serviços: {e}")
+
+    def _restaurar_versao_anterior(self, full_target_path, backup_path, servicos):
+        """Volta o executável anterior e reinicia os serviços após uma falha de partida."""
+        try:
+            self.stage_signal.emit("Restaurando a versão anterior...")
+            self.backend.stop_and_wait(servicos)
+            if os.path.exists(backup_path):
+                os.replace(backup_path, full_target_path)
+            self.backend.start_and_wait(servicos)
+        except Exception as e:
+            print(f"Falha ao restaurar a versão anterior: {e}")
+
+class ReleasesPageWorker(QThread):
+    """Worker que busca uma página de releases do GitHub fora da thread da interface."""
+    # Sinal emitido com a página carregada (versões, URL da próxima página ou "", origem)
+    page_loaded = pyqtSignal(list, str, str)
+    # Sinal emitido em caso de falha (mensagem)
+    failed = pyqtSignal(str)
+
+    def __init__(self, repo_name: str, url: str, force=False, parent=None):
+        super().__init__(parent)
+        self.repo_name = repo_name
+        self.url = url
+        self.force = force
+        self._cancelado = False
+
+    def cancelar(self):
+        """Descarta o resultado; a requisição em andamento termina pelo timeout."""
+        self._cancelado = True
+
+    def run(self):
+        try:
+            versions, next_url, origem = fetch_release_page(self.repo_name, self.url, force=self.force)
+        except Exception as e:
+            if not self._cancelado:
+                self.failed.emit(str(e))
+            return
+
+        if self._cancelado:
+            return
+        if versions is None:
+            self.failed.emit("Sem conexão com o GitHub e sem releases em cache.")
+        else:
+            self.page_loaded.emit(versions, next_url or "", origem)
+
+
 class VersionsDialog(QDialog):
+
+    # Mantém os workers vivos até terminarem, mesmo que o diálogo seja fechado antes
+    _loaders_em_andamento = set()
     
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Atualização Apihub")
-        self.setFixedSize(400, 350)
+        self.setFixedSize(400, 400)
         self.thread = None 
+        self.loader = None
+        self._next_url = None
+        self._item_carregando = None
 
         
         self.setStyleSheet("""
@@ -234,9 +2022,16 @@ class VersionsDialog(QDialog):
 
         # 5. Label de Status do Download
         self.lbl_status_download = QLabel("Status: Aguardando seleção...")
+        self.lbl_status_download.setWordWrap(True)
         layout.addWidget(self.lbl_status_download)
         
-        # 6. Botão de Fechar
+        # 6. Botão Reverter (troca por uma versão do armazém local, sem rede)
+        self.btn_rollback = QPushButton("↩️ Reverter Versão (sem download)")
+        self.btn_rollback.setObjectName("btn_reload")
+        self.btn_rollback.clicked.connect(self.start_rollback)
+        layout.addWidget(self.btn_rollback)
+
+        # 7. Botão de Fechar
         self.btn_close = QPushButton("Fechar")
         self.btn_close.setObjectName("btn_close") 
         self.btn_close.clicked.connect(self.accept)
@@ -244,6 +2039,8 @@ class VersionsDialog(QDialog):
 
         # Conexão: Habilitar o botão de download ao selecionar um item
         self.listWidget_versions.itemSelectionChanged.connect(self.enable_download_button)
+        # Páginas mais antigas são carregadas ao rolar até o fim da lista
+        self.listWidget_versions.verticalScrollBar().valueChanged.connect(self._on_scroll)
 
         # Carregar as versões na inicialização
         self.load_versions()
@@ -253,23 +2050,84 @@ class VersionsDialog(QDialog):
         self.btn_download.setEnabled(bool(self.listWidget_versions.selectedItems()))
 
     def load_versions(self):
-        """Busca as versões do GitHub e popula o QListWidget."""
-        self.listWidget_versions.addItem(QListWidgetItem("Carregando versões..."))
-        QtWidgets.QApplication.processEvents()
-        
-        versions = get_available_versions(Config.REPO_FULL_NAME)
+        """Inicia a busca das versões do GitHub em segundo plano, a partir da página mais recente."""
+        self._cancelar_loader()
         self.listWidget_versions.clear()
-
-        if not versions:
-            QMessageBox.warning(self, "Aviso", f"Não foi possível carregar as releases do repositório {Config.REPO_FULL_NAME}. Verifique a conexão.")
+        self._item_carregando = None
+        
+        # "Recarregar Versões" sempre revalida no GitHub; a abertura do diálogo usa o cache
+        force = self.sender() is self.btn_reload
+        self._carregar_pagina(releases_first_page_url(Config.REPO_FULL_NAME), force)
+
+    def _carregar_pagina(self, url, force=False):
+        """Dispara o worker de uma página e mostra o item "Carregando versões..." no fim da lista."""
+        self._next_url = None
+        self._item_carregando = QListWidgetItem("Carregando versões...")
+        self._item_carregando.setFlags(QtCore.Qt.NoItemFlags)
+        self.listWidget_versions.addItem(self._item_carregando)
+
+        loader = ReleasesPageWorker(Config.REPO_FULL_NAME, url, force)
+        loader.page_loaded.connect(self._on_page_loaded)
+        loader.failed.connect(self._on_page_failed)
+        loader.finished.connect(lambda l=loader: VersionsDialog._loaders_em_andamento.discard(l))
+        VersionsDialog._loaders_em_andamento.add(loader)
+        self.loader = loader
+        loader.start()
+
+    def _cancelar_loader(self):
+        if self.loader is not None:
+            self.loader.cancelar()
+            self.loader = None
+
+    def _remover_item_carregando(self):
+        if self._item_carregando is not None:
+            self.listWidget_versions.takeItem(self.listWidget_versions.row(self._item_carregando))
+            self._item_carregando = None
+
+    def _on_page_loaded(self, versions, next_url, origem):
+        """Acrescenta a página recebida à lista."""
+        if self.sender() is not self.loader:
             return
+        self.loader = None
+        self._remover_item_carregando()
         
         for v_info in versions:
             item = QListWidgetItem(v_info["version"])
             # Armazenamos o URL de download como 'data' no item (Role: 1)
             item.setData(1, v_info["download_url"]) 
+            # E a release completa (checksum publicado etc.) no UserRole
+            item.setData(QtCore.Qt.UserRole, v_info)
             self.listWidget_versions.addItem(item)
 
+        self._next_url = next_url or None
+        if self._next_url is None and self.listWidget_versions.count() == 0:
+            QMessageBox.warning(self, "Aviso", f"Nenhuma release com o {Config.TARGET_FILE_NAME} foi encontrada no repositório {Config.REPO_FULL_NAME}.")
+            return
+
+        # Enquanto a lista não tiver barra de rolagem, continua carregando as páginas seguintes
+        QtCore.QTimer.singleShot(0, self._on_scroll)
+
+    def _on_page_failed(self, message):
+        if self.sender() is not self.loader:
+            return
+        self.loader = None
+        self._remover_item_carregando()
+        if self.listWidget_versions.count() == 0:
+            QMessageBox.warning(self, "Aviso", f"Não foi possível carregar as releases do repositório {Config.REPO_FULL_NAME}. Verifique a conexão.\n\n{message}")
+
+    def _on_scroll(self, *args):
+        """Carrega a próxima página quando a rolagem chega perto do fim da lista."""
+        if self.loader is not None or not self._next_url:
+            return
+        barra = self.listWidget_versions.verticalScrollBar()
+        if barra.maximum() == 0 or barra.value() >= barra.maximum() - 2:
+            self._carregar_pagina(self._next_url)
+
+    def done(self, result):
+        """Cancela a busca em andamento ao fechar o diálogo."""
+        self._cancelar_loader()
+        super().done(result)
+
     def start_update(self):
         """Prepara e inicia a thread de download, validando se uma versão foi selecionada."""
         
@@ -332,25 +2190,81 @@ class VersionsDialog(QDialog):
         if final_msg.clickedButton() == btn_sim:
             
             # Feedback visual e desabilita botões
-            self.btn_download.setEnabled(False)
-            self.listWidget_versions.setEnabled(False)
             self.lbl_status_download.setText(f"Status: Iniciando download do vmd-api-hub-{version}...")
-            
-            # Cria e inicia a Thread
-            self.thread = DownloadWorker(download_url, Config.TARGET_FILE_NAME, self)
-            self.thread.progress_signal.connect(self.update_download_status)
-            self.thread.finished_signal.connect(self.download_finished)
-            self.thread.start()
+            self._iniciar_worker(download_url, item.data(QtCore.Qt.UserRole))
+
+    def _iniciar_worker(self, download_url, version_info):
+        """Desabilita os botões e inicia a thread de atualização."""
+        self.btn_download.setEnabled(False)
+        self.btn_rollback.setEnabled(False)
+        self.listWidget_versions.setEnabled(False)
+
+        # Cria e inicia a Thread
+        backend = getattr(self.parent(), "service_backend", None)
+        self.thread = DownloadWorker(download_url, Config.TARGET_FILE_NAME, backend, self, version_info=version_info)
+        self.thread.progress_signal.connect(self.update_download_status)
+        self.thread.stage_signal.connect(self.update_stage_status)
+        self.thread.finished_signal.connect(self.download_finished)
+        self.thread.start()
+
+    def start_rollback(self):
+        """Volta para uma versão do armazém local, sem download."""
+        store = ArtifactStore()
+        instalado = (store.installed or {}).get("digest")
+        artefatos = [a for a in store.list() if a["digest"] != instalado]
+        if not artefatos:
+            QMessageBox.information(self, "Aviso", "Não há versões anteriores no armazém local.")
+            return
+
+        opcoes = [
+            f"{a['version']} — {a.get('size', 0) / (1024 * 1024):.1f} MB — usada em "
+            f"{time.strftime('%d/%m/%Y %H:%M', time.localtime(a.get('last_used', 0)))}"
+            for a in artefatos
+        ]
+        escolha, ok = QtWidgets.QInputDialog.getItem(
+            self, "Reverter Versão", "Selecione a versão para restaurar (sem download):", opcoes, 0, False
+        )
+        if not ok:
+            return
+        artefato = artefatos[opcoes.index(escolha)]
+
+        confirm_msg = QMessageBox(self)
+        confirm_msg.setStyleSheet(self.styleSheet())
+        confirm_msg.setWindowTitle('⚠️ Confirmação de Reversão')
+        confirm_msg.setText(f"O executável vmd-api-hub será substituído pela versão {artefato['version']} do armazém local. Você tem certeza disso?")
+        confirm_msg.setIcon(QMessageBox.Warning)
+        btn_sim = confirm_msg.addButton("SIM", QMessageBox.YesRole)
+        confirm_msg.addButton("NÃO", QMessageBox.NoRole)
+        confirm_msg.exec_()
+
+        if confirm_msg.clickedButton() == btn_sim:
+            self.lbl_status_download.setText(f"Status: Revertendo para a versão {artefato['version']}...")
+            self._iniciar_worker(None, {"version": artefato["version"], "artifact_digest": artefato["digest"]})
         
-    def update_download_status(self, progress: int):
-        """Atualiza o label de status com o progresso (em porcentagem)."""
-        self.lbl_status_download.setText(f"Status: Baixando... {progress}% concluído")
+    def update_stage_status(self, etapa: str):
+        """Mostra a etapa atual da atualização."""
+        self.lbl_status_download.setText(f"Status: {etapa}")
+
+    def update_download_status(self, progress: int, bytes_por_segundo: float, eta: float, decorrido: float):
+        """Atualiza o label de status com o progresso, a velocidade e o tempo restante."""
+        texto = f"Status: Baixando... {progress}% concluído — {bytes_por_segundo / (1024 * 1024):.1f} MB/s"
+        if eta >= 0:
+            texto += f" — restam {formatar_duracao(eta)}"
+        texto += f" (decorrido {formatar_duracao(decorrido)})"
+        self.lbl_status_download.setText(texto)
 
     def download_finished(self, success: bool, message: str):
         """Trata o resultado da thread de download."""
         self.btn_download.setEnabled(True) # Reabilita o botão
+        self.btn_rollback.setEnabled(True)
         self.listWidget_versions.setEnabled(True)
         self.lbl_status_download.setText("Status: Concluído.")
+
+        # Latência da rede nesta atualização (GitHub e download), no log e na dica do status
+        rede = http_client.resumo_texto()
+        if rede:
+            print(f"Rede (últimas requisições):\n{rede}")
+            self.lbl_status_download.setToolTip(rede)
         
         if success:
             QMessageBox.information(
@@ -369,6 +2283,117 @@ class VersionsDialog(QDialog):
             )
             
 
+class SqlServerUnreachableError(Exception):
+    """O servidor não respondeu à sondagem (etapa 'dns' ou 'tcp') antes da conexão ODBC."""
+
+    def __init__(self, etapa, mensagem, tempos):
+        super().__init__(mensagem)
+        self.etapa = etapa
+        self.tempos = tempos
+
+
+# Códigos de connect_ex para conexão não bloqueante ainda em andamento (POSIX e Winsock)
+_CONEXAO_EM_ANDAMENTO = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", 10035)}
+
+# os.strerror não conhece os códigos Winsock ("Unknown error" no Windows)
+_ERROS_WINSOCK = {
+    10013: "acesso negado", 10051: "rede inacessível", 10060: "tempo esgotado",
+    10061: "conexão recusada", 10064: "host fora do ar", 10065: "host inacessível",
+}
+
+
+def _descrever_erro_socket(erro):
+    texto = _ERROS_WINSOCK.get(erro) or os.strerror(erro)
+    return f"{texto} [{erro}]"
+
+_dns_cache = {}
+_dns_cache_lock = threading.Lock()
+
+
+def resolver_host(host, port, ttl=None):
+    """Resolve host:porta (getaddrinfo) com um pequeno cache em memória válido por `ttl` segundos."""
+    ttl = Config.DB_DNS_CACHE_TTL if ttl is None else ttl
+    chave = (host.lower(), int(port))
+    agora = time.monotonic()
+    with _dns_cache_lock:
+        entrada = _dns_cache.get(chave)
+        if entrada and entrada[0] > agora:
+            return entrada[1]
+
+    enderecos = []
+    for family, socktype, proto, _, sockaddr in socket.getaddrinfo(host, int(port), type=socket.SOCK_STREAM):
+        if (family, sockaddr) not in [(f, a) for f, _, _, a in enderecos]:
+            enderecos.append((family, socktype, proto, sockaddr))
+
+    with _dns_cache_lock:
+        _dns_cache[chave] = (agora + ttl, enderecos)
+    return enderecos
+
+
+def sondar_sql_server(host, port=None, timeout=None):
+    """Resolve o host e abre uma conexão TCP não bloqueante com prazo até a porta do SQL Server.
+
+    Retorna {"dns": s, "tcp": s}; lança SqlServerUnreachableError com a etapa que falhou.
+    Instâncias nomeadas sem porta (HOST\\INSTANCIA) usam porta dinâmica: só o DNS é testado.
+    """
+    timeout = Config.DB_PROBE_TIMEOUT if timeout is None else timeout
+    nome, _, instancia = host.partition("\\")
+    tempos = {"dns": None, "tcp": None}
+    if port and not str(port).isdigit():
+        raise SqlServerUnreachableError("tcp", f"Porta inválida: '{port}'.", tempos)
+
+    inicio = time.perf_counter()
+    try:
+        enderecos = resolver_host(nome, port or Config.DB_DEFAULT_PORT)
+    except (socket.gaierror, UnicodeError) as e:
+        tempos["dns"] = time.perf_counter() - inicio
+        raise SqlServerUnreachableError("dns", f"Não foi possível resolver o servidor '{nome}': {e}", tempos)
+    tempos["dns"] = time.perf_counter() - inicio
+
+    if instancia and not port:
+        return tempos
+
+    inicio = time.perf_counter()
+    prazo = inicio + timeout
+    ultimo_erro = None
+    for family, socktype, proto, sockaddr in enderecos:
+        restante = prazo - time.perf_counter()
+        if restante <= 0:
+            break
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setblocking(False)
+            erro = sock.connect_ex(sockaddr)
+            if erro not in _CONEXAO_EM_ANDAMENTO:
+                ultimo_erro = _descrever_erro_socket(erro)
+                continue
+            # O Winsock sinaliza a falha de um connect não bloqueante só no conjunto de exceções
+            _, gravaveis, falhas = select.select([], [sock], [sock], restante)
+            if not gravaveis and not falhas:
+                ultimo_erro = "tempo esgotado"
+                continue
+            erro = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if erro or falhas:
+                ultimo_erro = _descrever_erro_socket(erro) if erro else "conexão recusada"
+                continue
+            tempos["tcp"] = time.perf_counter() - inicio
+            return tempos
+        finally:
+            sock.close()
+
+    tempos["tcp"] = time.perf_counter() - inicio
+    porta = port or Config.DB_DEFAULT_PORT
+    raise SqlServerUnreachableError(
+        "tcp", f"O servidor '{nome}' não aceitou conexão na porta {porta} ({ultimo_erro or 'tempo esgotado'}).", tempos
+    )
+
+
+def formatar_tempos_conexao(tempos: dict) -> str:
+    """Formata os tempos de cada etapa da conexão ao banco (ex.: 'DNS 3 ms · TCP 12 ms · login 840 ms')."""
+    rotulos = (("dns", "DNS"), ("tcp", "TCP"), ("login", "login"), ("consulta", "consulta"))
+    return " · ".join(f"{rotulo} {tempos[chave] * 1000:.0f} ms" for chave, rotulo in rotulos if tempos.get(chave) is not None)
+
+
 class DatabaseValidator:
     def __init__(self, host, port, db, user, pwd):
         self.host = host
@@ -376,6 +2401,40 @@ class DatabaseValidator:
         self.db = db
         self.user = user
         self.pwd = pwd
+        # Tempos (s) de cada etapa da última validação: dns, tcp, login e consulta
+        self.tempos = {}
+        self._cancelado = threading.Event()
+        self._cursor = None
+
+    def cancelar(self):
+        """Interrompe a validação: a consulta em andamento é cancelada e as etapas seguintes não rodam."""
+        self._cancelado.set()
+        cursor = self._cursor
+        if cursor is not None:
+            try:
+                cursor.cancel()
+            except Exception:
+                pass
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def connection_string(self):
+        hostport = f"{self.host},{self.port}" if self.port else self.host
+        return f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={hostport};DATABASE={self.db};UID={self.user};PWD={self.pwd};TrustServerCertificate=yes"
+
+    @staticmethod
+    def build_validation_query(validations):
+        """Monta um único SELECT que testa a existência de cada código (EXISTS para no primeiro registro).
+
+        Retorna (sql, parâmetros); cada linha do resultado é (índice da validação, 1/0).
+        """
+        partes = [
+            f"SELECT {i} AS idx, CASE WHEN EXISTS (SELECT 1 FROM {table} WHERE {column} = ?) THEN 1 ELSE 0 END AS existe"
+            for i, (_, table, column, _) in enumerate(validations)
+        ]
+        return "\nUNION ALL\n".join(partes), [value for value, _, _, _ in validations]
 
     def check_connection_and_codes(self, cod_vendedor, cod_produto_servico, cod_produto_entrega, pagamento_entrega, pagamento_online):
         
@@ -389,12 +2448,23 @@ class DatabaseValidator:
         
         conn = None
         cursor = None
+        self.tempos = {}
         try:
-            # Tenta estabelecer a conexão
-            hostport = f"{self.host},{self.port}" if self.port else self.host
-            conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={hostport};DATABASE={self.db};UID={self.user};PWD={self.pwd};TrustServerCertificate=yes"
-            conn = pyodbc.connect(conn_str, timeout=5)
-            cursor = conn.cursor()
+            # Sonda DNS e porta TCP antes do ODBC: erros de digitação falham em milissegundos
+            self.tempos.update(sondar_sql_server(self.host, self.port))
+            if self.cancelado:
+                return False, "Validação cancelada."
+
+            # Tenta estabelecer a conexão (TLS + login)
+            conn_str = self.connection_string()
+            inicio = time.perf_counter()
+            try:
+                conn = pyodbc.connect(conn_str, timeout=Config.DB_LOGIN_TIMEOUT)
+            finally:
+                self.tempos["login"] = time.perf_counter() - inicio
+            if self.cancelado:
+                return False, "Validação cancelada."
+            cursor = self._cursor = conn.cursor()
 
             # Estrutura de validação (Código, Tabela, Coluna, Mensagem de Erro)
             validations = [
@@ -405,277 +2475,2895 @@ class DatabaseValidator:
                 (pagamento_online, "FPGCB", "COD_FORPAG", f"Pagamento Online (PAGAMENTO_ONLINE={pagamento_online})"),
             ]
             
-            # Executa as validações
-            for value, table, column, error_msg in validations:
-                query = f"SELECT COUNT(*) FROM {table} WHERE {column} = ?"
-                cursor.execute(query, value)
-                count = cursor.fetchone()[0]
+            # Executa todas as validações em uma única ida ao banco (UNION ALL de EXISTS)
+            inicio = time.perf_counter()
+            cursor.execute(*self.build_validation_query(validations))
+            encontrados = {int(idx): bool(existe) for idx, existe in cursor.fetchall()}
+            self.tempos["consulta"] = time.perf_counter() - inicio
+            print(f"Validação do banco: {formatar_tempos_conexao(self.tempos)}")
+
+            # Reporta todos os códigos ausentes de uma vez
+            faltando = [error_msg for i, (_, _, _, error_msg) in enumerate(validations) if not encontrados.get(i)]
+            if faltando:
+                lista = "\n".join(f"- {msg}" for msg in faltando)
+                titulo = "O código não foi encontrado" if len(faltando) == 1 else "Os códigos não foram encontrados"
+                return False, f"{titulo} no banco de dados:\n\n{lista}"
+
+            # Se chegou até aqui, todas as validações passaram
+            return True, None
+
+        except SqlServerUnreachableError as e:
+            self.tempos.update(e.tempos)
+            return False, f"Servidor de banco de dados inacessível. Verifique o nome do servidor e a porta:\n\n{e}\n\n({formatar_tempos_conexao(self.tempos)})"
+        except pyodbc.Error as e:
+            return False, f"Falha durante a validação no banco de dados. Verifique os dados de conexão ou as permissões:\n\n{e}\n\n({formatar_tempos_conexao(self.tempos)})"
+        except Exception as e:
+            return False, f"Ocorreu um erro inesperado durante a validação:\n\n{e}"
+        finally:
+            self._cursor = None
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+
+class DatabaseValidationWorker(QThread):
+    """Worker que valida conexão e códigos fora da thread da interface.
+
+    Validações bem-sucedidas ficam em cache por DB_VALIDATION_CACHE_TTL segundos para os
+    mesmos dados (host, porta, banco, usuário, senha e códigos).
+    """
+    # Sinal emitido ao terminar (válido, mensagem de erro ou "")
+    finished_signal = pyqtSignal(bool, str)
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, host, port, db, user, pwd, codigos, parent=None):
+        super().__init__(parent)
+        self.validator = DatabaseValidator(host, port, db, user, pwd)
+        self.codigos = tuple(codigos)
+        # A senha entra na chave apenas como hash
+        self.chave = (host.lower(), port, db.lower(), user.lower(),
+                      hashlib.sha256(pwd.encode("utf-8")).hexdigest(), self.codigos)
+
+    def cancelar(self):
+        """Cancela a validação e descarta o resultado (um connect em andamento termina pelo timeout)."""
+        self.validator.cancelar()
+
+    @classmethod
+    def em_cache(cls, chave):
+        with cls._cache_lock:
+            validade = cls._cache.get(chave)
+            if validade and validade > time.monotonic():
+                return True
+            cls._cache.pop(chave, None)
+            return False
+
+    def run(self):
+        if self.em_cache(self.chave):
+            print("Validação do banco: resultado em cache.")
+            self.finished_signal.emit(True, "")
+            return
+
+        ok, erro = self.validator.check_connection_and_codes(*self.codigos)
+        if self.validator.cancelado:
+            return
+        if ok:
+            with self._cache_lock:
+                self._cache[self.chave] = time.monotonic() + Config.DB_VALIDATION_CACHE_TTL
+        self.finished_signal.emit(ok, erro or "")
+
+
+class CodeIndex:
+    """Índice compacto e ordenado dos códigos (e descrições) de uma tabela, para autocompletar.
+
+    Prefixo do código: busca binária na lista ordenada. Substring (código ou descrição):
+    str.find sobre um único texto em minúsculas, com os inícios de linha em um array.
+    """
+
+    def __init__(self, codigos, descricoes):
+        linhas = sorted(zip(codigos, descricoes))
+        self.codigos = [c for c, _ in linhas]
+        self.descricoes = [d for _, d in linhas]
+        partes = [f"{c} {d}".lower() for c, d in linhas]
+        self._texto = "\n".join(partes)
+        self._inicios = array("L", itertools.accumulate(itertools.chain((0,), (len(p) + 1 for p in partes[:-1]))))
+
+    @classmethod
+    def from_rows(cls, linhas):
+        """Monta o índice a partir de linhas (código, descrição) vindas do banco."""
+        codigos, descricoes = [], []
+        for cod, desc in linhas:
+            if cod is None:
+                continue
+            codigos.append(str(cod).strip())
+            descricoes.append(str(desc).strip() if desc is not None else "")
+        return cls(codigos, descricoes)
+
+    def to_dict(self):
+        return {"codigos": self.codigos, "descricoes": self.descricoes}
+
+    @classmethod
+    def from_dict(cls, dados):
+        return cls(dados.get("codigos", []), dados.get("descricoes", []))
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def descricao(self, codigo):
+        """Descrição do código exato, ou None se ele não estiver no índice."""
+        i = bisect.bisect_left(self.codigos, codigo)
+        if i < len(self.codigos) and self.codigos[i] == codigo:
+            return self.descricoes[i]
+        return None
+
+    def buscar(self, texto, limite=None):
+        """Sugestões (código, descrição): primeiro códigos com o prefixo, depois substrings."""
+        limite = Config.CODE_INDEX_MAX_SUGGESTIONS if limite is None else limite
+        texto = texto.strip()
+        if not texto or not self.codigos:
+            return []
+
+        encontrados = []
+        vistos = set()
+        i = bisect.bisect_left(self.codigos, texto)
+        while i < len(self.codigos) and self.codigos[i].startswith(texto) and len(encontrados) < limite:
+            encontrados.append(i)
+            vistos.add(i)
+            i += 1
+
+        alvo = texto.lower()
+        pos = self._texto.find(alvo)
+        while pos != -1 and len(encontrados) < limite:
+            linha = bisect.bisect_right(self._inicios, pos) - 1
+            if linha not in vistos:
+                encontrados.append(linha)
+                vistos.add(linha)
+            proxima = self._inicios[linha + 1] if linha + 1 < len(self._inicios) else len(self._texto)
+            pos = self._texto.find(alvo, proxima)
+
+        return [(self.codigos[i], self.descricoes[i]) for i in encontrados]
+
+
+class CodeIndexLoader(QThread):
+    """Worker que carrega os índices de códigos (VENDE, PRODU, FPGCB) em segundo plano.
+
+    Usa primeiro o índice salvo em disco; se ele estiver vencido (CODE_INDEX_TTL) ou não
+    existir, lê as tabelas em lotes (fetchmany) e grava o índice novo.
+    """
+    # Sinal emitido por tabela carregada (tabela, CodeIndex, origem: "cache" ou "banco")
+    index_loaded = pyqtSignal(str, object, str)
+    # Sinal emitido em caso de falha ao ler do banco (mensagem)
+    failed = pyqtSignal(str)
+
+    def __init__(self, host, port, db, user, pwd, parent=None):
+        super().__init__(parent)
+        self.validator = DatabaseValidator(host, port, db, user, pwd)
+        chave = hashlib.sha256(f"{host}|{port}|{db}".lower().encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(Config.get_cache_dir(), f"codigos-{chave}.json")
+        self._cancelado = False
+
+    def cancelar(self):
+        """Interrompe a carga no próximo lote e descarta o resultado."""
+        self._cancelado = True
+
+    def _ler_cache(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if isinstance(dados, dict) and isinstance(dados.get("tabelas"), dict):
+                return dados
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _gravar_cache(self, tabelas):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"gerado_em": time.time(), "tabelas": tabelas}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Não foi possível gravar o índice de códigos: {e}")
+
+    def _ler_tabela(self, cursor, tabela, col_codigo, col_descricao):
+        try:
+            cursor.execute(f"SELECT {col_codigo}, {col_descricao} FROM {tabela}")
+        except pyodbc.Error:
+            # Coluna de descrição inexistente nesta base: indexa só os códigos
+            cursor.execute(f"SELECT {col_codigo}, NULL FROM {tabela}")
+
+        linhas = []
+        while not self._cancelado:
+            lote = cursor.fetchmany(Config.CODE_INDEX_BATCH)
+            if not lote:
+                break
+            linhas.extend((linha[0], linha[1]) for linha in lote)
+        return CodeIndex.from_rows(linhas)
+
+    def run(self):
+        dados = self._ler_cache()
+        if dados:
+            for tabela, indice in dados["tabelas"].items():
+                if self._cancelado:
+                    return
+                self.index_loaded.emit(tabela, CodeIndex.from_dict(indice), "cache")
+            if time.time() - dados.get("gerado_em", 0) < Config.CODE_INDEX_TTL:
+                return
+
+        conn = None
+        tabelas = {}
+        try:
+            sondar_sql_server(self.validator.host, self.validator.port)
+            conn = pyodbc.connect(self.validator.connection_string(), timeout=Config.DB_LOGIN_TIMEOUT)
+            cursor = conn.cursor()
+            cursor.arraysize = Config.CODE_INDEX_BATCH
+            for tabela, (col_codigo, col_descricao) in Config.CODE_INDEX_TABLES.items():
+                inicio = time.perf_counter()
+                indice = self._ler_tabela(cursor, tabela, col_codigo, col_descricao)
+                if self._cancelado:
+                    return
+                print(f"Índice de códigos {tabela}: {len(indice)} registros em {time.perf_counter() - inicio:.1f}s")
+                tabelas[tabela] = indice.to_dict()
+                self.index_loaded.emit(tabela, indice, "banco")
+        except (SqlServerUnreachableError, pyodbc.Error) as e:
+            if not self._cancelado:
+                self.failed.emit(str(e))
+            return
+        finally:
+            if conn:
+                conn.close()
+
+        self._gravar_cache(tabelas)
+
+
+class CodeCompleter(QtWidgets.QCompleter):
+    """Completer cujas sugestões são 'código — descrição', mas que insere só o código no campo."""
+
+    SEPARADOR = " — "
+
+    def pathFromIndex(self, index):
+        return (index.data() or "").split(self.SEPARADOR, 1)[0]
+
+
+class EnvDocument:
+    """Arquivo .env carregado sem perdas: comentários, ordem, aspas e quebras de linha são mantidos.
+
+    Cada linha é guardada como texto bruto; linhas CHAVE=valor também guardam onde o valor
+    começa e termina, com um índice chave -> linha para get/set em O(1). Sem alterações, o
+    arquivo é serializado de volta byte a byte.
+    """
+
+    _ATRIBUICAO_RE = re.compile(r"^([ \t]*(?:export[ \t]+)?)([A-Za-z_][A-Za-z0-9_.-]*)([ \t]*=[ \t]*)")
+    _BOM = "\ufeff"
+    # Aspas aceitas pelo dotenv, na ordem de preferência (o dotenv não tem escape de aspas)
+    _ASPAS = ('"', "'", "`")
+    # Chaves gravadas sempre entre aspas, como no modelo original do .env
+    SEMPRE_ENTRE_ASPAS = {"DATABASE_URL"}
+
+    class _Linha:
+        __slots__ = ("texto", "chave", "inicio", "fim", "aspas")
+
+        def __init__(self, texto, chave=None, inicio=0, fim=0, aspas=""):
+            self.texto = texto
+            self.chave = chave
+            self.inicio = inicio
+            self.fim = fim
+            self.aspas = aspas
+
+    def __init__(self, texto=""):
+        # (mtime_ns, tamanho, sha256) do arquivo no momento da leitura; None se não veio de disco
+        self.assinatura = None
+        self.bom = texto.startswith(self._BOM)
+        if self.bom:
+            texto = texto[1:]
+        self._linhas = [self._analisar(linha) for linha in re.findall(r"[^\n]*\n|[^\n]+$", texto)]
+        self.newline = "\r\n" if self._linhas and self._linhas[0].texto.endswith("\r\n") else "\n"
+        # Em chaves repetidas vale a última ocorrência (como no dotenv)
+        self._indice = {linha.chave: i for i, linha in enumerate(self._linhas) if linha.chave}
+
+    @classmethod
+    def load(cls, path):
+        """Lê o arquivo (UTF-8); um arquivo inexistente vira um documento vazio."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            dados = f.read()
+        doc = cls(dados.decode("utf-8"))
+        doc.assinatura = (st.st_mtime_ns, st.st_size, hashlib.sha256(dados).hexdigest())
+        return doc
+
+    def modificado_externamente(self, path):
+        """True se o arquivo mudou em disco desde o load (stat primeiro; hash só se o stat diferir)."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return self.assinatura is not None
+        if self.assinatura is None:
+            return True
+        mtime_ns, tamanho, digest = self.assinatura
+        if (st.st_mtime_ns, st.st_size) == (mtime_ns, tamanho):
+            return False
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest() != digest
+
+    @classmethod
+    def _analisar(cls, texto):
+        m = cls._ATRIBUICAO_RE.match(texto)
+        if not m or texto.lstrip().startswith("#"):
+            return cls._Linha(texto)
+
+        inicio = m.end()
+        conteudo = texto.rstrip("\r\n")
+        aspas = conteudo[inicio:inicio + 1]
+        if aspas and aspas in cls._ASPAS:
+            fechamento = conteudo.find(aspas, inicio + 1)
+            if fechamento != -1:
+                return cls._Linha(texto, m.group(2), inicio + 1, fechamento, aspas)
+
+        # Sem aspas: comentário só começa em '#' precedido de espaço (senhas podem conter '#')
+        fim = len(conteudo)
+        comentario = re.search(r"\s#", conteudo[inicio:])
+        if comentario:
+            fim = inicio + comentario.start()
+        while fim > inicio and conteudo[fim - 1] in " \t":
+            fim -= 1
+        return cls._Linha(texto, m.group(2), inicio, fim, "")
+
+    def __contains__(self, key):
+        return key in self._indice
+
+    def keys(self):
+        return list(self._indice)
+
+    def get(self, key, default=None):
+        """Valor da chave, sem aspas e sem comentário em linha."""
+        i = self._indice.get(key)
+        if i is None:
+            return default
+        linha = self._linhas[i]
+        return linha.texto[linha.inicio:linha.fim]
+
+    def set(self, key, value):
+        """Altera o valor mantendo o resto da linha (aspas originais e comentário); chaves novas vão ao fim.
+
+        Levanta ValueError para valores que o dotenv não consegue ler de volta (ver verificar_valor).
+        """
+        value = str(value)
+        self.verificar_valor(value)
+        forcar = key in self.SEMPRE_ENTRE_ASPAS
+        i = self._indice.get(key)
+        if i is None:
+            if self._linhas and not self._linhas[-1].texto.endswith("\n"):
+                self._linhas[-1].texto += self.newline
+            self._linhas.append(self._analisar(f"{key}={self._citar(value, forcar)}{self.newline}"))
+            self._indice[key] = len(self._linhas) - 1
+            return
+
+        linha = self._linhas[i]
+        if linha.texto[linha.inicio:linha.fim] == value:
+            return
+        inicio, fim = linha.inicio, linha.fim
+        if not linha.aspas:
+            value = self._citar(value, forcar)
+        elif linha.aspas in value:
+            # O valor contém as aspas originais: troca o tipo de aspas em vez de cortar o valor
+            value = self._citar(value)
+            inicio, fim = inicio - 1, fim + 1
+        self._linhas[i] = self._analisar(linha.texto[:inicio] + value + linha.texto[fim:])
+
+    def update(self, valores):
+        for key, value in valores.items():
+            self.set(key, value)
+
+    @classmethod
+    def verificar_valor(cls, value):
+        """Levanta ValueError se o valor não pode ser gravado de forma que o dotenv o leia igual."""
+        if "\n" in value or "\r" in value:
+            raise ValueError("O valor não pode conter quebras de linha.")
+        if all(aspas in value for aspas in cls._ASPAS):
+            raise ValueError(
+                "O valor contém aspas duplas, aspas simples e crase ao mesmo tempo e não pode ser gravado no .env."
+            )
+
+    @classmethod
+    def _citar(cls, value, forcar=False):
+        """Coloca entre aspas os valores que o dotenv leria diferente sem elas.
+
+        Sem aspas, o dotenv corta o valor no primeiro '#' e remove espaços das pontas; aspas no
+        valor também exigem aspas externas de outro tipo, pois não há escape.
+        """
+        if not forcar and value == value.strip() and not any(c in value for c in "#" + "".join(cls._ASPAS)):
+            return value
+        aspas = next(a for a in cls._ASPAS if a not in value)
+        return aspas + value + aspas
+
+    def dumps(self):
+        return (self._BOM if self.bom else "") + "".join(linha.texto for linha in self._linhas)
+
+    def save(self, path):
+        """Grava de forma atômica (arquivo temporário + fsync + os.replace).
+
+        Retorna False sem tocar no arquivo quando o conteúdo em disco já é idêntico.
+        """
+        dados = self.dumps().encode("utf-8")
+        digest = hashlib.sha256(dados).hexdigest()
+        try:
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == digest:
+                    return False
+        except FileNotFoundError:
+            pass
+
+        pasta = os.path.dirname(path) or "."
+        os.makedirs(pasta, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".env.", suffix=".tmp", dir=pasta)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dados)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        st = os.stat(path)
+        self.assinatura = (st.st_mtime_ns, st.st_size, digest)
+        return True
+
+
+class EnvEditorDialog(QDialog):
+
+    # Mantém os workers vivos até terminarem, mesmo que o diálogo seja fechado antes
+    _workers_em_andamento = set()
+    
+    def __init__(self, env_path, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Editar configurações")
+        self.env_path = env_path
+        # Documento lido em _load_values; usado no salvamento para detectar edições externas
+        self.documento = None
+        self.validation_worker = None
+        self.code_loader = None
+        self._indices = {}
+        self._chave_indices = None
+
+        try:
+            self.setFixedSize(600, 330)
+        except Exception:
+            pass
+
+        # 1. Crie o layout principal (QGridLayout)
+        layout = QGridLayout(self)
+
+        # 2. Crie todos os widgets ANTES de adicioná-los ao layout
+        self.hostname = QLineEdit()
+        self.porta = QLineEdit()
+        self.banco = QLineEdit()
+        self.usuario = QLineEdit()
+        self.senha = QLineEdit()
+        self.senha.setEchoMode(QLineEdit.Password) 
+        self.cod_vendedor = QLineEdit()
+        self.cod_produto_servico = QLineEdit()
+        self.cod_produto_entrega = QLineEdit()
+        self.pagamento_entrega = QLineEdit()
+        self.pagamento_online = QLineEdit()
+        self.email = QLineEdit() 
+
+        # ------------------------------------------------------------------
+        # ORGANIZAÇÃO EM GRADE (4 COLUNAS)
+        # ------------------------------------------------------------------
+
+        linha = 0
+        layout.addWidget(QLabel("Nome do Servidor"), linha, 0)
+        layout.addWidget(self.hostname, linha, 1)
+        layout.addWidget(QLabel("Vendedor Padrão"), linha, 2)
+        layout.addWidget(self.cod_vendedor, linha, 3)
+
+        linha += 1
+        layout.addWidget(QLabel("Porta"), linha, 0)
+        layout.addWidget(self.porta, linha, 1)
+        layout.addWidget(QLabel("Produto do tipo 'Serviço' "), linha, 2)
+        layout.addWidget(self.cod_produto_servico, linha, 3)
+
+        linha += 1
+        layout.addWidget(QLabel("Banco de Dados"), linha, 0)
+        layout.addWidget(self.banco, linha, 1)
+        layout.addWidget(QLabel("Produto do tipo 'Entrega' "), linha, 2)
+        layout.addWidget(self.cod_produto_entrega, linha, 3)
+
+        linha += 1
+        layout.addWidget(QLabel("Usuário"), linha, 0)
+        layout.addWidget(self.usuario, linha, 1)
+        layout.addWidget(QLabel("Forma Pgto - Entrega"), linha, 2)
+        layout.addWidget(self.pagamento_entrega, linha, 3)
+
+        linha += 1
+        layout.addWidget(QLabel("Senha"), linha, 0)
+        layout.addWidget(self.senha, linha, 1)
+        layout.addWidget(QLabel("Forma Pgto - Aplicativo"), linha, 2)
+        layout.addWidget(self.pagamento_online, linha, 3)
+
+        # ------------------------------------------------------------------
+        # CAMPO EMAIL
+        # ------------------------------------------------------------------
+
+        linha += 1
+        layout.addWidget(QLabel("E-mail"), linha, 0)
+        layout.addWidget(self.email, linha, 1, 1, 3)
+
+        # ------------------------------------------------------------------
+        # CONFIGURAÇÃO DE LAYOUT E ESTILO
+        # ------------------------------------------------------------------
+        layout.setColumnStretch(1, 1)
+        layout.setColumnStretch(3, 1)
+
+        self.setStyleSheet("""
+        QLineEdit {
+            border-radius: 5px; 
+            padding: 5px;
+            border: 1px solid #cccccc; 
+        }
+        """)
+
+        # QDialogButtonBox
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok ) 
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        buttons.setCenterButtons(True) 
+
+        ok_button = buttons.button(QDialogButtonBox.Ok)
+
+        if ok_button:
+            ok_button.setText("Salvar")
+            ok_button.setFixedSize(500, 35) 
+            ok_button.setStyleSheet("""
+                QPushButton {
+                    background-color: #4CAF50;
+                    color: white;
+                    border: none;
+                    border-radius: 6px;
+                    font-size: 14px;
+                    font-weight: bold;
+                }
+                QPushButton:hover {
+                    background-color: #45A049;
+                }
+                QPushButton:pressed {
+                    background-color: #3E8E41;
+                }
+            """)
+
+        self.ok_button = ok_button
+        self.buttons = buttons
+
+        # Estado da validação em segundo plano ("Validando…" + botão para cancelar)
+        self.lbl_validacao = QLabel("")
+        self.lbl_validacao.setStyleSheet("color: #555555;")
+        self.btn_cancelar_validacao = QPushButton("Cancelar validação")
+        self.btn_cancelar_validacao.clicked.connect(self.cancelar_validacao)
+        self.btn_cancelar_validacao.hide()
+
+        validacao_layout = QtWidgets.QHBoxLayout()
+        validacao_layout.addWidget(self.lbl_validacao, 1)
+        validacao_layout.addWidget(self.btn_cancelar_validacao)
+
+        linha += 1
+        layout.addLayout(validacao_layout, linha, 0, 1, 4)
+
+        botoes_layout = QtWidgets.QHBoxLayout()
+        botoes_layout.addWidget(buttons)
+
+        linha += 1
+        layout.addLayout(botoes_layout, linha, 0, 1, 4)
+
+        self._load_values()
+
+        # Autocompletar dos códigos a partir do índice carregado em segundo plano
+        self._campos_codigo = {
+            self.cod_vendedor: "VENDE",
+            self.cod_produto_servico: "PRODU",
+            self.cod_produto_entrega: "PRODU",
+            self.pagamento_entrega: "FPGCB",
+            self.pagamento_online: "FPGCB",
+        }
+        for campo, tabela in self._campos_codigo.items():
+            self._ligar_autocompletar(campo, tabela)
+        for campo in (self.hostname, self.porta, self.banco, self.usuario, self.senha):
+            campo.editingFinished.connect(self._carregar_indices)
+        self._carregar_indices()
+
+    def _ligar_autocompletar(self, campo, tabela):
+        modelo = QtCore.QStringListModel(self)
+        completer = CodeCompleter(modelo, self)
+        completer.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        completer.setMaxVisibleItems(12)
+        campo.setCompleter(completer)
+        campo.textEdited.connect(lambda texto, t=tabela, m=modelo: self._sugerir(t, m, texto))
+        campo.textChanged.connect(lambda texto, c=campo, t=tabela: self._mostrar_descricao(c, t, texto))
+
+    def _sugerir(self, tabela, modelo, texto):
+        indice = self._indices.get(tabela)
+        sugestoes = indice.buscar(texto) if indice else []
+        modelo.setStringList([f"{cod}{CodeCompleter.SEPARADOR}{desc}" if desc else cod for cod, desc in sugestoes])
+
+    def _mostrar_descricao(self, campo, tabela, texto):
+        indice = self._indices.get(tabela)
+        descricao = indice.descricao(texto.strip()) if indice else None
+        campo.setToolTip(descricao or "")
+
+    def _carregar_indices(self):
+        """(Re)carrega os índices de códigos quando os dados de conexão mudam."""
+        host = self.hostname.text().strip()
+        port = self.porta.text().strip()
+        db = self.banco.text().strip()
+        user = self.usuario.text().strip()
+        pwd = self.senha.text().strip()
+        if not (host and db and user and pwd):
+            return
+        chave = (host.lower(), port, db.lower(), user.lower(), pwd)
+        if chave == self._chave_indices:
+            return
+        self._chave_indices = chave
+
+        if self.code_loader is not None:
+            self.code_loader.cancelar()
+        loader = CodeIndexLoader(host, port, db, user, pwd)
+        loader.index_loaded.connect(self._on_indice_carregado)
+        loader.failed.connect(lambda erro: print(f"Índice de códigos indisponível: {erro}"))
+        loader.finished.connect(lambda l=loader: EnvEditorDialog._workers_em_andamento.discard(l))
+        EnvEditorDialog._workers_em_andamento.add(loader)
+        self.code_loader = loader
+        loader.start()
+
+    def _on_indice_carregado(self, tabela, indice, origem):
+        if self.sender() is not self.code_loader:
+            return
+        self._indices[tabela] = indice
+        for campo, t in self._campos_codigo.items():
+            if t == tabela:
+                self._mostrar_descricao(campo, tabela, campo.text())
+
+    def validate_and_save(self):
+        # 1. Obter dados do formulário
+        host = self.hostname.text().strip()
+        port = self.porta.text().strip()
+        db = self.banco.text().strip()
+        user = self.usuario.text().strip()
+        pwd = self.senha.text().strip()
+
+        cod_vendedor = self.cod_vendedor.text().strip()
+        cod_produto_servico = self.cod_produto_servico.text().strip()
+        cod_produto_entrega = self.cod_produto_entrega.text().strip()
+        pagamento_entrega = self.pagamento_entrega.text().strip()
+        pagamento_online = self.pagamento_online.text().strip()
+
+        try:
+            for valor in self.get_updates().values():
+                EnvDocument.verificar_valor(str(valor))
+        except ValueError as e:
+            QMessageBox.warning(self, "Valor inválido", str(e))
+            return
+        
+        # 2. Validar em segundo plano; o resultado chega em on_validacao_concluida
+        worker = DatabaseValidationWorker(
+            host, port, db, user, pwd,
+            (cod_vendedor, cod_produto_servico, cod_produto_entrega, pagamento_entrega, pagamento_online),
+        )
+        worker.finished_signal.connect(self.on_validacao_concluida)
+        worker.finished.connect(lambda w=worker: EnvEditorDialog._workers_em_andamento.discard(w))
+        EnvEditorDialog._workers_em_andamento.add(worker)
+        self.validation_worker = worker
+        self._set_validando(True)
+        worker.start()
+
+    def _set_validando(self, validando):
+        """Alterna o estado 'Validando…': bloqueia o Salvar e mostra o botão de cancelar."""
+        self.lbl_validacao.setText("⏳ Validando conexão e códigos…" if validando else "")
+        self.btn_cancelar_validacao.setVisible(validando)
+        if self.ok_button:
+            self.ok_button.setEnabled(not validando)
+
+    def on_validacao_concluida(self, is_valid, error_message):
+        if self.sender() is not self.validation_worker:
+            return
+        self.validation_worker = None
+        self._set_validando(False)
+
+        if not is_valid:
+            QMessageBox.critical(
+                self, "Erro de Validação ou Conexão", error_message
+            )
+            return
+
+        super().accept()
+
+    def cancelar_validacao(self):
+        """Cancela a validação em andamento e devolve o formulário para edição."""
+        if self.validation_worker is not None:
+            self.validation_worker.cancelar()
+            self.validation_worker = None
+        self._set_validando(False)
+
+    def accept(self):
+        """
+        Sobrescreve o método accept (chamado pelo botão Salvar) para incluir a validação
+        antes de realmente aceitar e fechar o diálogo. A validação roda em segundo plano.
+        """
+        if self.validation_worker is None:
+            self.validate_and_save()
+
+    def done(self, result):
+        """Cancela a validação em andamento ao fechar o diálogo."""
+        if result != QDialog.Accepted:
+            self.cancelar_validacao()
+        if self.code_loader is not None:
+            self.code_loader.cancelar()
+            self.code_loader = None
+        super().done(result)
+        
+    def _load_values(self):
+        # A lógica de carregamento do ENV permanece aqui, pois manipula os widgets
+        try:
+            doc = self.documento = EnvDocument.load(self.env_path)
+
+            val = doc.get("DATABASE_URL")
+            if val is not None:
+                try:
+                    if val.startswith("sqlserver://"):
+                        body = val[len("sqlserver://") :]
+                        if ";" in body:
+                            hostport, rest = body.split(";",1)
+                        else:
+                            hostport, rest = body, ""
+                        if ":" in hostport:
+                            h, p = hostport.split(":", 1)
+                        else:
+                            h, p = hostport, ""
+                        self.hostname.setText(h)
+                        self.porta.setText(p)
+                        parts = rest.split(";") if rest else []
+                        for part in parts:
+                            if "=" not in part:
+                                continue
+                            k, v = part.split("=", 1)
+                            k, v = k.strip().lower(), v.strip().strip('"')
+                            if k == "database":
+                                self.banco.setText(v)
+                            elif k == "user":
+                                self.usuario.setText(v)
+                            elif k == "password":
+                                self.senha.setText(v)
+                except Exception:
+                    self.hostname.setText(val)
+
+            campos = {
+                "COD_VENDEDOR": self.cod_vendedor,
+                "COD_PRODUTO_SERVICO": self.cod_produto_servico,
+                "COD_PRODUTO_ENTREGA": self.cod_produto_entrega,
+                "PAGAMENTO_ENTREGA": self.pagamento_entrega,
+                "PAGAMENTO_ONLINE": self.pagamento_online,
+                "EMAIL": self.email,
+            }
+            for key, campo in campos.items():
+                val = doc.get(key)
+                if val is not None:
+                    campo.setText(val)
+        except Exception as e:
+            parent = self.parent()
+            if parent is not None:
+                QtWidgets.QMessageBox.warning(parent, "Erro", f"Erro ao ler ENV:\n{e}")
+
+    def get_updates(self):
+        out = {}
+        host = self.hostname.text().strip()
+        port = self.porta.text().strip()
+        db = self.banco.text().strip()
+        user = self.usuario.text().strip()
+        pwd = self.senha.text().strip()
+
+        if host:
+            hostport = f"{host}:{port}" if port else host
+            parts = [f"sqlserver://{hostport}"]
+            if db:
+                parts.append(f"database={db}")
+            if user:
+                parts.append(f"user={user}")
+            if pwd:
+                parts.append(f"password={pwd}")
+            parts.append("trustServerCertificate=true")
+            out["DATABASE_URL"] = ";".join(parts)
+
+        out["COD_VENDEDOR"] = self.cod_vendedor.text() or ""
+        out["COD_PRODUTO_SERVICO"] = self.cod_produto_servico.text() or ""
+        out["COD_PRODUTO_ENTREGA"] = self.cod_produto_entrega.text() or ""
+        out["PAGAMENTO_ENTREGA"] = self.pagamento_entrega.text() or ""
+        out["PAGAMENTO_ONLINE"] = self.pagamento_online.text() or ""
+        out["EMAIL"] = self.email.text() or ""
+        return out
+
+
+# Níveis de log como bits (bitmap de níveis por bloco no LogIndex)
+NIVEL_ERROR, NIVEL_WARN, NIVEL_INFO, NIVEL_DEBUG = 1, 2, 4, 8
+
+_LOG_DATA_ISO_RE = re.compile(
+    rb"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,6}))?(Z|[+-]\d{2}:?\d{2})?"
+)
+_LOG_DATA_BR_RE = re.compile(rb"(\d{2})/(\d{2})/(\d{4})[ ,]+(\d{2}):(\d{2}):(\d{2})")
+_LOG_EPOCH_RE = re.compile(rb'"time"\s*:\s*(\d{13})')
+_LOG_NIVEL_RE = re.compile(rb"\b(ERROR|ERRO|FATAL|WARN|WARNING|INFO|DEBUG|TRACE)\b", re.IGNORECASE)
+_LOG_NIVEL_PINO_RE = re.compile(rb'"level"\s*:\s*(\d{2})')
+_NIVEIS_LOG = {
+    b"ERROR": NIVEL_ERROR, b"ERRO": NIVEL_ERROR, b"FATAL": NIVEL_ERROR, b"WARN": NIVEL_WARN,
+    b"WARNING": NIVEL_WARN, b"INFO": NIVEL_INFO, b"DEBUG": NIVEL_DEBUG, b"TRACE": NIVEL_DEBUG,
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _epoch_iso(ano, mes, dia, h, mi, se, fuso):
+    """Epoch de uma data ISO já separada; em cache porque linhas vizinhas repetem o mesmo segundo."""
+    tz = None
+    if fuso == b"Z":
+        tz = datetime.timezone.utc
+    elif fuso:
+        fuso = fuso.replace(b":", b"")
+        minutos = int(fuso[1:3]) * 60 + int(fuso[3:5])
+        tz = datetime.timezone(datetime.timedelta(minutes=-minutos if fuso[:1] == b"-" else minutos))
+    try:
+        return datetime.datetime(int(ano), int(mes), int(dia), int(h), int(mi), int(se), 0, tz).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_log_timestamp(linha: bytes):
+    """Timestamp (epoch, s) de uma linha de log, ou None.
+
+    Aceita ISO 8601 ('2026-10-18 10:00:00.123', com ou sem fuso), dd/mm/aaaa hh:mm:ss e o
+    campo "time" em milissegundos (pino). Sem fuso, a hora é tratada como local.
+    """
+    m = _LOG_DATA_ISO_RE.search(linha, 0, 160)
+    if m:
+        ano, mes, dia, h, mi, se, frac, fuso = m.groups()
+        segundos = _epoch_iso(ano, mes, dia, h, mi, se, fuso)
+        if segundos is None:
+            return None
+        return segundos + int(frac.ljust(6, b"0")) / 1e6 if frac else segundos
+    m = _LOG_DATA_BR_RE.search(linha, 0, 160)
+    if m:
+        dia, mes, ano, h, mi, se = (int(g) for g in m.groups())
+        try:
+            return datetime.datetime(ano, mes, dia, h, mi, se).timestamp()
+        except ValueError:
+            return None
+    m = _LOG_EPOCH_RE.search(linha)
+    if m:
+        return int(m.group(1)) / 1000
+    return None
+
+
+def nivel_log(linha: bytes):
+    """Bit do nível da linha (NIVEL_ERROR, NIVEL_WARN, ...) ou 0 se não identificado."""
+    m = _LOG_NIVEL_RE.search(linha, 0, 200)
+    if m:
+        return _NIVEIS_LOG.get(m.group(1).upper(), 0)
+    m = _LOG_NIVEL_PINO_RE.search(linha)
+    if m:
+        n = int(m.group(1))
+        return NIVEL_ERROR if n >= 50 else NIVEL_WARN if n >= 40 else NIVEL_INFO if n >= 30 else NIVEL_DEBUG
+    return 0
+
+
+_PALAVRAS_NIVEL = (
+    (NIVEL_ERROR, (b"erro", b"fatal")), (NIVEL_WARN, (b"warn",)),
+    (NIVEL_INFO, (b"info",)), (NIVEL_DEBUG, (b"debug", b"trace")),
+)
+
+
+def niveis_no_bloco(bloco: bytes):
+    """Bitmap conservador dos níveis presentes em um bloco (busca de substrings, sem dividir em linhas)."""
+    minusculo = bloco.lower()
+    bits = 0
+    for bit, palavras in _PALAVRAS_NIVEL:
+        if any(p in minusculo for p in palavras):
+            bits |= bit
+    if b'"level"' in bloco:
+        for m in _LOG_NIVEL_PINO_RE.finditer(bloco):
+            bits |= nivel_log(m.group(0))
+    return bits
+
+
+class LogFile:
+    """Arquivo de log mapeado em memória com índice de inícios de linha.
+
+    Indexa apenas a cauda (últimas N linhas, buscando '\\n' de trás para frente), estende o
+    índice para trás sob demanda e, em atualizar(), indexa só os bytes novos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._arquivo = None
+        self._mm = None
+        self.tamanho = 0
+        # Inícios de linha indexados, do mais antigo ao mais novo; a última linha termina em self.tamanho
+        self._inicios = array("Q")
+        # Última linha ainda sem '\n' (o arquivo está sendo escrito)
+        self._parcial = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def _mapear(self):
+        if self._arquivo is None:
+            self._arquivo = open(self.path, "rb")
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self.tamanho = os.fstat(self._arquivo.fileno()).st_size
+        if self.tamanho:
+            self._mm = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._inicios)
+
+    @property
+    def inicio_indexado(self):
+        """Offset da linha mais antiga já indexada (0 = arquivo inteiro indexado)."""
+        return self._inicios[0] if self._inicios else self.tamanho
+
+    def abrir_cauda(self, linhas=None):
+        """Mapeia o arquivo e indexa as últimas `linhas` linhas."""
+        self.fechar()
+        self._inicios = array("Q")
+        self._parcial = False
+        self._mapear()
+        if self.tamanho:
+            self._parcial = self._mm[self.tamanho - 1:self.tamanho] != b"\n"
+            self._inicios.append(self._inicio_da_linha(self.tamanho - 1))
+            linhas = Config.LOG_VIEWER_TAIL_LINES if linhas is None else linhas
+            self.carregar_anteriores(linhas - 1)
+        return self
+
+    def _inicio_da_linha(self, pos):
+        """Offset do início da linha que contém o byte `pos` (o '\\n' final pertence à linha)."""
+        return self._mm.rfind(b"\n", 0, pos) + 1
+
+    def buscar_anteriores(self, linhas):
+        """Inícios das até `linhas` linhas anteriores à parte indexada (sem alterar o índice)."""
+        novos = []
+        inicio = self.inicio_indexado
+        while inicio > 0 and len(novos) < linhas:
+            inicio = self._inicio_da_linha(inicio - 1)
+            novos.append(inicio)
+        novos.reverse()
+        return novos
+
+    def prepender(self, inicios):
+        if inicios:
+            self._inicios = array("Q", inicios) + self._inicios
+
+    def carregar_anteriores(self, linhas):
+        """Estende o índice `linhas` linhas para trás; retorna quantas foram adicionadas."""
+        novos = self.buscar_anteriores(linhas)
+        self.prepender(novos)
+        return len(novos)
+
+    def buscar_novas(self):
+        """Remapeia o arquivo e retorna os inícios das linhas acrescentadas desde a última leitura.
+
+        Só os bytes novos são percorridos. Retorna None se o arquivo encolheu (rotação/truncamento).
+        """
+        anterior = self.tamanho
+        tamanho = os.path.getsize(self.path)
+        if tamanho == anterior:
+            return []
+        if tamanho < anterior:
+            return None
+
+        self._mapear()
+        pos = anterior
+        if self._parcial and self._inicios:
+            # A última linha estava incompleta: os novos bytes começam por completá-la
+            fim = self._mm.find(b"\n", self._inicios[-1])
+            pos = self.tamanho if fim == -1 else fim + 1
+        novos = []
+        while pos < self.tamanho:
+            novos.append(pos)
+            fim = self._mm.find(b"\n", pos)
+            if fim == -1:
+                break
+            pos = fim + 1
+        return novos
+
+    def anexar(self, inicios):
+        self._inicios.extend(inicios)
+        self._parcial = bool(self.tamanho) and self._mm[self.tamanho - 1:self.tamanho] != b"\n"
+
+    def atualizar(self):
+        """Indexa o que foi acrescentado; retorna o número de linhas novas ou -1 se o índice foi refeito."""
+        novos = self.buscar_novas()
+        if novos is None:
+            self.abrir_cauda()
+            return -1
+        self.anexar(novos)
+        return len(novos)
+
+    def linha_bytes(self, i):
+        inicio = self._inicios[i]
+        fim = self._inicios[i + 1] if i + 1 < len(self._inicios) else self.tamanho
+        return self._mm[inicio:fim].rstrip(b"\r\n")
+
+    def linha(self, i):
+        return self.linha_bytes(i).decode("utf-8", errors="replace")
+
+    def linha_no_offset(self, offset):
+        """Linha que começa em `offset` (para listas de offsets vindas de uma busca)."""
+        if self._mm is None or offset >= self.tamanho:
+            return b""
+        fim = self._mm.find(b"\n", offset)
+        return self._mm[offset:self.tamanho if fim == -1 else fim].rstrip(b"\r")
+
+
+def _ocorrencias(dados: bytes, alvo: bytes):
+    """Posições de todas as ocorrências de `alvo` em `dados`."""
+    pos = dados.find(alvo)
+    while pos != -1:
+        yield pos
+        pos = dados.find(alvo, pos + 1)
+
+
+class LogIndex:
+    """Índice persistente e incremental de um log: uma entrada a cada ~LOG_INDEX_BLOCK_SIZE bytes.
+
+    Cada entrada guarda o offset do bloco (sempre um início de linha), o primeiro timestamp do
+    bloco (repetindo o anterior quando o bloco não tem nenhum) e o bitmap dos níveis presentes.
+    Ir para um horário é uma busca binária + leitura de um bloco; filtrar ERROR/WARN lê só os
+    blocos com o bit correspondente. O índice fica em disco e é retomado de onde parou.
+    """
+
+    _MAGICO = b"LGIX2"
+    _CABECALHO = struct.Struct("<5sIQQI20s")
+    # Bytes do início do arquivo usados para reconhecer o mesmo log (menos enquanto o arquivo é menor)
+    _IDENTIDADE_BYTES = 4096
+
+    def __init__(self, log_path, index_path=None):
+        self.log_path = log_path
+        if index_path is None:
+            chave = hashlib.sha1(os.path.abspath(log_path).lower().encode("utf-8")).hexdigest()[:12]
+            index_path = os.path.join(Config.get_cache_dir(), "logidx", f"{os.path.basename(log_path)}-{chave}.idx")
+        self.index_path = index_path
+        self.bloco = Config.LOG_INDEX_BLOCK_SIZE
+        self._limpar()
+        self._carregar()
+
+    def _limpar(self):
+        self.offsets = array("Q")
+        self.timestamps = array("d")
+        self.niveis = array("B")
+        # Fim (exclusivo) da parte indexada; o último bloco é refeito se ainda não estava cheio
+        self.fim = 0
+        self._identidade = b""
+        self._prefixo = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @staticmethod
+    def _identificar(f, tamanho):
+        """Hash dos primeiros `tamanho` bytes: muda quando o log é rotacionado ou recriado."""
+        f.seek(0)
+        return hashlib.sha1(f.read(tamanho)).digest()
+
+    def _carregar(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                magico, bloco, n, fim, prefixo, identidade = self._CABECALHO.unpack(f.read(self._CABECALHO.size))
+                if magico != self._MAGICO or bloco != self.bloco:
+                    return
+                offsets, timestamps, niveis = array("Q"), array("d"), array("B")
+                offsets.fromfile(f, n)
+                timestamps.fromfile(f, n)
+                niveis.fromfile(f, n)
+        except (OSError, EOFError, struct.error):
+            return
+        self.offsets, self.timestamps, self.niveis = offsets, timestamps, niveis
+        self.fim = fim
+        self._identidade = identidade
+        self._prefixo = prefixo
+
+    def salvar(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self._CABECALHO.pack(
+                    self._MAGICO, self.bloco, len(self.offsets), self.fim, self._prefixo, self._identidade
+                ))
+                self.offsets.tofile(f)
+                self.timestamps.tofile(f)
+                self.niveis.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Não foi possível gravar o índice do log: {e}")
+
+    def atualizar(self, salvar=True):
+        """Indexa o que foi acrescentado ao log desde a última vez; retorna os bytes processados.
+
+        Se o arquivo encolheu ou o início mudou (rotação), o índice é refeito do zero.
+        """
+        with open(self.log_path, "rb") as f:
+            tamanho = os.fstat(f.fileno()).st_size
+            # Compara o mesmo trecho que foi guardado: num arquivo com menos de 4 KB (logo após uma
+            # rotação) o hash dos "primeiros 4 KB" mudaria a cada linha acrescentada
+            if tamanho < self.fim or (self._identidade and (
+                    tamanho < self._prefixo or self._identificar(f, self._prefixo) != self._identidade)):
+                self._limpar()
+            if not self._identidade or self._prefixo < min(self._IDENTIDADE_BYTES, tamanho):
+                self._prefixo = min(self._IDENTIDADE_BYTES, tamanho)
+                self._identidade = self._identificar(f, self._prefixo)
+
+            if self.offsets and self.fim - self.offsets[-1] < self.bloco:
+                # O último bloco não estava cheio: refaz a partir do início dele
+                self.fim = self.offsets.pop()
+                self.timestamps.pop()
+                self.niveis.pop()
+
+            inicio = self.fim
+            f.seek(self.fim)
+            # Blocos sem nenhum timestamp herdam o anterior (0 no início), mantendo a lista ordenada
+            ts_anterior = self.timestamps[-1] if self.timestamps else 0.0
+            while True:
+                dados = f.read(self.bloco)
+                if not dados:
+                    break
+                if not dados.endswith(b"\n"):
+                    resto = f.readline()
+                    dados += resto
+                    if not dados.endswith(b"\n"):
+                        # Última linha ainda sendo escrita: fica para a próxima atualização
+                        corte = dados.rfind(b"\n") + 1
+                        if corte == 0:
+                            break
+                        dados = dados[:corte]
+
+                ts = None
+                pos = 0
+                # Primeiro timestamp do bloco (normalmente já na primeira linha)
+                while ts is None and pos < len(dados) and pos < 8192:
+                    fim_linha = dados.find(b"\n", pos)
+                    ts = parse_log_timestamp(dados[pos:fim_linha])
+                    pos = fim_linha + 1
+                if ts is not None:
+                    ts_anterior = ts
+
+                self.offsets.append(self.fim)
+                self.timestamps.append(ts_anterior)
+                self.niveis.append(niveis_no_bloco(dados))
+                self.fim += len(dados)
+                if len(dados) < self.bloco:
+                    break
+                f.seek(self.fim)
+
+        if salvar and self.fim != inicio:
+            self.salvar()
+        return self.fim - inicio
+
+    def _bloco_do_tempo(self, ts):
+        """Índice do bloco onde linhas com timestamp >= ts podem começar."""
+        i = bisect.bisect_left(self.timestamps, ts)
+        return max(i - 1, 0)
+
+    def offset_do_tempo(self, ts):
+        """Offset aproximado (início do bloco) a partir do qual estão as linhas com horário >= ts."""
+        if not self.offsets:
+            return 0
+        return self.offsets[self._bloco_do_tempo(ts)]
+
+    @staticmethod
+    def _linhas_candidatas(dados, alvo, niveis):
+        """(início, fim) das linhas do bloco que podem atender ao filtro.
+
+        Com filtro de nível ou texto, localiza as ocorrências no bloco inteiro (regex/find em C)
+        e só então recorta as linhas; sem filtro, percorre todas as linhas.
+        """
+        ocorrencias = None
+        if niveis and b'"level"' not in dados:
+            palavras = b"|".join(p.lower() for p, bit in _NIVEIS_LOG.items() if bit & niveis)
+            ocorrencias = (m.start() for m in re.finditer(rb"\b(?:" + palavras + rb")\b", dados.lower()))
+        elif alvo:
+            ocorrencias = _ocorrencias(dados.lower(), alvo)
+
+        if ocorrencias is None:
+            pos = 0
+            while pos < len(dados):
+                fim_linha = dados.find(b"\n", pos)
+                if fim_linha == -1:
+                    fim_linha = len(dados)
+                yield pos, fim_linha
+                pos = fim_linha + 1
+            return
+
+        fim_anterior = -1
+        for ocorrencia in ocorrencias:
+            if ocorrencia <= fim_anterior:
+                continue
+            pos = dados.rfind(b"\n", 0, ocorrencia) + 1
+            fim_linha = dados.find(b"\n", ocorrencia)
+            if fim_linha == -1:
+                fim_linha = len(dados)
+            yield pos, fim_linha
+            fim_anterior = fim_linha
+
+    def buscar(self, texto=None, niveis=0, inicio=None, fim=None, limite=None):
+        """Gera (offset, linha em bytes) das linhas que atendem aos filtros.
+
+        niveis: máscara NIVEL_* (0 = todos); inicio/fim: epoch em segundos; texto: substring
+        (sem diferenciar maiúsculas). Só os blocos compatíveis com o intervalo e o bitmap são lidos.
+        """
+        limite = Config.LOG_SEARCH_MAX_RESULTS if limite is None else limite
+        alvo = texto.lower().encode("utf-8") if texto else None
+        primeiro = self._bloco_do_tempo(inicio) if inicio is not None and self.offsets else 0
+        encontrados = 0
+
+        with open(self.log_path, "rb") as f:
+            for i in range(primeiro, len(self.offsets)):
+                if fim is not None and self.timestamps[i] > fim:
+                    break
+                if niveis and not (self.niveis[i] & niveis):
+                    continue
+                final_bloco = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.fim
+                f.seek(self.offsets[i])
+                dados = f.read(final_bloco - self.offsets[i])
+                if alvo and alvo not in dados.lower():
+                    continue
+
+                ts_linha = self.timestamps[i]
+                for pos, fim_linha in self._linhas_candidatas(dados, alvo, niveis):
+                    linha = dados[pos:fim_linha].rstrip(b"\r")
+                    offset = self.offsets[i] + pos
+                    if inicio is not None or fim is not None:
+                        ts = parse_log_timestamp(linha)
+                        if ts is not None:
+                            ts_linha = ts
+                        if inicio is not None and ts_linha < inicio:
+                            continue
+                        if fim is not None and ts_linha > fim:
+                            return
+                    if niveis and not (nivel_log(linha) & niveis):
+                        continue
+                    if alvo and alvo not in linha.lower():
+                        continue
+                    yield offset, linha
+                    encontrados += 1
+                    if encontrados >= limite:
+                        return
+
+
+_EXTENSOES_COMPRIMIDAS = (".gz", ".zst")
+
+
+def _segmento_re(path):
+    return re.compile(re.escape(os.path.basename(path)) + r"\.(\d{8}-\d{6})(\.gz|\.zst)?$")
+
+
+def segmentos_de_log(path):
+    """Segmentos rotacionados do log (app.log.AAAAMMDD-HHMMSS[.gz|.zst]), do mais antigo ao mais novo.
+
+    Retorna [(epoch da rotação, caminho)]; a data da rotação é o fim dos dados do segmento.
+    """
+    pasta = os.path.dirname(path) or "."
+    padrao = _segmento_re(path)
+    segmentos = []
+    try:
+        nomes = os.listdir(pasta)
+    except OSError:
+        return []
+    for nome in nomes:
+        m = padrao.match(nome)
+        if not m:
+            continue
+        try:
+            ts = datetime.datetime.strptime(m.group(1), "%Y%m%d-%H%M%S").timestamp()
+        except ValueError:
+            continue
+        segmentos.append((ts, os.path.join(pasta, nome)))
+    segmentos.sort()
+    return segmentos
+
+
+def abrir_log_binario(path):
+    """Abre um log ou segmento para leitura binária em streaming, descomprimindo .gz/.zst."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise OSError(f"O pacote 'zstandard' é necessário para ler {os.path.basename(path)}")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+
+def linhas_finais_do_segmento(path, pular, quantidade):
+    """As `quantidade` linhas que antecedem as `pular` últimas linhas de um segmento (em streaming)."""
+    janela = collections.deque(maxlen=pular + quantidade)
+    with abrir_log_binario(path) as f:
+        for linha in f:
+            janela.append(linha.rstrip(b"\r\n"))
+    linhas = list(janela)
+    return linhas[:len(linhas) - pular] if pular else linhas
+
+
+def ler_linhas_log(path, inicio=None, fim=None, usar_indice=True):
+    """Gera (timestamp, linha em bytes) de um log, em ordem, lendo o arquivo sob demanda.
+
+    Os segmentos rotacionados (inclusive comprimidos) que cobrem a janela vêm antes do arquivo atual.
+    Com `inicio`, usa o LogIndex para começar perto do horário em vez de ler o arquivo todo.
+    Linhas sem horário (continuações, stack traces) herdam o timestamp da linha anterior.
+    A leitura para na primeira linha depois de `fim`.
+    """
+    ts = 0.0
+    for fim_segmento, segmento in segmentos_de_log(path):
+        if inicio is not None and fim_segmento < inicio:
+            continue
+        with abrir_log_binario(segmento) as f:
+            for linha in f:
+                linha = linha.rstrip(b"\r\n")
+                ts_linha = parse_log_timestamp(linha)
+                if ts_linha is not None:
+                    ts = ts_linha
+                if inicio is not None and ts < inicio:
+                    continue
+                if fim is not None and ts > fim:
+                    return
+                yield ts, linha
+
+    offset = 0
+    if inicio is not None and usar_indice:
+        indice = LogIndex(path)
+        indice.atualizar()
+        offset = indice.offset_do_tempo(inicio)
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for linha in f:
+            linha = linha.rstrip(b"\r\n")
+            ts_linha = parse_log_timestamp(linha)
+            if ts_linha is not None:
+                ts = ts_linha
+            if inicio is not None and ts < inicio:
+                continue
+            if fim is not None and ts > fim:
+                return
+            yield ts, linha
+
+
+def fontes_de_log():
+    """Logs disponíveis para a linha do tempo combinada: {nome: caminho}."""
+    fontes = {"API": Config.LOG_PATH_API, "Painel": Config.get_painel_log_all_path()}
+    return {nome: caminho for nome, caminho in fontes.items() if caminho and os.path.exists(caminho)}
+
+
+def mesclar_logs(fontes=None, inicio=None, fim=None, correlacao=None):
+    """Linha do tempo única de vários logs: gera (timestamp, nome da fonte, linha em texto).
+
+    Faz um merge k-way (heapq.merge) sobre os geradores de cada arquivo, então a memória usada
+    é de uma linha por fonte. `correlacao` filtra por substring (ex.: número do pedido),
+    sem diferenciar maiúsculas.
+    """
+    fontes = fontes_de_log() if fontes is None else fontes
+    alvo = correlacao.lower().encode("utf-8") if correlacao else None
+
+    def linhas_da_fonte(nome, caminho):
+        for ts, linha in ler_linhas_log(caminho, inicio, fim):
+            if alvo is None or alvo in linha.lower():
+                yield ts, nome, linha
+
+    fluxos = [linhas_da_fonte(nome, caminho) for nome, caminho in fontes.items()]
+    for ts, nome, linha in heapq.merge(*fluxos, key=lambda item: item[0]):
+        yield ts, nome, linha.decode("utf-8", errors="replace")
+
+
+class LogListModel(QtCore.QAbstractListModel):
+    """Modelo virtualizado: a view só pede (e decodifica) as linhas visíveis."""
+
+    _CORES = ((NIVEL_ERROR, QtGui.QColor("#C62828")), (NIVEL_WARN, QtGui.QColor("#EF6C00")))
+
+    def __init__(self, log_file, parent=None):
+        super().__init__(parent)
+        self.log = log_file
+        # Resultado de uma busca: offsets no arquivo atual ou linhas (bytes) de segmentos; None = sem filtro
+        self.filtro = None
+        # Linhas já carregadas dos segmentos rotacionados, exibidas antes do arquivo atual
+        self.anteriores = []
+        self._segmentos = None
+        self._lidas_do_segmento = 0
+        # Arquivo solto durante uma rotação: nenhuma linha até atualizar() reabri-lo
+        self.fechado = False
+
+    def definir_filtro(self, itens):
+        self.beginResetModel()
+        self.filtro = list(itens) if itens is not None else None
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self.fechado:
+            return 0
+        if self.filtro is not None:
+            return len(self.filtro)
+        return len(self.anteriores) + len(self.log)
+
+    def _linha_bytes(self, row):
+        if self.filtro is not None:
+            item = self.filtro[row]
+            return item if isinstance(item, bytes) else self.log.linha_no_offset(item)
+        if row < len(self.anteriores):
+            return self.anteriores[row]
+        return self.log.linha_bytes(row - len(self.anteriores))
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self._linha_bytes(index.row()).decode("utf-8", errors="replace")
+        if role == QtCore.Qt.ForegroundRole:
+            nivel = nivel_log(self._linha_bytes(index.row()))
+            for bit, cor in self._CORES:
+                if nivel == bit:
+                    return cor
+        return None
+
+    def carregar_anteriores(self, linhas):
+        """Insere no topo mais `linhas` linhas antigas; retorna quantas entraram."""
+        if self.filtro is not None or self.fechado:
+            return 0
+        if self.log.inicio_indexado == 0:
+            return self._carregar_de_segmentos(linhas)
+        novos = self.log.buscar_anteriores(linhas)
+        if novos:
+            self.beginInsertRows(QtCore.QModelIndex(), 0, len(novos) - 1)
+            self.log.prepender(novos)
+            self.endInsertRows()
+        return len(novos)
+
+    def tem_anteriores(self):
+        """Ainda há linhas antigas para carregar (no arquivo atual ou em segmentos rotacionados)?"""
+        if self.fechado:
+            return False
+        if self.log.inicio_indexado > 0:
+            return True
+        if self._segmentos is None:
+            self._segmentos = [caminho for _, caminho in segmentos_de_log(self.log.path)]
+        return bool(self._segmentos)
+
+    def _carregar_de_segmentos(self, linhas):
+        """Arquivo atual esgotado: continua pelos segmentos rotacionados, do mais novo ao mais antigo."""
+        while self.tem_anteriores():
+            segmento = self._segmentos[-1]
+            novas = linhas_finais_do_segmento(segmento, self._lidas_do_segmento, linhas)
+            if not novas:
+                self._segmentos.pop()
+                self._lidas_do_segmento = 0
+                continue
+            self._lidas_do_segmento += len(novas)
+            self.beginInsertRows(QtCore.QModelIndex(), 0, len(novas) - 1)
+            self.anteriores[:0] = novas
+            self.endInsertRows()
+            return len(novas)
+        return 0
+
+    def fechar(self):
+        """Solta o mapeamento do arquivo (a rotação precisa truncá-lo); atualizar() o reabre pela cauda."""
+        self.beginResetModel()
+        self.fechado = True
+        self.log.fechar()
+        self.endResetModel()
+
+    def reiniciar(self):
+        """Reabre o arquivo pela cauda, descartando filtro e linhas dos segmentos."""
+        self.beginResetModel()
+        try:
+            self.log.abrir_cauda()
+            self.fechado = False
+            self.filtro = None
+            self.anteriores = []
+            self._segmentos = None
+            self._lidas_do_segmento = 0
+        finally:
+            self.endResetModel()
+
+    def atualizar(self):
+        """Acompanha o crescimento do arquivo; retorna o número de linhas novas (-1 = reiniciado)."""
+        novos = None if self.fechado else self.log.buscar_novas()
+        if novos is None:
+            self.reiniciar()
+            return -1
+        if self.filtro is not None:
+            # Resultado de busca fixo: só acompanha o arquivo, sem mudar as linhas exibidas
+            self.log.anexar(novos)
+            return 0
+
+        antes = len(self.anteriores) + len(self.log)
+        if antes:
+            # A última linha pode ter crescido (estava incompleta)
+            self.dataChanged.emit(self.index(antes - 1), self.index(antes - 1))
+        if novos:
+            self.beginInsertRows(QtCore.QModelIndex(), antes, antes + len(novos) - 1)
+            self.log.anexar(novos)
+            self.endInsertRows()
+        else:
+            self.log.anexar(novos)
+        return len(novos)
+
+
+class LogSearchWorker(QThread):
+    """Worker que atualiza o índice persistente do log e executa uma busca nele."""
+    # Sinal emitido com o resultado (linhas dos segmentos em bytes e offsets do arquivo atual) e um resumo
+    results_ready = pyqtSignal(object, str)
+    # Sinal emitido em caso de falha (mensagem)
+    failed = pyqtSignal(str)
+
+    def __init__(self, log_path, texto=None, niveis=0, inicio=None, fim=None, parent=None):
+        super().__init__(parent)
+        self.log_path = log_path
+        self.filtros = dict(texto=texto, niveis=niveis, inicio=inicio, fim=fim)
+        self._cancelado = False
+
+    def cancelar(self):
+        self._cancelado = True
+
+    def run(self):
+        try:
+            inicio = time.perf_counter()
+            indice = LogIndex(self.log_path)
+            indexados = indice.atualizar()
+            # Segmentos rotacionados primeiro (linhas em bytes), depois o arquivo atual (offsets)
+            offsets = []
+            for linha in buscar_em_segmentos(self.log_path, **self.filtros):
+                if self._cancelado:
+                    return
+                offsets.append(linha)
+            restante = Config.LOG_SEARCH_MAX_RESULTS - len(offsets)
+            for offset, _ in indice.buscar(limite=restante, **self.filtros) if restante > 0 else ():
+                if self._cancelado:
+                    return
+                offsets.append(offset)
+            decorrido = time.perf_counter() - inicio
+        except OSError as e:
+            if not self._cancelado:
+                self.failed.emit(str(e))
+            return
+
+        if self._cancelado:
+            return
+        print(f"Busca no log: {len(offsets)} linhas em {decorrido:.2f}s ({indexados / (1024 * 1024):.1f} MB indexados agora)")
+        limite = " (limite atingido)" if len(offsets) >= Config.LOG_SEARCH_MAX_RESULTS else ""
+        self.results_ready.emit(offsets, f"{len(offsets)} linhas encontradas{limite} em {decorrido:.2f}s")
+
+
+def buscar_em_segmentos(path, texto=None, niveis=0, inicio=None, fim=None, limite=None):
+    """Busca nos segmentos rotacionados (lidos em streaming, sem índice): gera linhas em bytes."""
+    limite = Config.LOG_SEARCH_MAX_RESULTS if limite is None else limite
+    alvo = texto.lower().encode("utf-8") if texto else None
+    encontrados = 0
+    ts = 0.0
+    for fim_segmento, segmento in segmentos_de_log(path):
+        if inicio is not None and fim_segmento < inicio:
+            continue
+        with abrir_log_binario(segmento) as f:
+            for linha in f:
+                linha = linha.rstrip(b"\r\n")
+                if inicio is not None or fim is not None:
+                    ts_linha = parse_log_timestamp(linha)
+                    if ts_linha is not None:
+                        ts = ts_linha
+                    if inicio is not None and ts < inicio:
+                        continue
+                    if fim is not None and ts > fim:
+                        return
+                if alvo and alvo not in linha.lower():
+                    continue
+                if niveis and not (nivel_log(linha) & niveis):
+                    continue
+                yield linha
+                encontrados += 1
+                if encontrados >= limite:
+                    return
+
+
+class LogRetention:
+    """Rotação, compressão e limpeza dos logs (app.log da API e all.log do Painel).
+
+    A rotação copia o log para um segmento datado e trunca o original (o processo que escreve
+    mantém o arquivo aberto, então não dá para renomeá-lo). Os segmentos são comprimidos em
+    streaming e apagados quando ficam mais velhos que TIME_LOG horas.
+
+    `leitores` (opcional) é avisado antes e depois de cada rotação, com liberar(caminho) e
+    reabrir(caminho, erro), para que os visualizadores fechem o mapeamento do arquivo.
+    """
+
+    _BLOCO = 1024 * 1024
+
+    def __init__(self, caminhos, horas_retencao, max_bytes=None, max_idade_horas=None, compressao=None,
+                 leitores=None):
+        self.caminhos = [c for c in caminhos if c]
+        self.leitores = leitores
+        self.horas_retencao = horas_retencao
+        self.max_bytes = Config.LOG_ROTATE_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_idade = (Config.LOG_ROTATE_MAX_AGE_HOURS if max_idade_horas is None else max_idade_horas) * 3600
+        compressao = Config.LOG_COMPRESSION if compressao is None else compressao
+        self.compressao = "zstd" if compressao == "zstd" and zstandard is not None else "gzip"
+        self.cancelado = threading.Event()
+
+    def executar(self):
+        """Um ciclo completo; retorna um resumo {rotacionados, rotacoes_adiadas, comprimidos, apagados, bytes_liberados}."""
+        resumo = {"rotacionados": 0, "rotacoes_adiadas": 0, "comprimidos": 0, "apagados": 0, "bytes_liberados": 0}
+        for caminho in self.caminhos:
+            if self.cancelado.is_set():
+                break
+            try:
+                if self.precisa_rotacionar(caminho):
+                    if self._rotacionar_liberando(caminho):
+                        resumo["rotacionados"] += 1
+                    else:
+                        resumo["rotacoes_adiadas"] += 1
+                for _, segmento in segmentos_de_log(caminho):
+                    if self.cancelado.is_set():
+                        break
+                    if not segmento.endswith(_EXTENSOES_COMPRIMIDAS):
+                        if self.comprimir(segmento):
+                            resumo["comprimidos"] += 1
+                apagados, liberados = self.limpar(caminho)
+                resumo["apagados"] += apagados
+                resumo["bytes_liberados"] += liberados
+            except OSError as e:
+                print(f"Retenção de logs: falha em {caminho}: {e}")
+        return resumo
+
+    def precisa_rotacionar(self, caminho):
+        try:
+            tamanho = os.path.getsize(caminho)
+        except OSError:
+            return False
+        if tamanho == 0:
+            return False
+        if tamanho >= self.max_bytes:
+            return True
+        # Idade: horário da primeira linha do arquivo atual
+        with open(caminho, "rb") as f:
+            primeira = f.readline(4096)
+        ts = parse_log_timestamp(primeira)
+        return ts is not None and time.time() - ts >= self.max_idade
+
+    def _rotacionar_liberando(self, caminho):
+        """Rotaciona com os visualizadores soltando o arquivo; False (e o motivo no log) se foi adiada."""
+        if self.leitores is not None:
+            self.leitores.liberar(caminho)
+        erro = None
+        try:
+            self.rotacionar(caminho)
+        except OSError as e:
+            erro = str(e)
+            print(f"Retenção de logs: rotação de {caminho} adiada para o próximo ciclo: {e}")
+        finally:
+            if self.leitores is not None:
+                self.leitores.reabrir(caminho, erro)
+        return erro is None
+
+    def rotacionar(self, caminho):
+        """Copia o log para app.log.AAAAMMDD-HHMMSS e trunca o original (copytruncate).
+
+        Antes do truncate o tamanho é conferido de novo: o que o processo escreveu durante a
+        cópia também vai para o segmento. Só os bytes gravados entre essa última conferência e
+        o truncate (microssegundos) ficam de fora, limite inerente ao copytruncate.
+        """
+        destino = f"{caminho}.{time.strftime('%Y%m%d-%H%M%S')}"
+        with open(caminho, "r+b") as origem, open(destino, "wb") as copia:
+            copiados = 0
+            # Copia até o tamanho parar de mudar entre duas passadas (o processo continua escrevendo)
+            for _ in range(Config.LOG_ROTATE_COPY_ATTEMPTS):
+                while True:
+                    bloco = origem.read(self._BLOCO)
+                    if not bloco:
+                        break
+                    copia.write(bloco)
+                    copiados += len(bloco)
+                copia.flush()
+                os.fsync(copia.fileno())
+                if os.fstat(origem.fileno()).st_size == copiados:
+                    break
+            try:
+                # Imediatamente antes do truncate: o que chegou desde a última passada também vai
+                # (o fsync desse resto fica para depois, para não alargar a janela até o truncate)
+                copia.write(origem.read())
+                origem.truncate(0)
+            except OSError:
+                # No Windows o truncate falha se outro programa mapeou o arquivo: desfaz a cópia
+                copia.close()
+                os.remove(destino)
+                raise
+            copia.flush()
+            os.fsync(copia.fileno())
+        print(f"Log rotacionado: {os.path.basename(destino)}")
+        return destino
+
+    def comprimir(self, segmento):
+        """Comprime o segmento em streaming (.gz ou .zst) e apaga o original; False se cancelado."""
+        extensao = ".zst" if self.compressao == "zstd" else ".gz"
+        destino = segmento + extensao
+        tmp_path = destino + ".tmp"
+        try:
+            with open(segmento, "rb") as origem, open(tmp_path, "wb") as bruto:
+                if self.compressao == "zstd":
+                    saida = zstandard.ZstdCompressor(level=3).stream_writer(bruto, closefd=False)
+                else:
+                    saida = gzip.GzipFile(filename=os.path.basename(segmento), mode="wb", fileobj=bruto, compresslevel=6)
+                with saida:
+                    while True:
+                        if self.cancelado.is_set():
+                            raise InterruptedError
+                        bloco = origem.read(self._BLOCO)
+                        if not bloco:
+                            break
+                        saida.write(bloco)
+                bruto.flush()
+                os.fsync(bruto.fileno())
+            os.replace(tmp_path, destino)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if self.cancelado.is_set():
+                return False
+            raise
+        os.remove(segmento)
+        return True
+
+    def limpar(self, caminho):
+        """Apaga os segmentos cujo último dado é mais velho que a retenção; retorna (quantidade, bytes)."""
+        limite = time.time() - self.horas_retencao * 3600
+        apagados = liberados = 0
+        for fim_segmento, segmento in segmentos_de_log(caminho):
+            if fim_segmento >= limite:
+                break
+            try:
+                tamanho = os.path.getsize(segmento)
+                os.remove(segmento)
+            except OSError as e:
+                print(f"Retenção de logs: não foi possível apagar {segmento}: {e}")
+                continue
+            apagados += 1
+            liberados += tamanho
+        return apagados, liberados
+
+
+def horas_retencao_logs(env_path):
+    """TIME_LOG (horas) do .env da API; o padrão do template é 168 (7 dias)."""
+    try:
+        valor = EnvDocument.load(env_path).get("TIME_LOG")
+        horas = float(valor) if valor else Config.LOG_TIME_LOG_DEFAULT_HOURS
+        return horas if horas > 0 else Config.LOG_TIME_LOG_DEFAULT_HOURS
+    except (OSError, ValueError):
+        return Config.LOG_TIME_LOG_DEFAULT_HOURS
+
+
+class LogRetentionWorker(QThread):
+    """Worker que executa a retenção dos logs periodicamente, fora da thread da interface."""
+    # Sinal emitido ao fim de cada ciclo com o resumo (dict)
+    cycle_done = pyqtSignal(object)
+    # Sinais emitidos em volta de cada rotação: caminho do log e, no fim, o erro ("" = rotacionado)
+    rotation_starting = pyqtSignal(str)
+    rotation_finished = pyqtSignal(str, str)
+
+    def __init__(self, env_path, intervalo_ms=Config.LOG_RETENTION_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self.env_path = env_path
+        self.intervalo_ms = intervalo_ms
+        self._parar = threading.Event()
+        self._retencao = None
+        self._leitores_liberados = threading.Event()
+
+    def parar(self):
+        self._parar.set()
+        self._leitores_liberados.set()
+        if self._retencao is not None:
+            self._retencao.cancelado.set()
+
+    def liberar(self, caminho):
+        """Pede à interface que os visualizadores soltem o log e espera a confirmação (leitores_liberados)."""
+        self._leitores_liberados.clear()
+        if self._parar.is_set():
+            return
+        self.rotation_starting.emit(caminho)
+        # Sem resposta a tempo (interface ocupada), segue: no pior caso o truncate falha e a rotação é adiada
+        self._leitores_liberados.wait(Config.LOG_ROTATE_RELEASE_TIMEOUT_MS / 1000.0)
+
+    def leitores_liberados(self):
+        self._leitores_liberados.set()
+
+    def reabrir(self, caminho, erro):
+        self.rotation_finished.emit(caminho, erro or "")
+
+    def run(self):
+        while not self._parar.is_set():
+            # TIME_LOG é relido a cada ciclo: edições no .env valem sem reiniciar o gerenciador
+            self._retencao = LogRetention(
+                [Config.LOG_PATH_API, Config.get_painel_log_all_path()], horas_retencao_logs(self.env_path),
+                leitores=self,
+            )
+            if self._parar.is_set():
+                break
+            resumo = self._retencao.executar()
+            if any(resumo.values()):
+                print(f"Retenção de logs: {resumo}")
+            self.cycle_done.emit(resumo)
+            self._parar.wait(self.intervalo_ms / 1000.0)
+
+
+class LatencyHistogram:
+    """Histograma de latências com buckets logarítmicos: memória constante, erro relativo ~4,5%."""
+
+    MINIMO_MS = 0.01
+    _FATOR = 2 ** (1 / 16)
+    _LOG_FATOR = math.log(_FATOR)
+    # 0,01 ms até ~10^7 ms
+    BUCKETS = int(math.log(1e9) / math.log(2 ** (1 / 16))) + 2
+
+    def __init__(self):
+        self.contagens = array("Q", bytes(8 * self.BUCKETS))
+        self.total = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, ms):
+        if ms <= self.MINIMO_MS:
+            i = 0
+        else:
+            i = min(int(math.log(ms / self.MINIMO_MS) / self._LOG_FATOR) + 1, self.BUCKETS - 1)
+        self.contagens[i] += 1
+        self.total += 1
+        self.soma += ms
+        if ms > self.maximo:
+            self.maximo = ms
+
+    def percentil(self, p):
+        """Latência (ms) no percentil p (0-100), pelo ponto médio geométrico do bucket."""
+        if not self.total:
+            return None
+        alvo = max(1, math.ceil(self.total * p / 100))
+        acumulado = 0
+        for i, n in enumerate(self.contagens):
+            acumulado += n
+            if acumulado >= alvo:
+                return min(self.MINIMO_MS * self._FATOR ** (i - 0.5) if i else self.MINIMO_MS, self.maximo)
+        return self.maximo
+
+
+class EndpointStats:
+    """Contadores de um endpoint: histograma de latência e respostas 4xx/5xx."""
+
+    __slots__ = ("histograma", "erros_4xx", "erros_5xx")
+
+    def __init__(self):
+        self.histograma = LatencyHistogram()
+        self.erros_4xx = 0
+        self.erros_5xx = 0
+
+    def registrar(self, ms, status):
+        self.histograma.registrar(ms)
+        if status >= 500:
+            self.erros_5xx += 1
+        elif status >= 400:
+            self.erros_4xx += 1
+
+    def resumo(self):
+        h = self.histograma
+        return {
+            "total": h.total,
+            "p50": h.percentil(50), "p95": h.percentil(95), "p99": h.percentil(99),
+            "media": h.soma / h.total if h.total else None, "max": h.maximo,
+            "erros_4xx": self.erros_4xx, "erros_5xx": self.erros_5xx,
+            "taxa_erro": self.erros_5xx / h.total if h.total else 0.0,
+        }
+
+
+# Linha de requisição em texto (morgan/express: "GET /api/x 200 12.3 ms") ou JSON (pino-http)
+_REQ_TEXTO_RE = re.compile(
+    rb"\b(GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS)\s+(/\S*)\s+(\d{3})\b[^\n]*?(\d+(?:\.\d+)?)\s*ms\b"
+)
+_REQ_JSON_METODO_RE = re.compile(rb'"method"\s*:\s*"([A-Z]+)"')
+_REQ_JSON_URL_RE = re.compile(rb'"url"\s*:\s*"([^"]+)"')
+_REQ_JSON_STATUS_RE = re.compile(rb'"statusCode"\s*:\s*(\d{3})')
+_REQ_JSON_TEMPO_RE = re.compile(rb'"responseTime"\s*:\s*(\d+(?:\.\d+)?)')
+# Segmentos variáveis da URL (números, UUIDs, hashes) viram ":id" para limitar a cardinalidade
+_URL_ID_RE = re.compile(r"/(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27,}|[0-9a-fA-F]{16,})(?=/|$)")
+
+
+def parse_request_line(linha: bytes):
+    """(método, endpoint normalizado, status, latência em ms) de uma linha de requisição, ou None."""
+    if b" ms" in linha or b"ms " in linha:
+        m = _REQ_TEXTO_RE.search(linha)
+        if m:
+            metodo, url, status, ms = m.groups()
+            return metodo.decode(), normalizar_endpoint(url.decode("utf-8", "replace")), int(status), float(ms)
+    if b'"responseTime"' in linha:
+        partes = [r.search(linha) for r in (_REQ_JSON_METODO_RE, _REQ_JSON_URL_RE, _REQ_JSON_STATUS_RE, _REQ_JSON_TEMPO_RE)]
+        if all(partes):
+            metodo, url, status, ms = (m.group(1) for m in partes)
+            return metodo.decode(), normalizar_endpoint(url.decode("utf-8", "replace")), int(status), float(ms)
+    return None
+
+
+def normalizar_endpoint(url):
+    return _URL_ID_RE.sub("/:id", url.split("?", 1)[0]) or "/"
+
+
+class LatencyAnalyzer:
+    """Análise incremental de latência do app.log em uma única passada.
+
+    Mantém um histograma por endpoint (memória constante por endpoint, no máximo
+    LATENCY_MAX_ENDPOINTS), a série de requisições/erros por minuto dos últimos LATENCY_MINUTES
+    minutos e o offset lido; cada atualizar() processa só as linhas novas.
+    """
+
+    OUTROS = "(outros)"
+    _BLOCO = 4 * 1024 * 1024
+
+    def __init__(self, path, horas_iniciais=None):
+        self.path = path
+        self.horas_iniciais = Config.LATENCY_INITIAL_HOURS if horas_iniciais is None else horas_iniciais
+        # Próximo byte a ler (None = primeira passada ainda não feita)
+        self.offset = None
+        # Interrompe a leitura entre dois blocos (a primeira passada pode levar segundos)
+        self.cancelado = threading.Event()
+        self.zerar()
+
+    def zerar(self):
+        """Descarta as estatísticas (ex.: para medir a partir de uma atualização da API)."""
+        self.endpoints = {}
+        self.geral = EndpointStats()
+        # [minuto (epoch), requisições, erros 5xx]
+        self.por_minuto = collections.deque(maxlen=Config.LATENCY_MINUTES)
+        self.linhas_lidas = 0
+
+    def _registrar_minuto(self, ts, status):
+        minuto = int(ts // 60) * 60
+        erro = 1 if status >= 500 else 0
+        if self.por_minuto and minuto <= self.por_minuto[-1][0]:
+            # Linha fora de ordem: soma no minuto correspondente, se ainda estiver na janela
+            for entrada in reversed(self.por_minuto):
+                if entrada[0] == minuto:
+                    entrada[1] += 1
+                    entrada[2] += erro
+                    break
+            return
+        if self.por_minuto:
+            # Minutos sem requisições também entram na série (com zero)
+            proximo = self.por_minuto[-1][0] + 60
+            for vazio in range(max(proximo, minuto - 60 * Config.LATENCY_MINUTES), minuto, 60):
+                self.por_minuto.append([vazio, 0, 0])
+        self.por_minuto.append([minuto, 1, erro])
+
+    def processar_linha(self, linha):
+        req = parse_request_line(linha)
+        if req is None:
+            return False
+        self._registrar(linha, *req)
+        return True
+
+    def processar_bloco(self, dados):
+        """Processa um bloco de linhas completas; retorna o número de requisições encontradas.
+
+        As requisições são localizadas por regex/find no bloco inteiro, então linhas que não são
+        de requisição não custam nada em Python.
+        """
+        requisicoes = 0
+        for m in _REQ_TEXTO_RE.finditer(dados):
+            inicio = dados.rfind(b"\n", 0, m.start()) + 1
+            metodo, url, status, ms = m.groups()
+            self._registrar(dados[inicio:m.start()], metodo.decode(),
+                            normalizar_endpoint(url.decode("utf-8", "replace")), int(status), float(ms))
+            requisicoes += 1
+        for pos in _ocorrencias(dados, b'"responseTime"'):
+            inicio = dados.rfind(b"\n", 0, pos) + 1
+            fim = dados.find(b"\n", pos)
+            linha = dados[inicio:fim if fim != -1 else len(dados)]
+            if self.processar_linha(linha):
+                requisicoes += 1
+        return requisicoes
+
+    def _registrar(self, linha, metodo, endpoint, status, ms):
+        chave = f"{metodo} {endpoint}"
+        stats = self.endpoints.get(chave)
+        if stats is None:
+            if len(self.endpoints) >= Config.LATENCY_MAX_ENDPOINTS:
+                chave = self.OUTROS
+                stats = self.endpoints.get(chave)
+            if stats is None:
+                stats = self.endpoints[chave] = EndpointStats()
+        stats.registrar(ms, status)
+        self.geral.registrar(ms, status)
+        ts = parse_log_timestamp(linha)
+        if ts is not None:
+            self._registrar_minuto(ts, status)
+
+    def atualizar(self):
+        """Lê as linhas completas acrescentadas desde a última chamada; retorna quantas requisições entraram."""
+        tamanho = os.path.getsize(self.path)
+        if self.offset is None:
+            # Primeira passada: começa LATENCY_INITIAL_HOURS atrás (busca pelo índice do log)
+            indice = LogIndex(self.path)
+            indice.atualizar()
+            self.offset = indice.offset_do_tempo(time.time() - self.horas_iniciais * 3600)
+        elif tamanho < self.offset:
+            # Log rotacionado/truncado: continua do início do arquivo novo
+            self.offset = 0
+
+        requisicoes = 0
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while not self.cancelado.is_set():
+                dados = f.read(self._BLOCO)
+                # Só linhas completas; a última (ainda sendo escrita) fica para a próxima vez
+                corte = dados.rfind(b"\n") + 1
+                if not corte:
+                    break
+                dados = dados[:corte]
+                self.offset += corte
+                self.linhas_lidas += dados.count(b"\n")
+                requisicoes += self.processar_bloco(dados)
+                f.seek(self.offset)
+        return requisicoes
+
+    def throughput(self, minutos=5):
+        """Requisições por minuto: média dos últimos `minutos` minutos completos (até agora)."""
+        agora = int(time.time() // 60) * 60
+        return sum(m[1] for m in self.por_minuto if agora - minutos * 60 <= m[0] < agora) / minutos
+
+    def resumo(self):
+        endpoints = sorted(
+            ((nome, stats.resumo()) for nome, stats in self.endpoints.items()),
+            key=lambda item: item[1]["total"], reverse=True,
+        )
+        return {
+            "geral": self.geral.resumo(),
+            "rpm": self.throughput(),
+            "endpoints": endpoints,
+            "por_minuto": [tuple(m) for m in self.por_minuto],
+            "linhas_lidas": self.linhas_lidas,
+        }
+
+
+class LatencyAnalyticsWorker(QThread):
+    """Worker que atualiza a análise de latência periodicamente e publica o resumo."""
+    # Sinal emitido a cada atualização com o resumo (dict de LatencyAnalyzer.resumo)
+    summary_ready = pyqtSignal(object)
+    # Sinal emitido em caso de falha (mensagem)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, intervalo_ms=Config.LATENCY_REFRESH_MS, parent=None):
+        super().__init__(parent)
+        self.analyzer = LatencyAnalyzer(path)
+        self.intervalo_ms = intervalo_ms
+        self._parar = threading.Event()
+        self._zerar = False
+
+    def zerar(self):
+        """Recomeça as estatísticas a partir das próximas linhas do log."""
+        self._zerar = True
+
+    def parar(self):
+        self._parar.set()
+        self.analyzer.cancelado.set()
+
+    def run(self):
+        while not self._parar.is_set():
+            if self._zerar:
+                self._zerar = False
+                self.analyzer.zerar()
+            try:
+                self.analyzer.atualizar()
+            except OSError as e:
+                self.failed.emit(str(e))
+            else:
+                if not self._parar.is_set():
+                    self.summary_ready.emit(self.analyzer.resumo())
+            self._parar.wait(self.intervalo_ms / 1000.0)
+
+
+class LatencyDialog(QDialog):
+    """Painel de desempenho da API: p50/p95/p99, throughput e taxa de erros por endpoint."""
+
+    # Mantém os workers vivos até terminarem, mesmo que a janela seja fechada (ou destruída) antes
+    _workers_em_andamento = set()
+
+    _COLUNAS = ("Endpoint", "Requisições", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Máx (ms)", "4xx", "5xx", "% erro")
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Desempenho da API")
+        self.resize(900, 500)
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        self.lbl_geral = QLabel("Lendo o log…")
+        self.lbl_geral.setWordWrap(True)
+        self.tabela = QtWidgets.QTableWidget(0, len(self._COLUNAS))
+        self.tabela.setHorizontalHeaderLabels(self._COLUNAS)
+        self.tabela.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.tabela.verticalHeader().setVisible(False)
+        self.tabela.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.btn_zerar = QPushButton("Zerar (medir a partir de agora)")
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.lbl_geral)
+        layout.addWidget(self.tabela)
+        layout.addWidget(self.btn_zerar, 0, QtCore.Qt.AlignRight)
+
+        self.worker = LatencyAnalyticsWorker(path)
+        self.worker.summary_ready.connect(self._on_resumo)
+        self.worker.failed.connect(self._on_falha)
+        self.btn_zerar.clicked.connect(self.worker.zerar)
+        self.worker.finished.connect(lambda w=self.worker: LatencyDialog._workers_em_andamento.discard(w))
+        LatencyDialog._workers_em_andamento.add(self.worker)
+        # Fechada pelo usuário ou destruída junto com o visualizador (sem closeEvent): o worker para
+        self.finished.connect(self.worker.parar)
+        self.destroyed.connect(self.worker.parar)
+        self.worker.start()
+
+    @staticmethod
+    def _ms(valor):
+        return "-" if valor is None else f"{valor:.1f}"
+
+    def _on_resumo(self, resumo):
+        g = resumo["geral"]
+        self.lbl_geral.setText(
+            f"<b>{g['total']}</b> requisições · <b>{resumo['rpm']:.1f}</b>/min (últimos 5 min) · "
+            f"p50 <b>{self._ms(g['p50'])}</b> ms · p95 <b>{self._ms(g['p95'])}</b> ms · "
+            f"p99 <b>{self._ms(g['p99'])}</b> ms · erros 5xx <b>{g['taxa_erro'] * 100:.2f}%</b>"
+        )
+        self.tabela.setRowCount(len(resumo["endpoints"]))
+        for linha, (nome, e) in enumerate(resumo["endpoints"]):
+            valores = (
+                nome, str(e["total"]), self._ms(e["p50"]), self._ms(e["p95"]), self._ms(e["p99"]),
+                self._ms(e["max"]), str(e["erros_4xx"]), str(e["erros_5xx"]), f"{e['taxa_erro'] * 100:.2f}",
+            )
+            for coluna, valor in enumerate(valores):
+                item = QtWidgets.QTableWidgetItem(valor)
+                if coluna:
+                    item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.tabela.setItem(linha, coluna, item)
+
+    def closeEvent(self, event):
+        self.worker.parar()
+        super().closeEvent(event)
+
+    def _on_falha(self, erro):
+        self.lbl_geral.setText(f"Erro ao ler o log: {erro}")
+
+
+class JanelaMinutos:
+    """Contadores por minuto em buffer circular de tamanho fixo (os últimos `minutos` minutos).
+
+    Cada posição guarda o minuto a que pertence; uma posição reaproveitada de um minuto antigo é
+    zerada antes de somar, então não há limpeza periódica nem crescimento de memória.
+    """
+
+    __slots__ = ("minutos", "minuto", "valores")
+
+    def __init__(self, minutos, tipo="d"):
+        self.minutos = minutos
+        self.minuto = array("q", [-1] * minutos)
+        self.valores = array(tipo, [0] * minutos)
+
+    def _posicao(self, ts):
+        """Índice da posição do minuto de `ts` (zerada se era de outro minuto) ou None se já saiu da janela."""
+        minuto = int(ts // 60)
+        i = minuto % self.minutos
+        if self.minuto[i] != minuto:
+            if self.minuto[i] > minuto:
+                # Mais antigo que a janela: a posição já pertence a um minuto mais novo
+                return None
+            self.minuto[i] = minuto
+            self.valores[i] = 0
+        return i
+
+    def somar(self, ts, valor=1):
+        i = self._posicao(ts)
+        if i is not None:
+            self.valores[i] += valor
+
+    def maximizar(self, ts, valor):
+        i = self._posicao(ts)
+        if i is not None and valor > self.valores[i]:
+            self.valores[i] = valor
+
+    def _na_janela(self, minutos, agora):
+        agora = int((time.time() if agora is None else agora) // 60)
+        n = self.minutos if minutos is None else min(minutos, self.minutos)
+        return (v for m, v in zip(self.minuto, self.valores) if agora - n < m <= agora)
+
+    def total(self, minutos=None, agora=None):
+        """Soma dos últimos `minutos` minutos, incluindo o minuto corrente."""
+        return sum(self._na_janela(minutos, agora))
+
+    def maximo(self, minutos=None, agora=None):
+        return max(self._na_janela(minutos, agora), default=0)
+
+
+class CanalPedidos:
+    """Contadores de um canal: eventos por fase em janelas móveis, fila e atraso recebido → processado."""
+
+    FASES = ("recebido", "processado", "cancelado", "erro")
+
+    def __init__(self, minutos):
+        self.eventos = {fase: JanelaMinutos(minutos, "Q") for fase in self.FASES}
+        self.atraso_soma = JanelaMinutos(minutos)
+        self.atraso_qtd = JanelaMinutos(minutos, "Q")
+        self.atraso_max = JanelaMinutos(minutos)
+        # pedido -> timestamp do recebimento, em ordem de chegada (o primeiro é o mais antigo)
+        self.pendentes = collections.OrderedDict()
+
+    def registrar(self, fase, pedido, ts):
+        self.eventos[fase].somar(ts)
+        if not pedido:
+            return
+        if fase == "recebido":
+            if pedido not in self.pendentes:
+                self.pendentes[pedido] = ts
+                if len(self.pendentes) > Config.ORDER_PENDING_MAX:
+                    self.pendentes.popitem(last=False)
+        elif fase in ("processado", "cancelado"):
+            recebido = self.pendentes.pop(pedido, None)
+            if fase == "processado" and recebido is not None:
+                atraso = max(0.0, ts - recebido)
+                self.atraso_soma.somar(ts, atraso)
+                self.atraso_qtd.somar(ts)
+                self.atraso_max.maximizar(ts, atraso)
+
+    def expirar(self, limite):
+        """Descarta pedidos recebidos antes de `limite` que nunca tiveram processamento registrado."""
+        while self.pendentes:
+            if next(iter(self.pendentes.values())) >= limite:
+                break
+            self.pendentes.popitem(last=False)
+
+    def resumo(self, agora=None):
+        agora = time.time() if agora is None else agora
+        qtd = self.atraso_qtd.total(agora=agora)
+        mais_antigo = next(iter(self.pendentes.values()), None)
+        return {
+            "por_minuto": self.eventos["recebido"].total(5, agora) / 5,
+            **{fase: janela.total(agora=agora) for fase, janela in self.eventos.items()},
+            "fila": len(self.pendentes),
+            "espera_max": agora - mais_antigo if mais_antigo is not None else None,
+            "atraso_medio": self.atraso_soma.total(agora=agora) / qtd if qtd else None,
+            "atraso_max": self.atraso_max.maximo(agora=agora) if qtd else None,
+        }
+
+
+_PEDIDO_CANAL_RE = re.compile(
+    rb"\b(" + b"|".join(re.escape(c.lower().encode()) for c in Config.ORDER_CHANNELS) + rb")\b"
+)
+_PEDIDO_ID_RE = re.compile(
+    rb"(?:\b(?:pedido|order_?id|order|id)\b[\"'\s:=#]*|#)([0-9a-z][0-9a-z-]*\d[0-9a-z-]*|\d+)"
+)
+# Palavras (em minúsculas) que indicam a fase do pedido; a primeira fase encontrada vale
+_FASES_PEDIDO = (
+    ("erro", (b"erro", b"falha", b"error", b"fail", b"exception")),
+    ("cancelado", (b"cancel",)),
+    ("processado", (b"processad", b"integrad", b"importad", b"gravad", b"finalizad", b"conclu",
+                    b"processed", b"imported", b"inserted", b"completed")),
+    ("recebido", (b"recebid", b"novo pedido", b"novos pedidos", b"received", b"new order", b"placed")),
+)
+_FASES_PEDIDO_RE = tuple((fase, re.compile(b"|".join(map(re.escape, palavras)))) for fase, palavras in _FASES_PEDIDO)
+
+
+def parse_order_line(linha: bytes):
+    """(canal, fase, pedido ou None) de uma linha do all.log sobre um pedido, ou None.
+
+    O formato do Painel não é estruturado: a linha precisa citar o canal (FastApp, iFood ou
+    NAPP) e uma palavra de fase; o número do pedido é opcional, mas sem ele não há fila nem atraso.
+    """
+    minusculo = linha.lower()
+    m = _PEDIDO_CANAL_RE.search(minusculo)
+    if not m:
+        return None
+    fase = None
+    if nivel_log(linha) == NIVEL_ERROR:
+        fase = "erro"
+    else:
+        for nome, regex in _FASES_PEDIDO_RE:
+            if regex.search(minusculo):
+                fase = nome
+                break
+    if fase is None:
+        return None
+    canal = Config.ORDER_CHANNELS[[c.lower().encode() for c in Config.ORDER_CHANNELS].index(m.group(1))]
+    pedido = _PEDIDO_ID_RE.search(minusculo)
+    return canal, fase, pedido.group(1).decode() if pedido else None
+
+
+class OrderThroughputAnalyzer:
+    """Agregação incremental dos eventos de pedido do all.log do Painel, por canal e fase.
+
+    Mesma estratégia do LatencyAnalyzer: a primeira passada começa ORDER_INITIAL_HOURS atrás
+    (pelo índice do log) e cada atualizar() lê só os blocos novos; as janelas são buffers
+    circulares de ORDER_WINDOW_MINUTES minutos, então a memória não cresce com o log.
+    """
+
+    _BLOCO = 4 * 1024 * 1024
+
+    def __init__(self, path, horas_iniciais=None):
+        self.path = path
+        self.horas_iniciais = Config.ORDER_INITIAL_HOURS if horas_iniciais is None else horas_iniciais
+        self.offset = None
+        # True durante a primeira passada, que lê o histórico (não as linhas que acabaram de chegar)
+        self.historico = False
+        self.canais = {canal: CanalPedidos(Config.ORDER_WINDOW_MINUTES) for canal in Config.ORDER_CHANNELS}
+        self.eventos_lidos = 0
+
+    def processar_linha(self, linha):
+        evento = parse_order_line(linha)
+        if evento is None:
+            return False
+        canal, fase, pedido = evento
+        ts = parse_log_timestamp(linha)
+        if ts is None:
+            # Sem data só dá para usar "agora", o que no histórico criaria um pico falso na partida
+            if self.historico:
+                return False
+            ts = time.time()
+        self.canais[canal].registrar(fase, pedido, ts)
+        self.eventos_lidos += 1
+        return True
+
+    def processar_bloco(self, dados):
+        """Processa um bloco de linhas completas; só as linhas que citam um canal são examinadas."""
+        eventos = 0
+        ultima = -1
+        for m in _PEDIDO_CANAL_RE.finditer(dados.lower()):
+            inicio = dados.rfind(b"\n", 0, m.start()) + 1
+            if inicio == ultima:
+                continue
+            ultima = inicio
+            fim = dados.find(b"\n", m.end())
+            if self.processar_linha(dados[inicio:fim if fim != -1 else len(dados)]):
+                eventos += 1
+        return eventos
+
+    def atualizar(self):
+        """Lê as linhas completas acrescentadas desde a última chamada; retorna quantos eventos entraram."""
+        tamanho = os.path.getsize(self.path)
+        if self.offset is None:
+            indice = LogIndex(self.path)
+            indice.atualizar()
+            self.offset = indice.offset_do_tempo(time.time() - self.horas_iniciais * 3600)
+            self.historico = True
+        elif tamanho < self.offset:
+            # Log rotacionado/truncado: continua do início do arquivo novo
+            self.offset = 0
+
+        eventos = 0
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while True:
+                dados = f.read(self._BLOCO)
+                corte = dados.rfind(b"\n") + 1
+                if not corte:
+                    break
+                self.offset += corte
+                eventos += self.processar_bloco(dados[:corte])
+                f.seek(self.offset)
+        self.historico = False
 
-                if count == 0:
-                    return False, f"O código não foi encontrado no banco de dados:\n\n- {error_msg}" 
+        limite = time.time() - Config.ORDER_PENDING_EXPIRE_HOURS * 3600
+        for canal in self.canais.values():
+            canal.expirar(limite)
+        return eventos
 
-            # Se chegou até aqui, todas as validações passaram
-            return True, None
+    def resumo(self):
+        agora = time.time()
+        return {canal: stats.resumo(agora) for canal, stats in self.canais.items()}
 
-        except pyodbc.Error as e:
-            return False, f"Falha durante a validação no banco de dados. Verifique os dados de conexão ou as permissões:\n\n{e}"
-        except Exception as e:
-            return False, f"Ocorreu um erro inesperado durante a validação:\n\n{e}"
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
-class EnvEditorDialog(QDialog):
-    
-    def __init__(self, env_path, parent=None):
+class OrderThroughputWorker(QThread):
+    """Worker que acompanha o all.log do Painel e publica a vazão de pedidos por canal."""
+    # Sinal emitido a cada atualização com o resumo ({canal: dict})
+    summary_ready = pyqtSignal(object)
+    # Sinal emitido quando o log não pode ser lido (mensagem)
+    failed = pyqtSignal(str)
+
+    def __init__(self, intervalo_ms=Config.ORDER_REFRESH_MS, parent=None):
         super().__init__(parent)
-        self.setWindowTitle("Editar configurações")
-        self.env_path = env_path
+        self.intervalo_ms = intervalo_ms
+        self.analyzer = None
+        self._parar = threading.Event()
 
-        try:
-            self.setFixedSize(600, 300)
-        except Exception:
-            pass
+    def parar(self):
+        self._parar.set()
 
-        # 1. Crie o layout principal (QGridLayout)
-        layout = QGridLayout(self)
+    def run(self):
+        while not self._parar.is_set():
+            # O Painel pode ser instalado com o gerenciador já aberto: o caminho é verificado a cada ciclo
+            caminho = Config.get_painel_log_all_path()
+            if not caminho or not os.path.exists(caminho):
+                self.analyzer = None
+                self.failed.emit("Log do Painel de Pedidos não encontrado")
+            else:
+                if self.analyzer is None or self.analyzer.path != caminho:
+                    self.analyzer = OrderThroughputAnalyzer(caminho)
+                try:
+                    self.analyzer.atualizar()
+                except OSError as e:
+                    self.failed.emit(str(e))
+                else:
+                    self.summary_ready.emit(self.analyzer.resumo())
+            self._parar.wait(self.intervalo_ms / 1000.0)
+
+
+class OrderThroughputPanel(QtWidgets.QGroupBox):
+    """Painel compacto com a vazão de pedidos por canal, para a janela principal."""
+
+    # (cabeçalho, dica)
+    _COLUNAS = (
+        ("Canal", ""), ("Rec./min", "Pedidos recebidos por minuto (últimos 5 min)"),
+        ("Proc.", "Pedidos processados na janela"), ("Erros", "Erros de pedido na janela"),
+        ("Canc.", "Pedidos cancelados na janela"), ("Fila", "Pedidos recebidos ainda não processados"),
+        ("Espera", "Há quanto tempo o pedido mais antigo da fila aguarda"),
+        ("Atraso", "Atraso médio entre recebimento e processamento na janela"),
+        ("Máx.", "Maior atraso entre recebimento e processamento na janela"),
+    )
 
-        # 2. Crie todos os widgets ANTES de adicioná-los ao layout
-        self.hostname = QLineEdit()
-        self.porta = QLineEdit()
-        self.banco = QLineEdit()
-        self.usuario = QLineEdit()
-        self.senha = QLineEdit()
-        self.senha.setEchoMode(QLineEdit.Password) 
-        self.cod_vendedor = QLineEdit()
-        self.cod_produto_servico = QLineEdit()
-        self.cod_produto_entrega = QLineEdit()
-        self.pagamento_entrega = QLineEdit()
-        self.pagamento_online = QLineEdit()
-        self.email = QLineEdit() 
+    def __init__(self, parent=None):
+        super().__init__(f"Pedidos do Painel (últimos {Config.ORDER_WINDOW_MINUTES} min)", parent)
+        self.tabela = QtWidgets.QTableWidget(len(Config.ORDER_CHANNELS), len(self._COLUNAS))
+        for coluna, (titulo, dica) in enumerate(self._COLUNAS):
+            cabecalho = QtWidgets.QTableWidgetItem(titulo)
+            cabecalho.setToolTip(dica)
+            self.tabela.setHorizontalHeaderItem(coluna, cabecalho)
+        self.tabela.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        self.tabela.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.tabela.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.tabela.verticalHeader().setVisible(False)
+        self.tabela.verticalHeader().setDefaultSectionSize(20)
+        self.tabela.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tabela.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.tabela.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.tabela.setStyleSheet("QTableWidget { font-size: 8pt; } QHeaderView::section { font-size: 8pt; }")
+        self.lbl_aviso = QLabel("")
+        self.lbl_aviso.setStyleSheet("color: gray;")
+        for linha, canal in enumerate(Config.ORDER_CHANNELS):
+            self.tabela.setItem(linha, 0, QtWidgets.QTableWidgetItem(canal))
+        # Altura exata para todas as linhas, sem rolagem
+        self.tabela.setFixedHeight(
+            self.tabela.horizontalHeader().sizeHint().height()
+            + self.tabela.verticalHeader().length() + 2 * self.tabela.frameWidth()
+        )
 
-        # ------------------------------------------------------------------
-        # ORGANIZAÇÃO EM GRADE (4 COLUNAS)
-        # ------------------------------------------------------------------
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(6, 4, 6, 4)
+        layout.setSpacing(2)
+        layout.addWidget(self.tabela)
+        layout.addWidget(self.lbl_aviso)
 
-        linha = 0
-        layout.addWidget(QLabel("Nome do Servidor"), linha, 0)
-        layout.addWidget(self.hostname, linha, 1)
-        layout.addWidget(QLabel("Vendedor Padrão"), linha, 2)
-        layout.addWidget(self.cod_vendedor, linha, 3)
+    @staticmethod
+    def _tempo(segundos):
+        return "-" if segundos is None else formatar_duracao(segundos)
+
+    def atualizar(self, resumo):
+        self.lbl_aviso.setText(f"Atualizado às {time.strftime('%H:%M:%S')}")
+        alerta = Config.ORDER_BACKLOG_ALERT_MINUTES * 60
+        for linha, canal in enumerate(Config.ORDER_CHANNELS):
+            r = resumo[canal]
+            valores = (
+                f"{r['por_minuto']:.1f}", str(r["processado"]), str(r["erro"]), str(r["cancelado"]),
+                str(r["fila"]), self._tempo(r["espera_max"]), self._tempo(r["atraso_medio"]),
+                self._tempo(r["atraso_max"]),
+            )
+            for coluna, valor in enumerate(valores, start=1):
+                item = QtWidgets.QTableWidgetItem(valor)
+                item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                if coluna == 6 and r["espera_max"] is not None and r["espera_max"] >= alerta:
+                    # Pedido parado na fila há mais de ORDER_BACKLOG_ALERT_MINUTES: destaca antes que a loja perceba
+                    item.setBackground(QtGui.QColor("#FFCDD2"))
+                    item.setToolTip(f"Há pedido {canal} aguardando processamento há {formatar_duracao(r['espera_max'])}")
+                self.tabela.setItem(linha, coluna, item)
+
+    def mostrar_falha(self, mensagem):
+        self.lbl_aviso.setText(mensagem)
+
+
+class MergedLogWorker(QThread):
+    """Worker que gera a linha do tempo combinada dos logs e entrega as linhas em lotes."""
+    # Sinal emitido a cada lote de linhas [(nome da fonte, texto), ...]
+    lines_ready = pyqtSignal(list)
+    # Sinal emitido ao terminar (resumo)
+    done = pyqtSignal(str)
+    # Sinal emitido em caso de falha (mensagem)
+    failed = pyqtSignal(str)
+
+    LOTE = 2000
+
+    def __init__(self, inicio=None, fim=None, correlacao=None, parent=None):
+        super().__init__(parent)
+        self.inicio = inicio
+        self.fim = fim
+        self.correlacao = correlacao
+        self._cancelado = False
 
-        linha += 1
-        layout.addWidget(QLabel("Porta"), linha, 0)
-        layout.addWidget(self.porta, linha, 1)
-        layout.addWidget(QLabel("Produto do tipo 'Serviço' "), linha, 2)
-        layout.addWidget(self.cod_produto_servico, linha, 3)
+    def cancelar(self):
+        self._cancelado = True
 
-        linha += 1
-        layout.addWidget(QLabel("Banco de Dados"), linha, 0)
-        layout.addWidget(self.banco, linha, 1)
-        layout.addWidget(QLabel("Produto do tipo 'Entrega' "), linha, 2)
-        layout.addWidget(self.cod_produto_entrega, linha, 3)
+    def run(self):
+        inicio = time.perf_counter()
+        lote = []
+        total = 0
+        try:
+            for _, nome, linha in mesclar_logs(inicio=self.inicio, fim=self.fim, correlacao=self.correlacao):
+                if self._cancelado:
+                    return
+                lote.append((nome, linha))
+                total += 1
+                if len(lote) >= self.LOTE:
+                    self.lines_ready.emit(lote)
+                    lote = []
+                if total >= Config.LOG_SEARCH_MAX_RESULTS:
+                    break
+        except OSError as e:
+            if not self._cancelado:
+                self.failed.emit(str(e))
+            return
 
-        linha += 1
-        layout.addWidget(QLabel("Usuário"), linha, 0)
-        layout.addWidget(self.usuario, linha, 1)
-        layout.addWidget(QLabel("Forma Pgto - Entrega"), linha, 2)
-        layout.addWidget(self.pagamento_entrega, linha, 3)
+        if self._cancelado:
+            return
+        if lote:
+            self.lines_ready.emit(lote)
+        limite = " (limite atingido)" if total >= Config.LOG_SEARCH_MAX_RESULTS else ""
+        self.done.emit(f"{total} linhas{limite} em {time.perf_counter() - inicio:.2f}s")
 
-        linha += 1
-        layout.addWidget(QLabel("Senha"), linha, 0)
-        layout.addWidget(self.senha, linha, 1)
-        layout.addWidget(QLabel("Forma Pgto - Aplicativo"), linha, 2)
-        layout.addWidget(self.pagamento_online, linha, 3)
 
-        # ------------------------------------------------------------------
-        # CAMPO EMAIL
-        # ------------------------------------------------------------------
+class MergedLogModel(QtCore.QAbstractListModel):
+    """Linhas da linha do tempo combinada, marcadas com a fonte e coloridas por fonte/nível."""
 
-        linha += 1
-        layout.addWidget(QLabel("E-mail"), linha, 0)
-        layout.addWidget(self.email, linha, 1, 1, 3)
+    _CORES_FONTE = {"API": QtGui.QColor("#1565C0"), "Painel": QtGui.QColor("#2E7D32")}
 
-        # ------------------------------------------------------------------
-        # CONFIGURAÇÃO DE LAYOUT E ESTILO
-        # ------------------------------------------------------------------
-        layout.setColumnStretch(1, 1)
-        layout.setColumnStretch(3, 1)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.linhas = []
 
-        self.setStyleSheet("""
-        QLineEdit {
-            border-radius: 5px; 
-            padding: 5px;
-            border: 1px solid #cccccc; 
-        }
-        """)
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.linhas)
 
-        # QDialogButtonBox
-        buttons = QDialogButtonBox(QDialogButtonBox.Ok ) 
-        buttons.accepted.connect(self.accept)
-        buttons.rejected.connect(self.reject)
-        buttons.setCenterButtons(True) 
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        nome, linha = self.linhas[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return f"{nome:<6} │ {linha}"
+        if role == QtCore.Qt.ForegroundRole:
+            nivel = nivel_log(linha[:200].encode("utf-8", errors="replace"))
+            for bit, cor in LogListModel._CORES:
+                if nivel == bit:
+                    return cor
+            return self._CORES_FONTE.get(nome)
+        return None
+
+    def limpar(self):
+        self.beginResetModel()
+        self.linhas = []
+        self.endResetModel()
+
+    def anexar(self, lote):
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.linhas), len(self.linhas) + len(lote) - 1)
+        self.linhas.extend(lote)
+        self.endInsertRows()
+
+
+class MergedLogDialog(QDialog):
+    """Linha do tempo única dos logs da API e do Painel de Pedidos, para rastrear um pedido."""
+
+    # Mantém os workers vivos até terminarem, mesmo que a janela seja fechada antes
+    _workers_em_andamento = set()
 
-        ok_button = buttons.button(QDialogButtonBox.Ok)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Linha do tempo: API + Painel de Pedidos")
+        self.resize(1100, 600)
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self.worker = None
+
+        self.txt_correlacao = QLineEdit()
+        self.txt_correlacao.setPlaceholderText("Pedido / ID de correlação (opcional)")
+        self.txt_correlacao.returnPressed.connect(self.gerar)
+        agora = QtCore.QDateTime.currentDateTime()
+        self.dt_inicio = QtWidgets.QDateTimeEdit(agora.addSecs(-3600))
+        self.dt_fim = QtWidgets.QDateTimeEdit(agora)
+        for dt in (self.dt_inicio, self.dt_fim):
+            dt.setDisplayFormat("dd/MM/yyyy HH:mm")
+            dt.setCalendarPopup(True)
+        self.btn_gerar = QPushButton("Gerar")
+        self.btn_gerar.clicked.connect(self.gerar)
+
+        filtros = QtWidgets.QHBoxLayout()
+        filtros.addWidget(self.txt_correlacao, 1)
+        filtros.addWidget(QLabel("De"))
+        filtros.addWidget(self.dt_inicio)
+        filtros.addWidget(QLabel("até"))
+        filtros.addWidget(self.dt_fim)
+        filtros.addWidget(self.btn_gerar)
+
+        self.model = MergedLogModel(self)
+        self.view = QtWidgets.QListView()
+        self.view.setModel(self.model)
+        self.view.setUniformItemSizes(True)
+        self.view.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+
+        fontes = ", ".join(fontes_de_log()) or "nenhum log encontrado"
+        self.lbl_info = QLabel(f"Fontes: {fontes}")
 
-        if ok_button:
-            ok_button.setText("Salvar")
-            ok_button.setFixedSize(500, 35) 
-            ok_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #4CAF50;
-                    color: white;
-                    border: none;
-                    border-radius: 6px;
-                    font-size: 14px;
-                    font-weight: bold;
-                }
-                QPushButton:hover {
-                    background-color: #45A049;
-                }
-                QPushButton:pressed {
-                    background-color: #3E8E41;
-                }
-            """)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addLayout(filtros)
+        layout.addWidget(self.view)
+        layout.addWidget(self.lbl_info)
+
+    def gerar(self):
+        if self.worker is not None:
+            self.worker.cancelar()
+        inicio = self.dt_inicio.dateTime().toSecsSinceEpoch()
+        fim = self.dt_fim.dateTime().toSecsSinceEpoch() + 59
+        worker = MergedLogWorker(inicio, fim, self.txt_correlacao.text().strip() or None)
+        worker.lines_ready.connect(self._on_linhas)
+        worker.done.connect(self._on_concluido)
+        worker.failed.connect(self._on_falha)
+        worker.finished.connect(lambda w=worker: MergedLogDialog._workers_em_andamento.discard(w))
+        MergedLogDialog._workers_em_andamento.add(worker)
+        self.worker = worker
+        self.model.limpar()
+        self.lbl_info.setText("Gerando linha do tempo…")
+        worker.start()
+
+    def _on_linhas(self, lote):
+        if self.sender() is self.worker:
+            self.model.anexar(lote)
+
+    def _on_concluido(self, resumo):
+        if self.sender() is self.worker:
+            self.worker = None
+            self.lbl_info.setText(resumo)
+
+    def _on_falha(self, erro):
+        if self.sender() is self.worker:
+            self.worker = None
+            self.lbl_info.setText(f"Erro ao ler os logs: {erro}")
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancelar()
+        super().closeEvent(event)
+
+
+class LogViewerDialog(QDialog):
+    """Visualizador de log embutido: abre pela cauda do arquivo e acompanha o que é gravado."""
+
+    # Mantém as buscas vivas até terminarem, mesmo que a janela seja fechada antes
+    _buscas_em_andamento = set()
+
+    def __init__(self, path, titulo, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(titulo)
+        self.resize(1000, 600)
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        self.log = LogFile(path).abrir_cauda()
+        self.model = LogListModel(self.log, self)
+
+        self.view = QtWidgets.QListView()
+        self.view.setModel(self.model)
+        # Altura fixa por linha: a view não precisa medir as linhas fora da tela
+        self.view.setUniformItemSizes(True)
+        self.view.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.view.verticalScrollBar().valueChanged.connect(self._on_scroll)
+
+        self.chk_seguir = QtWidgets.QCheckBox("Seguir (mostrar novas linhas)")
+        self.chk_seguir.setChecked(True)
+        self.chk_seguir.toggled.connect(self._on_seguir)
+        self.lbl_info = QLabel("")
+
+        # Filtros (usam o índice persistente do log: nível, intervalo de horário e texto)
+        self.search_worker = None
+        # Mapeamento solto a pedido da retenção (rotação em andamento)
+        self._liberado = False
+        self.txt_busca = QLineEdit()
+        self.txt_busca.setPlaceholderText("Texto (ex.: número do pedido)")
+        self.txt_busca.returnPressed.connect(self.buscar)
+        self.cmb_nivel = QtWidgets.QComboBox()
+        self.cmb_nivel.addItem("Todos os níveis", 0)
+        self.cmb_nivel.addItem("Somente erros", NIVEL_ERROR)
+        self.cmb_nivel.addItem("Erros e avisos", NIVEL_ERROR | NIVEL_WARN)
+        agora = QtCore.QDateTime.currentDateTime()
+        self.chk_periodo = QtWidgets.QCheckBox("De")
+        self.dt_inicio = QtWidgets.QDateTimeEdit(agora.addSecs(-3600))
+        self.dt_fim = QtWidgets.QDateTimeEdit(agora)
+        for dt in (self.dt_inicio, self.dt_fim):
+            dt.setDisplayFormat("dd/MM/yyyy HH:mm")
+            dt.setCalendarPopup(True)
+        self.btn_buscar = QPushButton("Filtrar")
+        self.btn_buscar.clicked.connect(self.buscar)
+        self.btn_limpar = QPushButton("Limpar")
+        self.btn_limpar.clicked.connect(self.limpar_filtro)
+        self.btn_limpar.setEnabled(False)
+        self.btn_linha_tempo = QPushButton("Linha do tempo API + Painel")
+        self.btn_linha_tempo.clicked.connect(lambda: MergedLogDialog(self).show())
+        self.btn_desempenho = QPushButton("Desempenho da API")
+        self.btn_desempenho.clicked.connect(lambda: LatencyDialog(path, self).show())
+        # A análise de latência entende as linhas de requisição da API, não o log do Painel
+        self.btn_desempenho.setVisible(os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(Config.LOG_PATH_API)))
+
+        filtros = QtWidgets.QHBoxLayout()
+        filtros.addWidget(self.txt_busca, 1)
+        filtros.addWidget(self.cmb_nivel)
+        filtros.addWidget(self.chk_periodo)
+        filtros.addWidget(self.dt_inicio)
+        filtros.addWidget(QLabel("até"))
+        filtros.addWidget(self.dt_fim)
+        filtros.addWidget(self.btn_buscar)
+        filtros.addWidget(self.btn_limpar)
+
+        rodape = QtWidgets.QHBoxLayout()
+        rodape.addWidget(self.chk_seguir)
+        rodape.addWidget(self.btn_linha_tempo)
+        rodape.addWidget(self.btn_desempenho)
+        rodape.addStretch(1)
+        rodape.addWidget(self.lbl_info)
 
-        botoes_layout = QtWidgets.QHBoxLayout()
-        botoes_layout.addWidget(buttons)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addLayout(filtros)
+        layout.addWidget(self.view)
+        layout.addLayout(rodape)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self._atualizar)
+        self.timer.start(Config.LOG_VIEWER_POLL_MS)
+
+        self._atualizar_info()
+        self.view.scrollToBottom()
+
+    def _on_seguir(self, marcado):
+        if marcado:
+            self.view.scrollToBottom()
+
+    def buscar(self):
+        """Filtra o log em segundo plano usando o índice persistente."""
+        texto = self.txt_busca.text().strip() or None
+        niveis = self.cmb_nivel.currentData()
+        inicio = fim = None
+        if self.chk_periodo.isChecked():
+            inicio = self.dt_inicio.dateTime().toSecsSinceEpoch()
+            fim = self.dt_fim.dateTime().toSecsSinceEpoch() + 59
+        if not (texto or niveis or self.chk_periodo.isChecked()):
+            self.limpar_filtro()
+            return
 
-        linha += 1
-        layout.addLayout(botoes_layout, linha, 0, 1, 4)
+        if self.search_worker is not None:
+            self.search_worker.cancelar()
+        worker = LogSearchWorker(self.log.path, texto, niveis, inicio, fim)
+        worker.results_ready.connect(self._on_resultados)
+        worker.failed.connect(lambda erro: self.lbl_info.setText(f"Erro na busca: {erro}"))
+        worker.finished.connect(lambda w=worker: LogViewerDialog._buscas_em_andamento.discard(w))
+        LogViewerDialog._buscas_em_andamento.add(worker)
+        self.search_worker = worker
+        self.btn_buscar.setEnabled(False)
+        self.lbl_info.setText("Buscando…")
+        worker.start()
+
+    def _on_resultados(self, offsets, resumo):
+        if self.sender() is not self.search_worker:
+            return
+        self.search_worker = None
+        self.btn_buscar.setEnabled(True)
+        self.btn_limpar.setEnabled(True)
+        self.chk_seguir.setChecked(False)
+        self.model.definir_filtro(offsets)
+        self.view.scrollToTop()
+        self.lbl_info.setText(resumo)
+
+    def limpar_filtro(self):
+        if self.search_worker is not None:
+            self.search_worker.cancelar()
+            self.search_worker = None
+        self.btn_buscar.setEnabled(True)
+        self.btn_limpar.setEnabled(False)
+        self.model.definir_filtro(None)
+        self._atualizar_info()
+        self.chk_seguir.setChecked(True)
+
+    def _on_scroll(self, valor):
+        """Ao chegar ao topo, carrega mais linhas antigas mantendo a posição visível."""
+        if valor != 0 or self.model.filtro is not None or not self.model.tem_anteriores():
+            return
+        inseridas = self.model.carregar_anteriores(Config.LOG_VIEWER_TAIL_LINES)
+        if inseridas:
+            self.view.scrollTo(self.model.index(inseridas), QtWidgets.QAbstractItemView.PositionAtTop)
+            self._atualizar_info()
 
-        self._load_values()
-        
-        
-    def validate_and_save(self):
-        # 1. Obter dados do formulário
-        host = self.hostname.text().strip()
-        port = self.porta.text().strip()
-        db = self.banco.text().strip()
-        user = self.usuario.text().strip()
-        pwd = self.senha.text().strip()
+    def _atualizar(self):
+        try:
+            novas = self.model.atualizar()
+        except OSError as e:
+            self.lbl_info.setText(f"Erro ao ler o log: {e}")
+            return
+        if novas:
+            self._atualizar_info()
+            if self.chk_seguir.isChecked():
+                self.view.scrollToBottom()
 
-        cod_vendedor = self.cod_vendedor.text().strip()
-        cod_produto_servico = self.cod_produto_servico.text().strip()
-        cod_produto_entrega = self.cod_produto_entrega.text().strip()
-        pagamento_entrega = self.pagamento_entrega.text().strip()
-        pagamento_online = self.pagamento_online.text().strip()
-        
-        # 2. Usar a classe DatabaseValidator
-        validator = DatabaseValidator(host, port, db, user, pwd)
-        is_valid, error_message = validator.check_connection_and_codes(
-            cod_vendedor, cod_produto_servico, cod_produto_entrega, pagamento_entrega, pagamento_online
-        )
+    def _mesmo_log(self, caminho):
+        return os.path.normcase(os.path.abspath(caminho)) == os.path.normcase(os.path.abspath(self.log.path))
 
-        if not is_valid:
-            QMessageBox.critical(
-                self, "Erro de Validação ou Conexão", error_message
-            )
-            return False
-        
-        return True
+    def liberar_arquivo(self, caminho):
+        """Solta o log durante a rotação: no Windows o truncate falha enquanto o arquivo está mapeado."""
+        if self._liberado or not self.isVisible() or not self._mesmo_log(caminho):
+            return
+        self._liberado = True
+        self.timer.stop()
+        if self.search_worker is not None or self.model.filtro is not None:
+            # Os offsets de uma busca deixam de valer com o truncate
+            self.limpar_filtro()
+        self.model.fechar()
+        self.lbl_info.setText("Rotacionando o log…")
+
+    def reabrir_arquivo(self, caminho, erro):
+        """Fim da rotação (ou rotação adiada, com o motivo em `erro`): volta a acompanhar o log."""
+        if not self._liberado or not self._mesmo_log(caminho):
+            return
+        self._liberado = False
+        if not self.isVisible():
+            return
+        self.timer.start(Config.LOG_VIEWER_POLL_MS)
+        self._atualizar()
+        if erro:
+            self.lbl_info.setText(f"Rotação do log adiada: {erro}")
 
-    def accept(self):
-        """
-        Sobrescreve o método accept (chamado pelo botão Salvar) para incluir a validação
-        antes de realmente aceitar e fechar o diálogo.
-        """
-        if self.validate_and_save():
-            super().accept()
-        
-    def _load_values(self):
-        # A lógica de carregamento do ENV permanece aqui, pois manipula os widgets
-        try:
-            if not os.path.exists(self.env_path):
-                return
-                
-            with open(self.env_path, "r", encoding="utf-8") as f:
-                for raw in f:
-                    line = raw.strip()
-                    if not line or line.startswith("#") or "=" not in line:
-                        continue
-                    key, val = line.split("=", 1)
-                    key, val = key.strip(), val.strip()
-                    if "#" in val:
-                        val = val.split("#", 1)[0].strip()
-                    if val.startswith('"') and val.endswith('"'):
-                        val = val[1:-1]
-
-                    if key == "DATABASE_URL":
-                        try:
-                            if val.startswith("sqlserver://"):
-                                body = val[len("sqlserver://") :]
-                                if ";" in body:
-                                    hostport, rest = body.split(";",1)
-                                else:
-                                    hostport, rest = body, ""
-                                if ":" in hostport:
-                                    h, p = hostport.split(":", 1)
-                                else:
-                                    h, p = hostport, ""
-                                self.hostname.setText(h)
-                                self.porta.setText(p)
-                                parts = rest.split(";") if rest else []
-                                for part in parts:
-                                    if "=" not in part:
-                                        continue
-                                    k, v = part.split("=", 1)
-                                    k, v = k.strip().lower(), v.strip().strip('"')
-                                    if k == "database":
-                                        self.banco.setText(v)
-                                    elif k == "user":
-                                        self.usuario.setText(v)
-                                    elif k == "password":
-                                        self.senha.setText(v)
-                        except Exception:
-                            self.hostname.setText(val)
-                    elif key == "COD_VENDEDOR":
-                        self.cod_vendedor.setText(val)
-                    elif key == "COD_PRODUTO_SERVICO":
-                        self.cod_produto_servico.setText(val)
-                    elif key == "COD_PRODUTO_ENTREGA":
-                        self.cod_produto_entrega.setText(val)
-                    elif key == "PAGAMENTO_ENTREGA":
-                        self.pagamento_entrega.setText(val)
-                    elif key == "PAGAMENTO_ONLINE":
-                        self.pagamento_online.setText(val)
-                    elif key == "EMAIL":
-                        self.email.setText(val)
-        except Exception as e:
-            parent = self.parent()
-            if parent is not None:
-                QtWidgets.QMessageBox.warning(parent, "Erro", f"Erro ao ler ENV:\n{e}")
+    def _atualizar_info(self):
+        if self.model.filtro is not None:
+            return
+        parcial = " (role ao topo para carregar mais)" if self.model.tem_anteriores() else ""
+        linhas = f"{self.model.rowCount():,}".replace(",", ".")
+        self.lbl_info.setText(f"{linhas} linhas carregadas{parcial} · {self.log.tamanho / (1024 * 1024):.1f} MB")
 
-    def get_updates(self):
-        out = {}
-        host = self.hostname.text().strip()
-        port = self.porta.text().strip()
-        db = self.banco.text().strip()
-        user = self.usuario.text().strip()
-        pwd = self.senha.text().strip()
+    def closeEvent(self, event):
+        self.timer.stop()
+        if self.search_worker is not None:
+            self.search_worker.cancelar()
+        self.log.fechar()
+        super().closeEvent(event)
 
-        if host:
-            hostport = f"{host}:{port}" if port else host
-            parts = [f"sqlserver://{hostport}"]
-            if db:
-                parts.append(f"database={db}")
-            if user:
-                parts.append(f"user={user}")
-            if pwd:
-                parts.append(f"password={pwd}")
-            parts.append("trustServerCertificate=true")
-            composed = ";".join(parts)
-            out["DATABASE_URL"] = f'"{composed}"'
 
-        out["COD_VENDEDOR"] = self.cod_vendedor.text() or ""
-        out["COD_PRODUTO_SERVICO"] = self.cod_produto_servico.text() or ""
-        out["COD_PRODUTO_ENTREGA"] = self.cod_produto_entrega.text() or ""
-        out["PAGAMENTO_ENTREGA"] = self.pagamento_entrega.text() or ""
-        out["PAGAMENTO_ONLINE"] = self.pagamento_online.text() or ""
-        out["EMAIL"] = self.email.text() or ""
-        return out
+def _bloqueando_acoes(metodo):
+    """Decora uma ação da janela principal para que os botões fiquem desabilitados do início ao fim."""
+    @functools.wraps(metodo)
+    def executar(self):
+        with self._acoes_bloqueadas():
+            return metodo(self)
+    return executar
 
 
 # --- CLASSE GerenciadorServicos ---
@@ -696,6 +5384,9 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
 
         self.create_default_env_if_missing()
 
+        # Backend de serviços (SCM/NSSM no Windows)
+        self.service_backend = create_service_backend(self.get_service_paths()[0])
+
         icon_path = os.path.join(self.base_dir, "assets", "gestor.apihub.ico")
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
@@ -735,7 +5426,60 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
         
         # Configura ícones e estilos (incluindo o botão de desinstalar)
         self._setup_icons() 
-        self.atualizar_status_servico()
+
+        # Monitor de status em segundo plano: a janela só é reestilizada quando o estado muda
+        self._status_servicos = {}
+        self.ultimos_tempos_partida = {}
+        self._transicoes_em_andamento = 0
+        self.status_monitor = StatusMonitorWorker(
+            self.service_backend, [Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS], parent=self
+        )
+        self.status_monitor.status_changed.connect(self.on_status_servico_alterado)
+        self.status_monitor.start()
+
+        # Retenção dos logs (rotação, compressão e limpeza por TIME_LOG) em segundo plano
+        self.log_retention = LogRetentionWorker(self.env_path, parent=self)
+        self.log_retention.rotation_starting.connect(self._liberar_log_para_rotacao)
+        self.log_retention.rotation_finished.connect(self._reabrir_log_apos_rotacao)
+        self.log_retention.start()
+
+        # Vazão de pedidos do Painel: a janela cresce para baixo para acomodar o painel
+        self.painel_pedidos = OrderThroughputPanel(self.centralwidget)
+        self.painel_pedidos.setGeometry(QtCore.QRect(20, 232, 581, self.painel_pedidos.sizeHint().height()))
+        altura = self.painel_pedidos.geometry().bottom() + 12
+        self.setMaximumSize(QtCore.QSize(621, altura))
+        self.resize(621, altura)
+        self.order_throughput = OrderThroughputWorker(parent=self)
+        self.order_throughput.summary_ready.connect(self.painel_pedidos.atualizar)
+        self.order_throughput.failed.connect(self.painel_pedidos.mostrar_falha)
+        self.order_throughput.start()
+
+    def closeEvent(self, event):
+        """Encerra o monitor de status, a retenção de logs e a vazão de pedidos antes de fechar a janela."""
+        self.status_monitor.parar()
+        self.log_retention.parar()
+        self.order_throughput.parar()
+        self.status_monitor.wait(2000)
+        self.log_retention.wait(5000)
+        self.order_throughput.wait(2000)
+        rede = http_client.resumo_texto()
+        if rede:
+            print(f"Rede (últimas requisições):\n{rede}")
+        super().closeEvent(event)
+
+    def on_status_servico_alterado(self, nome_servico, anterior, status):
+        """Recebe as mudanças de status do monitor e atualiza a interface."""
+        self._status_servicos[nome_servico] = status
+
+        if hasattr(self, "lblStatusServico"):
+            self.lblStatusServico.setToolTip("\n".join(
+                f"{nome}: {st}" for nome, st in self._status_servicos.items()
+            ))
+
+        # Os botões refletem o status da API (vmd-api-hub); durante uma operação ficam
+        # desabilitados e o último status é aplicado quando ela termina
+        if nome_servico == Config.SERVICE_NAME_API and not self._transicoes_em_andamento:
+            self._aplicar_status(status)
         
     def get_update_button_style(self):
         """Estilo para o botão de atualização."""
@@ -811,6 +5555,7 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
         button.setIconSize(size)
 
 
+    @_bloqueando_acoes
     def on_btn_servico_click(self):
         """
         Ação para o botão btnServico: SOMENTE PARAR o serviço.
@@ -826,18 +5571,20 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
             # Força a atualização da interface gráfica AGORA
             QtWidgets.QApplication.processEvents()
             
-            # 2. Tenta parar os serviços
-            parou_api = self.parar_servico(Config.SERVICE_NAME_API)
-            parou_redis = self.parar_servico(Config.SERVICE_NAME_REDIS)
+            # 2. Para API e Redis em paralelo e espera até saírem de "STOP_PENDING"
+            ok, tempos, erro = self._executar_transicao("stop", [Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS])
 
-            # 3. Espera um pouco para o Windows processar (o "pulo do gato")
-            # Serviços demoram para sair do status "STOP_PENDING" para "STOPPED"
-            time.sleep(3) 
-
-            if parou_api and parou_redis:
+            # 3. Informa o tempo real que cada serviço levou para parar
+            if ok:
                 QMessageBox.information(
-                    self, "Sucesso", "Serviços parados com sucesso."
+                    self, "Sucesso", f"Serviços parados com sucesso.\n\n{formatar_tempos(tempos)}"
+                )
+            elif tempos:
+                QMessageBox.warning(
+                    self, "Aviso", f"Nem todos os serviços pararam dentro do prazo.\n\n{formatar_tempos(tempos)}"
                 )
+            else:
+                QMessageBox.warning(self, "Erro", f"Falha ao parar os serviços:\n{erro}")
             
             # 4. Agora sim verifica o status real
             self.atualizar_status_servico()
@@ -856,24 +5603,58 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
                 self, "Aviso", "Não foi possível determinar o status do serviço."
             )
 
-    def verificar_status_servico(self, nome_servico=Config.SERVICE_NAME_API):
-        """Verifica o status do serviço da API (vmd-api-hub)."""
+    def _botoes_de_acao(self):
+        return (self.btnInstalar, self.btnServico, self.btnDesinstalar, self.btnAtualizarApi)
+
+    def _executar_transicao(self, acao, nomes, caminhos=None):
+        """Executa uma operação de serviço em um ServiceTransitionWorker sem travar a interface.
+
+        Aguarda o fim do worker em um loop de eventos local e retorna (ok, resultado, erro).
+        Enquanto isso os botões de ação ficam desabilitados, para que outra operação não
+        comece no meio desta; ao fim, voltam ao estado do último status conhecido.
+        """
+        resultado = {}
+        loop = QtCore.QEventLoop(self)
+        worker = ServiceTransitionWorker(self.service_backend, acao, nomes, self, caminhos)
+
+        def concluir(ok, tempos, erro):
+            resultado.update(ok=ok, tempos=tempos, erro=erro)
+            loop.quit()
+
+        with self._acoes_bloqueadas():
+            worker.finished_signal.connect(concluir)
+            worker.start()
+            loop.exec_()
+            worker.wait()
+        return resultado["ok"], resultado["tempos"], resultado["erro"]
+
+    @contextlib.contextmanager
+    def _acoes_bloqueadas(self):
+        """Mantém os botões de ação desabilitados durante uma operação (aceita aninhamento)."""
+        self._transicoes_em_andamento += 1
+        for botao in self._botoes_de_acao():
+            botao.setEnabled(False)
         try:
-            result = subprocess.run(
-                ["sc", "query", nome_servico], capture_output=True, text=True
-            )
-            if "RUNNING" in result.stdout:
-                return "Iniciado"
-            elif "STOPPED" in result.stdout:
-                return "Parado"
-            else:
-                return "Não instalado"
-        except Exception:
-            return "Erro"
+            yield
+        finally:
+            self._transicoes_em_andamento -= 1
+            status = self._status_servicos.get(Config.SERVICE_NAME_API)
+            if not self._transicoes_em_andamento and status is not None:
+                self._aplicar_status(status)
+
+    def verificar_status_servico(self, nome_servico=Config.SERVICE_NAME_API):
+        """Retorna o último status conhecido do serviço (consulta o SCM em segundo plano se o monitor ainda não respondeu)."""
+        status = self._status_servicos.get(nome_servico)
+        if status is None:
+            ok, estados, _ = self._executar_transicao("query", [nome_servico])
+            status = estados.get(nome_servico, "Erro") if ok else "Erro"
+        return status
 
     def atualizar_status_servico(self):
-        status = self.verificar_status_servico()
+        """Pede ao monitor uma nova consulta; a interface é atualizada pelo sinal status_changed."""
+        self.status_monitor.solicitar_atualizacao(forcar=True)
 
+    def _aplicar_status(self, status):
         if hasattr(self, "lblStatusServico"):
             self.lblStatusServico.setText(status)
             
@@ -946,8 +5727,9 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
             self.btnDesinstalar.setStyleSheet(estilo_vermelho)
             self.btnDesinstalar.setEnabled(True)
 
-            self.btnAtualizarApi.setStyleSheet(estilo_cinza)
-            self.btnAtualizarApi.setEnabled(False)
+            # A atualização baixa a nova versão com a API no ar e só para os serviços na troca
+            self.btnAtualizarApi.setStyleSheet(self.get_update_button_style())
+            self.btnAtualizarApi.setEnabled(True)
 
         elif status == "Parado":
             self.lblStatusServico.setStyleSheet("color: orange; font-weight: bold;")
@@ -964,8 +5746,9 @@ class GerenciadorServicos(QtWidgets.QMainWindow,Ui_GerenciadorServicos):
             self.btnDesinstalar.setStyleSheet(estilo_vermelho)
             self.btnDesinstalar.setEnabled(True)
 
-            self.btnAtualizarApi.setStyleSheet(estilo_cinza)
-            self.btnAtualizarApi.setEnabled(False)
+            # A atualização baixa a nova versão com a API no ar e só para os serviços na troca
+            self.btnAtualizarApi.setStyleSheet(self.get_update_button_style())
+            self.btnAtualizarApi.setEnabled(True)
 
         elif status == "Não instalado":
             self.lblStatusServico.setStyleSheet("color: gray; font-weight: bold;")
@@ -1040,66 +5823,57 @@ NAPP_ORDER_STATUS_FILTER=CONFIRMED #STATUS DO PEDIDO PARA CONSULTA NAPP
 IFOOD_ORDER_STATUS_FILTER=PLC #STATUS DO PEDIDO PARA CONSULTA IFOOD
 IFOOD_USE_NEW_API=true 
 """
-        os.makedirs(os.path.dirname(self.env_path), exist_ok=True)
-        with open(self.env_path, "w", encoding="utf-8") as f:
-            f.write(default_env)
+        EnvDocument(default_env).save(self.env_path)
 
     def read_env_preserve(self):
-        lines = []
-        kv = {}
-        if not os.path.exists(self.env_path):
-            return lines, kv
-        with open(self.env_path, "r", encoding="utf-8") as f:
-            for idx, raw in enumerate(f.readlines()):
-                line = raw.rstrip("\n")
-                lines.append(line)
-                stripped = line.strip()
-                if not stripped or stripped.startswith("#"):
-                    continue
-                if "=" in stripped:
-                    key, val = stripped.split("=", 1)
-                    val_part = val.strip()
-                    if "#" in val_part:
-                        val_no_comment = val_part.split("#", 1)[0].strip()
-                    else:
-                        val_no_comment = val_part
-                    kv[key.strip()] = (val_no_comment, idx)
-        return lines, kv
-
-    def write_env_preserve(self, lines, kv_updates):
-        for k, v in kv_updates.items():
-            found = False
-            for i, line in enumerate(lines):
-                stripped = line.strip()
-                if not stripped or stripped.startswith("#"):
-                    continue
-                if stripped.startswith(k + "=") or stripped.split("=")[0].strip() == k:
-                    comment = ""
-                    if "#" in line:
-                        idx_hash = line.find("#")
-                        comment = line[idx_hash:]
-                    lines[i] = f"{k}={v}{comment}"
-                    found = True
-                    break
-            if not found:
-                lines.append(f"{k}={v}")
+        return EnvDocument.load(self.env_path)
 
-        os.makedirs(os.path.dirname(self.env_path), exist_ok=True)
-        with open(self.env_path, "w", encoding="utf-8") as f:
-            for line in lines:
-                f.write(line + "\n")
+    def write_env_preserve(self, doc, kv_updates):
+        """Aplica as alterações e grava o .env; retorna False se nada mudou no arquivo.
+
+        Se o arquivo foi editado por outro programa depois de `doc` ser lido, as alterações são
+        aplicadas sobre a versão atual; chaves alteradas pelos dois lados exigem confirmação.
+        """
+        if doc.modificado_externamente(self.env_path):
+            atual = EnvDocument.load(self.env_path)
+            # O formulário devolve todos os campos: só os que o usuário alterou entram na mesclagem,
+            # senão o valor antigo de um campo intocado desfaria a edição feita pelo outro programa
+            kv_updates = {k: v for k, v in kv_updates.items() if doc.get(k) != str(v)}
+            conflitos = [
+                k for k, v in kv_updates.items()
+                if atual.get(k) != doc.get(k) and atual.get(k) != str(v)
+            ]
+            if conflitos:
+                resposta = QMessageBox.question(
+                    self, "Arquivo alterado",
+                    "O arquivo .env foi alterado por outro programa desde que foi aberto.\n\n"
+                    "As seguintes chaves foram alteradas nos dois lugares:\n"
+                    + "\n".join(f"- {k}" for k in conflitos)
+                    + "\n\nDeseja sobrescrevê-las com os valores do formulário?",
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No,
+                )
+                if resposta != QMessageBox.Yes:
+                    kv_updates = {k: v for k, v in kv_updates.items() if k not in conflitos}
+            print("O .env foi alterado externamente; alterações aplicadas sobre a versão atual.")
+            doc = atual
+
+        doc.update(kv_updates)
+        return doc.save(self.env_path)
 
     def on_editar_env(self):
         try:
             dialog = EnvEditorDialog(self.env_path, self)
             if dialog.exec_() == QDialog.Accepted:
                 updates = dialog.get_updates()
-                lines, kv = self.read_env_preserve()
-                self.write_env_preserve(lines, updates)
-                
-                QtWidgets.QMessageBox.information(
-                    self, "Sucesso!", "Configurações atualizadas com sucesso!"
-                )
+                doc = dialog.documento or self.read_env_preserve()
+                if self.write_env_preserve(doc, updates):
+                    QtWidgets.QMessageBox.information(
+                        self, "Sucesso!", "Configurações atualizadas com sucesso!"
+                    )
+                else:
+                    QtWidgets.QMessageBox.information(
+                        self, "Sem alterações", "Nenhuma configuração foi alterada."
+                    )
         except Exception as e:
             QtWidgets.QMessageBox.warning(
                 self, "Erro", f"Falha ao abrir configurações:\n{e}"
@@ -1111,15 +5885,17 @@ IFOOD_USE_NEW_API=true
             self.set_status_servico("Iniciando serviços...")
             
             print("Iniciando serviços...")
-            subprocess.run(["net", "start", Config.SERVICE_NAME_API],
-                        check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["net", "start", Config.SERVICE_NAME_REDIS],
-                        check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            
+            ok, tempos, erro = self._executar_transicao("start", [Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS])
+            if not ok:
+                raise ServiceBackendError(erro or formatar_tempos(tempos))
+
+            # Guarda o tempo real de partida para exibir na mensagem de sucesso
+            self.ultimos_tempos_partida = tempos
+            print(f"Serviços iniciados: {formatar_tempos(tempos)}")
             self.set_status_servico("Iniciado")
             return True
 
-        except subprocess.CalledProcessError as e:
+        except ServiceBackendError as e:
             self.set_status_servico("Erro")
             QMessageBox.critical(
                 self, "Erro de Comando",
@@ -1132,6 +5908,7 @@ IFOOD_USE_NEW_API=true
             QMessageBox.critical(self, "Erro", f"Erro inesperado durante a inicialização: {e}")
             return False
 
+    @_bloqueando_acoes
     def instalar_servicos_py(self):
         
         current_status = self.verificar_status_servico()
@@ -1147,7 +5924,7 @@ IFOOD_USE_NEW_API=true
             QMessageBox.information(self, "Aviso", "Os serviços estão instalados. Tentando **iniciar** os serviços...")
             
             if self.iniciar_servicos_py():
-                QMessageBox.information(self, "Sucesso!", "Serviços iniciados com sucesso!")
+                QMessageBox.information(self, "Sucesso!", f"Serviços iniciados com sucesso!\n\n{formatar_tempos(self.ultimos_tempos_partida)}")
             else:
                  QMessageBox.warning(self, "Aviso!", "Falha ao iniciar os serviços. Verifique o log ou o status.")
             
@@ -1160,7 +5937,7 @@ IFOOD_USE_NEW_API=true
         nssm_path, vmd_api_hub_path, redis_path = self.get_service_paths()
 
         # 2. Verificar existência dos executáveis
-        if not os.path.exists(nssm_path):
+        if isinstance(self.service_backend, ScmNssmBackend) and not os.path.exists(nssm_path):
             QMessageBox.critical(self, "[ERRO]", f"nssm.exe não encontrado em {nssm_path}")
             return
         if not os.path.exists(vmd_api_hub_path):
@@ -1171,33 +5948,26 @@ IFOOD_USE_NEW_API=true
             return
 
         try:
-            # 3. Instalando serviços com nssm
-            self.set_status_servico("Instalando API...")
-            subprocess.run([nssm_path, "install", Config.SERVICE_NAME_API, vmd_api_hub_path],
-                        check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            
-            self.set_status_servico("Instalando Redis...")
-            subprocess.run([nssm_path, "install", Config.SERVICE_NAME_REDIS, redis_path],
-                        check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-
-            # 4. Definindo para iniciar automaticamente
-            self.set_status_servico("Configurando auto-start...")
-            subprocess.run([nssm_path, "set", Config.SERVICE_NAME_API, "Start", "SERVICE_AUTO_START"],
-                        check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run([nssm_path, "set", Config.SERVICE_NAME_REDIS, "Start", "SERVICE_AUTO_START"],
-                        check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-
-            # 5. Iniciando serviços
+            # 3. Instalando serviços com início automático (um único lote no nssm)
+            self.set_status_servico("Instalando serviços...")
+            ok, _, erro = self._executar_transicao(
+                "install", [Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS],
+                {Config.SERVICE_NAME_API: vmd_api_hub_path, Config.SERVICE_NAME_REDIS: redis_path},
+            )
+            if not ok:
+                raise ServiceBackendError(erro)
+
+            # 4. Iniciando serviços
             if self.iniciar_servicos_py():
                 self.set_status_servico("Iniciado")
-                QMessageBox.information(self, "Sucesso!", "Instalação finalizada com sucesso!")
+                QMessageBox.information(self, "Sucesso!", f"Instalação finalizada com sucesso!\n\n{formatar_tempos(self.ultimos_tempos_partida)}")
             else:
                 self.set_status_servico("Parado")
                 QMessageBox.warning(self, "Aviso!", "Instalação finalizada, mas falha ao iniciar os serviços. Tente iniciar manualmente.")
             
             self.atualizar_status_servico()
 
-        except subprocess.CalledProcessError as e:
+        except ServiceBackendError as e:
             self.set_status_servico("Erro")
             QMessageBox.critical(
                 self, "Erro de Comando",
@@ -1208,41 +5978,28 @@ IFOOD_USE_NEW_API=true
             self.set_status_servico("Erro")
             QMessageBox.critical(self, "Erro", f"Erro inesperado durante a instalação: {e}")
             
+    @_bloqueando_acoes
     def excluir_servicos_py(self):
         # 1. Obter caminhos
         nssm_path, _, _ = self.get_service_paths()
 
         # 2. Verificar existência do nssm
-        if not os.path.exists(nssm_path):
+        if isinstance(self.service_backend, ScmNssmBackend) and not os.path.exists(nssm_path):
             QMessageBox.critical(self, "[ERRO]", f"nssm.exe não encontrado em {nssm_path}")
             return
 
         try:
-            # 3. Parar serviços
-            self.set_status_servico("Parando serviços...")
-            subprocess.run(["net", "stop", Config.SERVICE_NAME_API], creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["net", "stop", Config.SERVICE_NAME_REDIS], creationflags=subprocess.CREATE_NO_WINDOW)
-            
-            # 4. Remover serviços com nssm
-            self.set_status_servico("Removendo API...")
-            subprocess.run(
-                [nssm_path, "remove", Config.SERVICE_NAME_API, "confirm"],
-                check=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            
-            self.set_status_servico("Removendo Redis...")
-            subprocess.run(
-                [nssm_path, "remove", Config.SERVICE_NAME_REDIS, "confirm"],
-                check=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
+            # 3. Parar e remover os serviços (um único lote)
+            self.set_status_servico("Removendo serviços...")
+            ok, _, erro = self._executar_transicao("remove", [Config.SERVICE_NAME_API, Config.SERVICE_NAME_REDIS])
+            if not ok:
+                raise ServiceBackendError(erro)
 
             self.set_status_servico("Removido")
             QMessageBox.information(self, "Sucesso!", "Serviços removidos com sucesso!")
             self.atualizar_status_servico()
             
-        except subprocess.CalledProcessError as e:
+        except ServiceBackendError as e:
             self.set_status_servico("Erro")
             QMessageBox.critical(
                 self,
@@ -1255,20 +6012,15 @@ IFOOD_USE_NEW_API=true
             QMessageBox.critical(self, "Erro", f"Erro inesperado durante a remoção: {e}")
 
     def parar_servico(self, nome_servico):
-        """Para um serviço específico."""
-        try:
-            # Não usamos check=True aqui para que o programa não quebre se o serviço
-            # já estiver parado, pois 'net stop' falha nesse caso.
-            subprocess.run(
-                ["net", "stop", nome_servico],
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            return True
-        except Exception as e:
+        """Para um serviço específico (ou uma lista de serviços em um único lote)."""
+        nomes = [nome_servico] if isinstance(nome_servico, str) else list(nome_servico)
+        # O backend ignora serviços que já estão parados ('net stop' falha nesse caso).
+        ok, tempos, erro = self._executar_transicao("stop", nomes)
+        if not ok:
             QtWidgets.QMessageBox.warning(
-                self, "Erro", f"Falha ao parar o serviço {nome_servico}:\n{e}"
+                self, "Erro", f"Falha ao parar o serviço {nome_servico}:\n{erro or formatar_tempos(tempos)}"
             )
-            return False
+        return ok
 
     def set_status_servico(self, status):
         """Define o texto do QLabel de status e força a atualização da UI."""
@@ -1276,12 +6028,27 @@ IFOOD_USE_NEW_API=true
             self.lblStatusServico.setText(status)
             QtWidgets.QApplication.processEvents() 
 
+    def _liberar_log_para_rotacao(self, caminho):
+        """Os visualizadores abertos soltam o log antes do truncate e a retenção é liberada para seguir."""
+        for viewer in self.findChildren(LogViewerDialog):
+            viewer.liberar_arquivo(caminho)
+        self.log_retention.leitores_liberados()
+
+    def _reabrir_log_apos_rotacao(self, caminho, erro):
+        for viewer in self.findChildren(LogViewerDialog):
+            viewer.reabrir_arquivo(caminho, erro)
+
+    def _abrir_visualizador_log(self, caminho_log, titulo):
+        """Abre o log no visualizador embutido (janela não modal, acompanha novas linhas)."""
+        viewer = LogViewerDialog(caminho_log, titulo, self)
+        viewer.show()
+
     def abrir_log(self):
-        """Abre o arquivo de log da API no programa padrão do sistema."""
+        """Abre o arquivo de log da API no visualizador embutido."""
         caminho_log = Config.LOG_PATH_API
         try:
             if os.path.exists(caminho_log):
-                os.startfile(caminho_log)
+                self._abrir_visualizador_log(caminho_log, "Log da API")
             else:
                 QtWidgets.QMessageBox.warning(
                     self, "Erro", f"Arquivo de log não encontrado em:\n{caminho_log}"
@@ -1329,7 +6096,7 @@ IFOOD_USE_NEW_API=true
 
         try:
             if os.path.exists(caminho_log):
-                os.startfile(caminho_log)
+                self._abrir_visualizador_log(caminho_log, "Log Geral do Painel de Pedidos")
             else:
                 QtWidgets.QMessageBox.warning(
                     self, "Erro", f"O LOG do Painel de Pedidos não foi encontrado! Verifique se a instalação foi concluída corretamente e tente novamente!",